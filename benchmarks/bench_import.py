@@ -0,0 +1,56 @@
+"""
+Import-time benchmark for s3_filestore.
+
+Imports the package in fresh interpreters and reports the wall time of `import s3_filestore`.
+Fails (exit code 1) if the import pulls in a heavy library (torch, pandas, numpy) or takes
+longer than --max-seconds, so the lightweight import path does not regress.
+
+    python benchmarks/bench_import.py --repeat 5 --max-seconds 1.0
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+HEAVY_MODULES = ('torch', 'pandas', 'numpy')
+
+SNIPPET = """
+import json, sys, time
+t0 = time.perf_counter()
+import s3_filestore
+elapsed = time.perf_counter() - t0
+print(json.dumps(dict(seconds=elapsed, heavy=[m for m in %r if m in sys.modules])))
+""" % (HEAVY_MODULES,)
+
+def measure_import(repeat=5):
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([repo_root, os.environ.get('PYTHONPATH', '')]))
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', SNIPPET], env=env)
+        runs.append(json.loads(output.decode().strip().splitlines()[-1]))
+    seconds = sorted(run['seconds'] for run in runs)
+    heavy = sorted(set(m for run in runs for m in run['heavy']))
+    return dict(import_seconds_min=seconds[0], import_seconds_median=seconds[len(seconds) // 2], heavy_modules=heavy)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=None)
+    args = parser.parse_args()
+
+    result = measure_import(repeat=args.repeat)
+    print(json.dumps(result, indent=2))
+
+    failed = False
+    if result['heavy_modules']:
+        print(f"FAIL: `import s3_filestore` imported {', '.join(result['heavy_modules'])}", file=sys.stderr)
+        failed = True
+    if args.max_seconds is not None and result['import_seconds_median'] > args.max_seconds:
+        print(f"FAIL: median import time {result['import_seconds_median']:.3f}s > {args.max_seconds}s", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
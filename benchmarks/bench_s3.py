@@ -0,0 +1,305 @@
+"""
+End-to-end throughput benchmarks of S3FileStore against a local S3 stand-in (moto server).
+
+Starts a ThreadedMotoServer, points a store at it (credentials and endpoint come from the S3_*
+environment variables, profile=None) and times the store's operations:
+
+- import: `import s3_filestore` in fresh interpreters (see bench_import.py);
+- constructor: S3FileStore() with cold (cleared) and warm client registries;
+- small_files: upload_files of many small files, re-upload of the same files (all skipped),
+  download_objects into an empty cache and again from the cache;
+- large_object: upload_file / download_object of one object above the multipart and ranged thresholds;
+- list_objects: full listings, depth-limited listings and parallel listings at several key counts;
+- list_urls: url generation with ACL lookups (cold ACL cache) and with assume_default_acl;
+- upload_data: dicts (.json), DataFrames (.csv, .parquet) and state dicts (.pth with torch,
+  .safetensors with numpy), skipped when the library is not installed.
+
+Every case is run --repeat times on fresh keys; the results (min / median seconds, throughput and the
+S3 requests made by the last run, from metrics.py) are written as JSON together with the git commit,
+so runs can be compared across commits with compare.py:
+
+    python benchmarks/bench_s3.py --quick
+    python benchmarks/bench_s3.py --only small_files large_object --output before.json
+    python benchmarks/compare.py before.json after.json
+
+moto keeps objects in memory and runs in-process, so absolute numbers measure the client side
+(request count, concurrency, hashing, serialization), not network throughput.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+BUCKET_NAME = 'benchmark'
+MB = 1024 * 1024
+
+# (full, --quick) sizes
+SIZES = dict(
+    small_files=(1000, 100),
+    small_file_bytes=(16 * 1024, 4 * 1024),
+    large_object_bytes=(256 * MB, 80 * MB),
+    list_key_counts=((1000, 10000, 50000), (1000, 5000)),
+    url_count=(2000, 200),
+    dataframe_rows=(1000000, 50000),
+    state_dict_params=(25000000, 1000000),
+)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(workdir):
+    """Start a moto server and configure the environment so S3FileStore(profile=None) talks to it."""
+    from moto.server import ThreadedMotoServer
+    port = free_port()
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+    server.start()
+    endpoint_url = f"http://127.0.0.1:{port}"
+    os.environ.update(AWS_ACCESS_KEY_ID='benchmark', AWS_SECRET_ACCESS_KEY='benchmark', AWS_DEFAULT_REGION='us-east-1',
+                      S3_ACCESS_KEY_ID='benchmark', S3_SECRET_ACCESS_KEY='benchmark', S3_REGION='us-east-1',
+                      S3_ENDPOINT_URL=endpoint_url,
+                      # keep the benchmark's hashes out of the user's hash index
+                      S3_FILESTORE_HASH_INDEX=os.path.join(workdir, 'hash_index.sqlite'))
+    return server, endpoint_url
+
+def summarize(seconds, **extra):
+    result = dict(seconds_min=min(seconds), seconds_median=statistics.median(seconds), runs=seconds)
+    result.update(extra)
+    return result
+
+def request_counts():
+    from s3_filestore import metrics
+    return {name: t['count'] for name, t in sorted(metrics.snapshot()['api_calls'].items())}
+
+def measure(fn, repeat, setup=None):
+    """Run fn(run_index) repeat times (after setup(run_index), untimed); the S3 requests of the last run are recorded."""
+    from s3_filestore import metrics
+    seconds = []
+    for i in range(repeat):
+        if setup is not None: setup(i)
+        metrics.reset()
+        start = time.perf_counter()
+        fn(i)
+        seconds.append(time.perf_counter() - start)
+    return summarize(seconds, requests=request_counts())
+
+def throughput(result, items=None, nbytes=None):
+    median = result['seconds_median']
+    if items is not None: result['items_per_second'] = items / median if median else None
+    if nbytes is not None: result['mb_per_second'] = nbytes / MB / median if median else None
+    return result
+
+def new_store(endpoint_url, workdir, **kwargs):
+    from s3_filestore import S3FileStore
+    kwargs.setdefault('acl', 'private')
+    kwargs.setdefault('cache_dir', tempfile.mkdtemp(dir=workdir))
+    return S3FileStore(BUCKET_NAME, profile=None, endpoint_url=endpoint_url, **kwargs)
+
+def write_files(directory, count, size):
+    os.makedirs(directory, exist_ok=True)
+    filenames = []
+    for i in range(count):
+        filename = os.path.join(directory, f'file{i:06d}.bin')
+        with open(filename, 'wb') as f:
+            f.write(os.urandom(size))
+        filenames.append(filename)
+    return filenames
+
+def put_keys(s3_client, keys, max_workers=32):
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda key: s3_client.put_object(Bucket=BUCKET_NAME, Key=key, Body=b''), keys))
+
+def bench_import(args, endpoint_url, workdir):
+    from bench_import import measure_import
+    return dict(import_s3_filestore=measure_import(repeat=max(args.repeat, 3)))
+
+def bench_constructor(args, endpoint_url, workdir):
+    from s3_filestore import clients
+    cache_dir = tempfile.mkdtemp(dir=workdir)
+    cold = measure(lambda i: new_store(endpoint_url, workdir, cache_dir=cache_dir), args.repeat, setup=lambda i: clients.clear())
+    warm = measure(lambda i: new_store(endpoint_url, workdir, cache_dir=cache_dir), args.repeat)
+    return dict(cold=cold, warm=warm)
+
+def bench_small_files(args, endpoint_url, workdir):
+    count, size = args.sizes['small_files'], args.sizes['small_file_bytes']
+    store = new_store(endpoint_url, workdir)
+    filenames = write_files(os.path.join(workdir, 'small_files'), count, size)
+    results = {}
+
+    results['upload'] = throughput(measure(lambda i: store.upload_files(filenames, f'small_files/run{i}', verbose=False),
+                                           args.repeat), items=count, nbytes=count * size)
+    results['reupload_skipped'] = throughput(measure(lambda i: store.upload_files(filenames, f'small_files/run{i}', verbose=False),
+                                                     args.repeat), items=count)
+
+    keys = store.list_objects('small_files/run0', directory_filter=False)
+    cache_dirs = {}
+    def empty_cache(i):
+        cache_dirs[i] = tempfile.mkdtemp(dir=workdir)
+    results['download'] = throughput(measure(lambda i: store.download_objects(keys, cache_dir=cache_dirs[i], progress=False),
+                                             args.repeat, setup=empty_cache), items=count, nbytes=count * size)
+    results['download_cached'] = throughput(measure(lambda i: store.download_objects(keys, cache_dir=cache_dirs[0], progress=False),
+                                                    args.repeat), items=count)
+    return results
+
+def bench_large_object(args, endpoint_url, workdir):
+    size = args.sizes['large_object_bytes']
+    store = new_store(endpoint_url, workdir)
+    filename = os.path.join(workdir, 'large.bin')
+    with open(filename, 'wb') as f:
+        for _ in range(size // MB):
+            f.write(os.urandom(MB))
+    results = {}
+    results['upload'] = throughput(measure(lambda i: store.upload_file(filename, f'large_object/run{i}', verbose=False),
+                                           args.repeat), nbytes=size)
+
+    keys = store.list_objects('large_object', directory_filter=False)
+    results['download'] = throughput(measure(lambda i: store.download_object(keys[0], cache_dir=tempfile.mkdtemp(dir=workdir),
+                                                                               progress=False), args.repeat), nbytes=size)
+    return results
+
+def bench_list_objects(args, endpoint_url, workdir):
+    store = new_store(endpoint_url, workdir)
+    results = {}
+    for count in args.sizes['list_key_counts']:
+        # count keys spread over 10 x 10 subfolders
+        prefix = f'list_objects/n{count}'
+        keys = [f'{prefix}/a{i % 10}/b{(i // 10) % 10}/key{i:07d}.json' for i in range(count)]
+        put_keys(store.s3_client, keys)
+        results[f'n{count}_full'] = throughput(measure(lambda i: store.list_objects(prefix, directory_filter=False), args.repeat), items=count)
+        results[f'n{count}_depth0'] = measure(lambda i: store.list_objects(prefix, depth=0, directory_filter=None), args.repeat)
+        results[f'n{count}_depth1'] = measure(lambda i: store.list_objects(prefix, depth=1, directory_filter=None), args.repeat)
+        results[f'n{count}_parallel'] = throughput(measure(lambda i: store.list_objects(prefix, directory_filter=False, parallel=True),
+                                                           args.repeat), items=count)
+    return results
+
+def bench_list_urls(args, endpoint_url, workdir):
+    from s3_filestore import auth
+    count = args.sizes['url_count']
+    store = new_store(endpoint_url, workdir, acl='public-read')
+    prefix = 'list_urls'
+    keys = [f'{prefix}/key{i:06d}.json' for i in range(count)]
+    put_keys(store.s3_client, keys)
+    results = {}
+    results['acl_lookups'] = throughput(measure(lambda i: store.list_urls(prefix), args.repeat,
+                                                setup=lambda i: auth._object_public.clear()), items=count)
+    results['acl_cached'] = throughput(measure(lambda i: store.list_urls(prefix), args.repeat), items=count)
+    results['assume_default_acl'] = throughput(measure(lambda i: store.list_urls(prefix, assume_default_acl=True), args.repeat,
+                                                       setup=lambda i: auth._object_public.clear()), items=count)
+    return results
+
+def bench_upload_data(args, endpoint_url, workdir):
+    store = new_store(endpoint_url, workdir)
+    results = {}
+    payloads = dict(dict_json=(lambda: {f'key{i}': list(range(10)) for i in range(10000)}, '.json'))
+    try:
+        import numpy as np
+        import pandas as pd
+        rows = args.sizes['dataframe_rows']
+        dataframe = lambda: pd.DataFrame({'x': np.random.rand(rows), 'y': np.random.randint(0, 100, rows), 'label': 'abc'})
+        payloads['dataframe_csv'] = (dataframe, '.csv')
+        payloads['dataframe_parquet'] = (dataframe, '.parquet')
+    except ImportError as e:
+        results['dataframe'] = dict(skipped=str(e))
+    params = args.sizes['state_dict_params']
+    try:
+        import torch
+        payloads['state_dict_pth'] = (lambda: {f'layer{i}.weight': torch.randn(params // 10) for i in range(10)}, '.pth')
+    except ImportError as e:
+        results['state_dict_pth'] = dict(skipped=str(e))
+    try:
+        import numpy as np
+        import safetensors.numpy
+        payloads['state_dict_safetensors'] = (lambda: {f'layer{i}.weight': np.random.rand(params // 10).astype('float32')
+                                                       for i in range(10)}, '.safetensors')
+    except ImportError as e:
+        results['state_dict_safetensors'] = dict(skipped=str(e))
+
+    for name, (make, extension) in payloads.items():
+        try:
+            data = make()
+            results[name] = measure(lambda i: store.upload_data(data, f'upload_data/{name}/run{i}{extension}', data_format=extension,
+                                                                verbose=False),
+                                    args.repeat)
+        except ImportError as e:
+            # e.g., pyarrow for parquet
+            results[name] = dict(skipped=str(e))
+    return results
+
+BENCHMARKS = dict(
+    import_time=bench_import,
+    constructor=bench_constructor,
+    small_files=bench_small_files,
+    large_object=bench_large_object,
+    list_objects=bench_list_objects,
+    list_urls=bench_list_urls,
+    upload_data=bench_upload_data,
+)
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD'], cwd=REPO_ROOT, stderr=subprocess.DEVNULL) != 0
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    versions = {}
+    for module_name in ('boto3', 'botocore', 'moto', 'requests', 'pandas', 'numpy', 'torch'):
+        try:
+            versions[module_name] = __import__(module_name).__version__
+        except ImportError:
+            versions[module_name] = None
+    return dict(python=platform.python_version(), platform=platform.platform(), cpu_count=os.cpu_count(), versions=versions)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="Run only these benchmarks.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per case.")
+    parser.add_argument('--quick', action='store_true', help="Smaller sizes, for a smoke test.")
+    parser.add_argument('--output', default=None, help="Results file (defaults to benchmarks/results/<time>-<commit>.json).")
+    args = parser.parse_args()
+    args.sizes = {name: sizes[1 if args.quick else 0] for name, sizes in SIZES.items()}
+    sys.path.insert(0, REPO_ROOT)
+
+    workdir = tempfile.mkdtemp(prefix='s3_filestore_bench_')
+    server, endpoint_url = start_server(workdir)
+    try:
+        import boto3
+        boto3.client('s3', endpoint_url=endpoint_url).create_bucket(Bucket=BUCKET_NAME)
+        commit = git_commit()
+        results = dict(commit=commit, started=time.strftime('%Y-%m-%dT%H:%M:%S'), quick=args.quick, repeat=args.repeat,
+                       sizes=args.sizes, environment=environment(), benchmarks={})
+        for name in (args.only or list(BENCHMARKS)):
+            print(f"running {name}...", file=sys.stderr)
+            start = time.perf_counter()
+            results['benchmarks'][name] = BENCHMARKS[name](args, endpoint_url, workdir)
+            print(f"  done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{(commit or 'unknown')[:12]}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results['benchmarks'], indent=2))
+    print(f"results written to {output}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
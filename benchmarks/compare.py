@@ -0,0 +1,69 @@
+"""
+Compare two result files of bench_s3.py (e.g., before and after a change).
+
+Prints the median seconds of every case present in both files, the relative change and the
+change in S3 requests made. Exits with code 1 if a case got slower than --fail-above (a ratio,
+e.g. 1.2 for 20% slower), so it can guard a CI job.
+
+    python benchmarks/compare.py results/before.json results/after.json --fail-above 1.2
+"""
+import sys
+import json
+import argparse
+
+def load_cases(filename):
+    """{'benchmark/case': result} for every timed case of a results file."""
+    with open(filename) as f:
+        results = json.load(f)
+    cases = {}
+    for benchmark, benchmark_results in results['benchmarks'].items():
+        for case, result in benchmark_results.items():
+            if isinstance(result, dict) and ('seconds_median' in result or 'import_seconds_median' in result):
+                cases[f'{benchmark}/{case}'] = result
+    return results, cases
+
+def median_seconds(result):
+    return result['seconds_median'] if 'seconds_median' in result else result['import_seconds_median']
+
+def total_requests(result):
+    return sum(result.get('requests', {}).values()) if 'requests' in result else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--fail-above', type=float, default=None, help="Fail if a case's time ratio exceeds this.")
+    parser.add_argument('--min-seconds', type=float, default=0.005,
+                        help="Cases faster than this in both runs are reported but never fail (too noisy).")
+    args = parser.parse_args()
+
+    baseline, baseline_cases = load_cases(args.baseline)
+    candidate, candidate_cases = load_cases(args.candidate)
+    print(f"baseline:  {baseline.get('commit')} ({args.baseline})")
+    print(f"candidate: {candidate.get('commit')} ({args.candidate})")
+    if baseline.get('sizes') != candidate.get('sizes'):
+        print("warning: the runs used different sizes, times are not comparable")
+
+    width = max([len(name) for name in baseline_cases] + [4])
+    print(f"\n{'case':<{width}}  {'baseline':>10}  {'candidate':>10}  {'ratio':>7}  requests")
+    regressions = []
+    for name in sorted(set(baseline_cases) & set(candidate_cases)):
+        before, after = median_seconds(baseline_cases[name]), median_seconds(candidate_cases[name])
+        ratio = after / before if before else float('inf')
+        requests_before, requests_after = total_requests(baseline_cases[name]), total_requests(candidate_cases[name])
+        requests = f"{requests_before} -> {requests_after}" if requests_before is not None and requests_after is not None else ""
+        flag = ""
+        if args.fail_above is not None and ratio > args.fail_above and max(before, after) >= args.min_seconds:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<{width}}  {before:>9.4f}s  {after:>9.4f}s  {ratio:>6.2f}x  {requests}{flag}")
+
+    for name in sorted(set(baseline_cases) ^ set(candidate_cases)):
+        print(f"{name:<{width}}  only in {'baseline' if name in baseline_cases else 'candidate'}")
+
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than {args.fail_above}x: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,2 @@
-from .filestore import S3FileStore
\ No newline at end of file
+from .filestore import S3FileStore
+from .serializers import register_format
\ No newline at end of file
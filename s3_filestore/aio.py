@@ -0,0 +1,497 @@
+"""
+Asyncio-native counterpart of S3FileStore, built on aiobotocore (pip install aiobotocore).
+
+A store owns one aiobotocore client, whose aiohttp connection pool (max_pool_connections) is shared
+by all coroutines, and every S3 request holds a slot of a semaphore of max_concurrency, so a single
+event loop can keep hundreds of transfers in flight without a thread per transfer. Blocking work
+(hashing local files, (de)serializing data) runs in the loop's default executor.
+
+    async with AsyncS3FileStore('visionlab-results') as store:
+        filenames = await store.download_objects(keys)
+        df = await store.load_object('alvarez/Projects/testing1234/output-file-1b2c3d4e5f.csv')
+
+Downloads share the on-disk cache (and its index) with S3FileStore.
+"""
+import os
+import sys
+import asyncio
+import hashlib
+import tempfile
+import datetime
+import email.utils
+import botocore.exceptions
+
+from pathlib import Path
+from urllib.parse import urljoin
+
+try:
+    from aiobotocore.session import get_session as get_aio_session
+    from aiobotocore.config import AioConfig
+except ImportError:
+    get_aio_session, AioConfig = None, None
+
+from . import functional as F
+from . import auth
+from . import clients
+from . import retry
+from . import metrics
+from . import transfer
+from . import compression as C
+from .cache import get_cache, CACHE_MAX_AGE
+from .data import prepare_data_for_upload, hash_buffer, SPILL_THRESHOLD
+from .utils import get_file_hash, get_object_name_with_hash_id, strip_hash_id
+
+DEFAULT_MAX_CONCURRENCY = 64
+_MISSING = object()
+
+class AsyncS3FileStore(object):
+    def __init__(self, bucket_name, profile='wasabi', endpoint_url=None, acl='public-read', hash_length=10, cache_dir=None,
+                 expires_in_seconds=3600, max_concurrency=DEFAULT_MAX_CONCURRENCY, max_pool_connections=None,
+                 multipart_threshold=transfer.MULTIPART_THRESHOLD, multipart_chunksize=transfer.MULTIPART_CHUNKSIZE,
+                 cache_max_bytes=None, cache_max_age=CACHE_MAX_AGE, compression=None):
+        """
+        Parameters (as for S3FileStore, plus):
+        - max_concurrency: The maximum number of S3 requests in flight.
+        - max_pool_connections: The size of the client's connection pool (defaults to max_concurrency).
+
+        Use as `async with AsyncS3FileStore(...) as store:`, or call `await store.open()` / `await store.close()`.
+        """
+        if get_aio_session is None:
+            raise ImportError("AsyncS3FileStore requires aiobotocore (pip install aiobotocore)")
+        if cache_dir is None: cache_dir = F.CACHE_DIR
+        if max_pool_connections is None: max_pool_connections = max_concurrency
+
+        self.cache_dir = cache_dir
+        self.cache = get_cache(cache_dir, max_bytes=cache_max_bytes)
+        self.cache_max_age = cache_max_age
+        self.profile = profile
+        if endpoint_url is None:
+            self.endpoint_url = auth.WASABI_ENDPOINT if 'wasabi' in profile else auth.AWS_ENDPOINT
+        else:
+            self.endpoint_url = endpoint_url
+        self.acl = acl
+        self.expires_in_seconds = expires_in_seconds
+        self.hash_length = hash_length
+        self.max_concurrency = max_concurrency
+        self.max_pool_connections = max_pool_connections
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.compression = C.check_codec(compression)
+        self.bucket_name = bucket_name
+        self.bucket_region = None
+        self.s3_client = None
+        self._client_context = None
+        self._semaphore = None
+        self._downloads = {}
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        """Create the client (resolving the bucket region once per process, like S3FileStore)."""
+        if self.s3_client is not None: return
+        userdata = clients.get_userdata(self.profile)
+        credentials = dict(aws_access_key_id=userdata.get('S3_ACCESS_KEY_ID'),
+                           aws_secret_access_key=userdata.get('S3_SECRET_ACCESS_KEY'))
+        session = get_aio_session()
+
+        region_name = clients.bucket_regions.get((self.endpoint_url, self.bucket_name), _MISSING)
+        if region_name is _MISSING:
+            async with session.create_client('s3', endpoint_url=self.endpoint_url, **credentials) as s3_client:
+                region_name = (await s3_client.get_bucket_location(Bucket=self.bucket_name))['LocationConstraint']
+            clients.bucket_regions.set((self.endpoint_url, self.bucket_name), region_name)
+        endpoint_url = self.endpoint_url.replace("s3.", f"s3.{region_name}.") if region_name is not None else self.endpoint_url
+
+        config = AioConfig(max_pool_connections=self.max_pool_connections)
+        self._client_context = session.create_client('s3', endpoint_url=endpoint_url, region_name=region_name,
+                                                     config=config, **credentials)
+        self.s3_client = metrics.instrument_client(retry.observe_client(await self._client_context.__aenter__()))
+        self.bucket_region = region_name
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+        if self._client_context is not None:
+            await self._client_context.__aexit__(None, None, None)
+        self.s3_client, self._client_context = None, None
+
+    async def _call(self, operation, **kwargs):
+        # each attempt holds a concurrency slot; throttled / transient errors are retried by the retry policy
+        async def attempt():
+            async with self._semaphore:
+                return await getattr(self.s3_client, operation)(**kwargs)
+        return await retry.default_policy.call_async(attempt)
+
+    async def _run_blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    # ===== listing and metadata =====
+
+    async def iter_objects(self, prefix='', depth=None, directory_filter=None):
+        """
+        Async generator over the keys under prefix, with list_objects' depth / directory_filter semantics.
+
+        As functional.iter_objects: with a depth, levels are listed with Delimiter='/' and only the keys at
+        that depth (and the folders above it) are fetched.
+        """
+        prefix = F.normalize_prefix(prefix)
+
+        async def pages(level_prefix, delimiter=None):
+            kwargs = dict(Bucket=self.bucket_name, Prefix=level_prefix, PaginationConfig={'PageSize': F.LIST_PAGE_SIZE})
+            if delimiter is not None: kwargs['Delimiter'] = delimiter
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            async for page in paginator.paginate(**kwargs):
+                yield page
+
+        if depth is None:
+            # filter_keys only buffers directories, so stream the keys through it page by page
+            directories = set()
+            async for page in pages(prefix):
+                keys = [obj['Key'] for obj in page.get('Contents', [])]
+                if directory_filter:
+                    directories.update(F.filter_keys(keys, prefix=prefix, depth=depth, directory_filter=True))
+                    continue
+                for key in F.filter_keys(keys, prefix=prefix, depth=depth, directory_filter=directory_filter):
+                    yield key
+            for directory in sorted(directories):
+                yield directory
+            return
+
+        async def walk(level_prefix, level):
+            async for page in pages(level_prefix, delimiter='/'):
+                if level < depth:
+                    for common_prefix in page.get('CommonPrefixes', []):
+                        async for key in walk(common_prefix['Prefix'], level + 1):
+                            yield key
+                elif directory_filter:
+                    # directories at this depth are exactly the CommonPrefixes of this level
+                    for common_prefix in page.get('CommonPrefixes', []):
+                        yield common_prefix['Prefix']
+                else:
+                    keys = [obj['Key'] for obj in page.get('Contents', [])]
+                    for key in F.filter_keys(keys, prefix=prefix, depth=depth, directory_filter=directory_filter):
+                        yield key
+
+        async for key in walk(prefix, 0):
+            yield key
+
+    async def list_objects(self, prefix='', depth=None, directory_filter=None, verbose=False):
+        objects = []
+        async for key in self.iter_objects(prefix=prefix, depth=depth, directory_filter=directory_filter):
+            if verbose: print(key)
+            objects.append(key)
+        return objects
+
+    async def file_exists(self, key):
+        try:
+            await self._call('head_object', Bucket=self.bucket_name, Key=key)
+            return True
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return False
+            raise
+
+    async def get_metadata(self, file, key=None):
+        """The object's user metadata (or the value of one metadata key)."""
+        response = await self._call('head_object', Bucket=self.bucket_name, Key=file)
+        if key is not None:
+            return response['Metadata'].get(key.lower(), None)
+        return response['Metadata']
+
+    async def generate_url(self, bucket_key, acl=None):
+        """A public url for public objects, a presigned url otherwise (the ACL is looked up unless acl is given or cached)."""
+        if acl is not None: auth.remember_object_acl(self.s3_client, self.bucket_name, bucket_key, acl)
+        is_public = auth.cached_object_public(self.s3_client, self.bucket_name, bucket_key)
+        if is_public is None:
+            response = await self._call('get_object_acl', Bucket=self.bucket_name, Key=bucket_key)
+            is_public = auth.grants_public_read(response['Grants'])
+            auth.remember_object_public(self.s3_client, self.bucket_name, bucket_key, is_public)
+        if is_public:
+            return await self._run_blocking(auth.get_url, self.bucket_name, bucket_key, self.bucket_region, self.profile)
+        return await self.s3_client.generate_presigned_url('get_object', Params={'Bucket': self.bucket_name, 'Key': bucket_key},
+                                                           ExpiresIn=self.expires_in_seconds)
+
+    # ===== downloads =====
+
+    async def download_object(self, bucket_key, cache_dir=None, progress=True, check_hash=True, progress_bar=None):
+        """Download an object into the cache (if needed) and return the local filename."""
+        cache = self.cache if cache_dir is None else get_cache(cache_dir)
+        cache_filename = cache.lookup(self.bucket_name, bucket_key)
+        entry = None
+        if cache_filename is not None:
+            # as in functional.download_if_needed: mutable keys are revalidated once max_age has passed
+            immutable = strip_hash_id(os.path.basename(bucket_key), hash_length=self.hash_length)[1] is not None
+            if immutable or cache.is_fresh(self.bucket_name, bucket_key, max_age=self.cache_max_age):
+                metrics.cache_hit('download_cache', True)
+                return cache_filename
+            entry = cache.get_entry(self.bucket_name, bucket_key)
+
+        # concurrent requests for the same object share one download
+        download_key = (cache.cache_dir, bucket_key)
+        task = self._downloads.get(download_key)
+        if task is None:
+            task = self._downloads[download_key] = asyncio.ensure_future(
+                self._download(cache, bucket_key, progress, check_hash, progress_bar, entry))
+            task.add_done_callback(lambda _: self._downloads.pop(download_key, None))
+        return await asyncio.shield(task)
+
+    async def _download(self, cache, bucket_key, progress, check_hash, progress_bar, entry=None):
+        cache_filename = cache.cache_path(self.bucket_name, bucket_key)
+        os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
+        hash_prefix = None
+        if check_hash:
+            r = F.HASH_REGEX.search(os.path.basename(cache_filename))
+            hash_prefix = r.group(1) if r else None
+        conditions = {}
+        if entry is not None and entry['etag']: conditions['IfNoneMatch'] = entry['etag']
+        elif entry is not None and entry['last_modified']: conditions['IfModifiedSince'] = entry['last_modified']
+
+        own_bar = progress_bar is None
+        if own_bar:
+            if progress and entry is None: sys.stderr.write(f'Downloading: "s3://{self.bucket_name}/{bucket_key}" to {cache_filename}\n')
+            progress_bar = transfer.ProgressBar(disable=not progress)
+        fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(cache_filename), prefix='.download-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                async with self._semaphore:
+                    try:
+                        response = await retry.default_policy.call_async(self.s3_client.get_object, Bucket=self.bucket_name,
+                                                                         Key=bucket_key, **conditions)
+                    except Exception as e:
+                        if entry is None:
+                            raise
+                        not_modified = (isinstance(e, botocore.exceptions.ClientError)
+                                        and e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 304)
+                        if not not_modified and not retry.is_retryable(e):
+                            raise
+                        if not not_modified:
+                            sys.stderr.write(f'Could not revalidate {cache_filename} ({e!r}), using the cached file\n')
+                        metrics.cache_hit('revalidation', not_modified)
+                        metrics.cache_hit('download_cache', True)
+                        if not_modified: cache.mark_validated(self.bucket_name, bucket_key)
+                        return cache_filename
+                    progress_bar.add_total(response['ContentLength'])
+                    sha256 = hashlib.sha256()
+                    # compressed objects are cached (and hashed) decompressed, see compression.py
+                    codec = C.response_codec(response.get('ContentEncoding'))
+                    decompressor = C.Decompressor(codec) if codec is not None else None
+                    async with response['Body'] as body:
+                        while True:
+                            chunk = await body.read(transfer.CHUNK_SIZE)
+                            if not chunk: break
+                            progress_bar.update(len(chunk))
+                            if decompressor is not None: chunk = decompressor.decompress(chunk)
+                            f.write(chunk)
+                            sha256.update(chunk)
+                    if decompressor is not None:
+                        chunk = decompressor.finish()
+                        f.write(chunk)
+                        sha256.update(chunk)
+            digest = sha256.hexdigest()
+            metadata_hash = response['Metadata'].get('sha256')
+            if hash_prefix is not None:
+                transfer._check_digest(digest, hash_prefix)
+            elif check_hash and metadata_hash:
+                transfer._check_digest(digest, metadata_hash)
+            os.replace(tmp_filename, cache_filename)
+        finally:
+            if own_bar: progress_bar.close()
+            if os.path.exists(tmp_filename): os.remove(tmp_filename)
+        if entry is not None: metrics.cache_hit('revalidation', False)
+        metrics.cache_hit('download_cache', False)
+        last_modified = response.get('LastModified')
+        if last_modified is not None:
+            last_modified = email.utils.format_datetime(last_modified.astimezone(datetime.timezone.utc), usegmt=True)
+        cache.add(self.bucket_name, bucket_key, etag=response.get('ETag'), sha256=metadata_hash, last_modified=last_modified)
+        return cache_filename
+
+    async def download_objects(self, objects, cache_dir=None, progress=True, check_hash=True, return_errors=False):
+        """
+        Download objects concurrently (bounded by max_concurrency) with one combined progress bar.
+
+        Failed downloads do not stop the batch: their filename is None and the errors are reported
+        at the end (or returned as (object_key, exception) pairs if return_errors=True).
+        """
+        objects = list(objects)
+        cache = self.cache if cache_dir is None else get_cache(cache_dir)
+        with cache.batch(), transfer.ProgressBar(desc=f"Downloading {len(objects)} files", disable=not progress) as progress_bar:
+            results = await asyncio.gather(*[self.download_object(key, cache_dir=cache_dir, progress=False, check_hash=check_hash,
+                                                                  progress_bar=progress_bar) for key in objects],
+                                           return_exceptions=True)
+        filenames = [None if isinstance(r, BaseException) else r for r in results]
+        errors = [(key, r) for key, r in zip(objects, results) if isinstance(r, BaseException)]
+        if return_errors:
+            return filenames, errors
+        transfer.report_errors(errors)
+        return filenames
+
+    async def load_object(self, bucket_key, cache_dir=None, progress=True, check_hash=True, **kwargs):
+        local_filename = await self.download_object(bucket_key, cache_dir=cache_dir, progress=progress, check_hash=check_hash)
+        return await self._run_blocking(lambda: F.load_file(local_filename, **kwargs))
+
+    # ===== uploads =====
+
+    async def _remote_size(self, object_key):
+        try:
+            response = await self._call('head_object', Bucket=self.bucket_name, Key=object_key)
+            return response['ContentLength']
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return None
+            raise
+
+    async def _upload_fileobj(self, fileobj, size, object_key, acl, metadata, content_encoding=None):
+        extra_args = dict(ContentEncoding=content_encoding) if content_encoding is not None else {}
+        if self.multipart_threshold is not None and size >= self.multipart_threshold:
+            await self._multipart_upload(fileobj, size, object_key, acl, metadata, **extra_args)
+        else:
+            body = await self._run_blocking(fileobj.read)
+            await self._call('put_object', Bucket=self.bucket_name, Key=object_key, Body=body, ACL=acl, Metadata=metadata,
+                             **extra_args)
+        auth.remember_object_acl(self.s3_client, self.bucket_name, object_key, acl)
+
+    async def _multipart_upload(self, fileobj, size, object_key, acl, metadata, **extra_args):
+        # like transfer.multipart_upload: parts are read in order and at most max_concurrency parts are in memory
+        part_size = transfer.get_part_size(size, self.multipart_chunksize)
+        upload_id = (await self._call('create_multipart_upload', Bucket=self.bucket_name, Key=object_key,
+                                      ACL=acl, Metadata=metadata, **extra_args))['UploadId']
+        slots = asyncio.Semaphore(self.max_concurrency)
+
+        async def upload_part(part_number, data):
+            response = await self._call('upload_part', Bucket=self.bucket_name, Key=object_key, UploadId=upload_id,
+                                        PartNumber=part_number, Body=data)
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+        tasks = []
+        try:
+            for part_number in range(1, max(1, -(-size // part_size)) + 1):
+                await slots.acquire()
+                # fail fast: stop reading parts as soon as one has failed (the except below aborts the upload)
+                for done in tasks:
+                    if done.done() and not done.cancelled() and done.exception() is not None:
+                        raise done.exception()
+                data = await self._run_blocking(fileobj.read, part_size)
+                task = asyncio.ensure_future(upload_part(part_number, data))
+                # a done callback also runs for tasks cancelled before they started
+                task.add_done_callback(lambda _: slots.release())
+                tasks.append(task)
+            parts = await asyncio.gather(*tasks)
+            await self._call('complete_multipart_upload', Bucket=self.bucket_name, Key=object_key, UploadId=upload_id,
+                             MultipartUpload={'Parts': parts})
+        except BaseException:
+            for task in tasks: task.cancel()
+            try:
+                await self._call('abort_multipart_upload', Bucket=self.bucket_name, Key=object_key, UploadId=upload_id)
+            except Exception as e:
+                # the original error is the one that matters; the parts left behind are removed by lifecycle rules
+                sys.stderr.write(f"Could not abort the multipart upload of {object_key} ({e!r})\n")
+            raise
+
+    async def upload_file(self, local_filename, bucket_subfolder, new_filename=None, acl=None, hash_length=None, verbose=True,
+                          compression=None, compression_level=None):
+        """
+        Upload a local file as bucket_subfolder/<name>-<hash_id><ext> (skipped if it exists with the same size); returns its url.
+
+        With compression ('gzip' or 'zstd', defaulting to the store's compression; False to disable), the file is
+        compressed in the executor and stored with Content-Encoding set, as by S3FileStore.upload_file.
+        """
+        if acl is None: acl = self.acl
+        if hash_length is None: hash_length = self.hash_length
+        if compression is None: compression = self.compression
+        compression = C.check_codec(compression)
+        if not bucket_subfolder.endswith('/'): bucket_subfolder += '/'
+
+        full_hash = await self._run_blocking(get_file_hash, local_filename)
+        object_name = await self._run_blocking(lambda: get_object_name_with_hash_id(local_filename, object_name=new_filename,
+                                                                                    hash_length=hash_length))
+        object_key = urljoin(bucket_subfolder, object_name)
+        metadata = {"sha256": full_hash}
+        if compression is not None:
+            def compress():
+                with open(local_filename, 'rb') as f:
+                    buf, _ = C.compress_fileobj(f, compression, level=compression_level)
+                stored_hash, size = hash_buffer(buf)
+                return buf, size, stored_hash
+            f, size, stored_hash = await self._run_blocking(compress)
+            metadata = C.upload_metadata(metadata, compression, stored_hash)
+        else:
+            f, size = open(local_filename, 'rb'), os.path.getsize(local_filename)
+
+        with f:
+            if await self._remote_size(object_key) == size:
+                if verbose: print(f"The file '{object_key}' already exists in the S3 bucket '{self.bucket_name}' and has the same size. The file will not be re-uploaded.\n")
+                return await self.generate_url(object_key)
+            await self._upload_fileobj(f, size, object_key, acl, metadata, content_encoding=compression)
+        if verbose: print(f"The file '{object_key}' has been uploaded to the S3 bucket '{self.bucket_name}'.\n")
+        return await self.generate_url(object_key, acl=acl)
+
+    async def upload_files(self, filenames, bucket_subfolder, acl=None, hash_length=None, verbose=True, return_errors=False,
+                           compression=None, compression_level=None):
+        """
+        Upload files concurrently; bucket_subfolder is one subfolder or a list with one per file.
+
+        Returns the urls in input order (None for failed uploads), and the (filename, exception) errors if return_errors=True.
+        """
+        filenames = list(filenames)
+        if isinstance(bucket_subfolder, str):
+            bucket_subfolders = [bucket_subfolder] * len(filenames)
+        elif isinstance(bucket_subfolder, (list, tuple)):
+            bucket_subfolders = list(bucket_subfolder)
+            if len(bucket_subfolders) != len(filenames):
+                raise ValueError(f"Got {len(bucket_subfolders)} bucket_subfolders for {len(filenames)} files")
+        else:
+            raise TypeError(f"bucket_subfolder must be a str or a list of str, got {type(bucket_subfolder)}")
+        results = await asyncio.gather(*[self.upload_file(filename, subfolder, acl=acl, hash_length=hash_length, verbose=verbose,
+                                                          compression=compression, compression_level=compression_level)
+                                         for filename, subfolder in zip(filenames, bucket_subfolders)], return_exceptions=True)
+        urls = [None if isinstance(r, BaseException) else r for r in results]
+        errors = [(filename, r) for filename, r in zip(filenames, results) if isinstance(r, BaseException)]
+        if return_errors:
+            return urls, errors
+        transfer.report_errors(errors)
+        return urls
+
+    async def upload_data(self, data, bucket_key, data_format=None, acl=None, hash_length=None, verbose=True, add_hash_suffix=False,
+                          spill_threshold=None, compression=None, compression_level=None):
+        """Serialize (and optionally compress) data in the executor and upload it; returns (bucket_key, url) like S3FileStore.upload_data."""
+        if acl is None: acl = self.acl
+        if hash_length is None: hash_length = self.hash_length
+        if spill_threshold is None: spill_threshold = SPILL_THRESHOLD
+        if compression is None: compression = self.compression
+        compression = C.check_codec(compression)
+
+        def prepare():
+            buf, full_hash, hash_id, _ = prepare_data_for_upload(data, hash_length, data_format=data_format,
+                                                                 spill_threshold=spill_threshold, compression=compression,
+                                                                 compression_level=compression_level)
+            metadata = {"sha256": full_hash}
+            if compression is not None:
+                metadata = C.upload_metadata(metadata, compression, hash_buffer(buf)[0])
+            return buf, metadata, hash_id
+        buf, metadata, hash_id = await self._run_blocking(prepare)
+
+        path = Path(bucket_key)
+        bucket_subfolder = str(path.parent)
+        if not bucket_subfolder.endswith('/'): bucket_subfolder += '/'
+        filename = f"{path.stem}-{hash_id}{path.suffix}" if add_hash_suffix else path.name
+        bucket_key = urljoin(bucket_subfolder, filename)
+
+        with buf:
+            buf.seek(0, os.SEEK_END)
+            size = buf.tell()
+            buf.seek(0)
+            if await self._remote_size(bucket_key) == size:
+                if verbose: print(f"The file '{bucket_key}' already exists in the S3 bucket '{self.bucket_name}' and has the same size. The file will not be re-uploaded.\n")
+                return bucket_key, await self.generate_url(bucket_key)
+            await self._upload_fileobj(buf, size, bucket_key, acl, metadata, content_encoding=compression)
+        if verbose: print(f"The file '{bucket_key}' has been uploaded to the S3 bucket '{self.bucket_name}'.\n")
+        return bucket_key, await self.generate_url(bucket_key, acl=acl)
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(bucket_name={self.bucket_name!r}, profile={self.profile!r}, "
+                f"endpoint_url={self.endpoint_url!r}, bucket_region={self.bucket_region!r},\n"
+                f"\t acl={self.acl!r}, expires_in_seconds={self.expires_in_seconds!r}, hash_length={self.hash_length!r}, "
+                f"cache_dir={self.cache_dir!r}, max_concurrency={self.max_concurrency!r})")
@@ -1,62 +1,77 @@
 import requests
+import botocore.exceptions
+
+from . import auth
+from . import retry
 
 def update_object_acl(s3_client, bucket_name, object_key, acl, verbose=True):
     """
     Update the ACL of an S3 object.
-    
+
+    Throttling and transient errors are retried (see retry.py); errors that persist, or are
+    not retryable (e.g., no permission to change the ACL), are raised.
+
     Parameters:
     - bucket: The s3 bucket connection.
     - object_key: The key of the S3 object.
     - acl: The ACL to set (e.g., 'private', 'public-read', 'public-read-write').
     """
+    response = retry.call(s3_client.put_object_acl, Bucket=bucket_name, Key=object_key, ACL=acl)
+    auth.remember_object_acl(s3_client, bucket_name, object_key, acl)
+    if verbose: print(f"Successfully updated ACL for {object_key} to {acl}.")
+    return response
 
-    try:
-        # Update the object's ACL
-        response = s3_client.put_object_acl(Bucket=bucket_name, Key=object_key, ACL=acl)
-        if verbose: print(f"Successfully updated ACL for {object_key} to {acl}.")
-        return response
-    except Exception as e:
-        print(f"Error updating ACL for {object_key} in {bucket_name}: {e}")
-        
 def get_s3_object_metadata(s3_client, bucket_name, object_key, key=None):
     """
     Get Metadata from s3 object using s3_client
-    
+
+    Throttling and transient errors are retried (see retry.py) and raised if they persist,
+    rather than being reported as a missing object.
     """
     try:
         # Get the object metadata
-        response = s3_client.head_object(Bucket=bucket_name, Key=object_key)
+        response = retry.call(s3_client.head_object, Bucket=bucket_name, Key=object_key)
         
         # return the metadata
         if key is not None:
             return response['Metadata'].get(key.lower(), None)
 
         return response['Metadata']
-    except s3_client.exceptions.NoSuchKey:
-        print(f"Object {object_key} does not exist in bucket {bucket_name}.")
-        return None
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    except botocore.exceptions.ClientError as e:
+        if retry.is_retryable(e):
+            raise
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            print(f"Object {object_key} does not exist in bucket {bucket_name}.")
+        else:
+            print(f"An error occurred: {e}")
         return None 
     
 def get_s3_url_metadata(url, key=None):
     """
     Get Metadata from s3 object using https:// url
-    
-    """    
-    try:
+
+    The HEAD request is retried on throttling and transient errors (see retry.py); a missing object
+    (404) returns None, any other error is raised.
+    """
+    def head():
         # Send a HEAD request to the S3 object URL
         response = requests.head(url)
         response.raise_for_status()  # Raise an HTTPError for bad responses
+        return response
 
-        # Extract the 'x-amz-meta-' header if it exists
-        if key is not None:
-            metadata = response.headers.get(f'x-amz-meta-{key.lower()}', None)
-        else:
-            metadata = {k.replace('x-amz-meta-',''):v for k,v in response.headers.items() 
-                        if k.startswith('x-amz-meta-') }
-        
-        return metadata
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred: {e}")
-        return None        
\ No newline at end of file
+    try:
+        response = retry.call(head)
+    except requests.exceptions.HTTPError as e:
+        if getattr(e.response, 'status_code', None) == 404:
+            print(f"Object {url} does not exist.")
+            return None
+        raise
+
+    # Extract the 'x-amz-meta-' header if it exists
+    if key is not None:
+        metadata = response.headers.get(f'x-amz-meta-{key.lower()}', None)
+    else:
+        metadata = {k.replace('x-amz-meta-',''):v for k,v in response.headers.items()
+                    if k.startswith('x-amz-meta-') }
+
+    return metadata
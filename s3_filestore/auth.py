@@ -1,11 +1,22 @@
 import os
 import boto3
 
-from .utils import is_url_public_readable, parse_s3_url
+from .utils import is_url_public_readable, parse_s3_url, TTLCache
+from . import retry
+from . import metrics
+from . import transfer
+from . import clients
 
 WASABI_ENDPOINT = 'https://s3.wasabisys.com'
 AWS_ENDPOINT = 'https://s3.amazonaws.com'
 
+# object ACLs can change, so they are only trusted for a few minutes (bucket regions are cached in clients);
+# entries are keyed by (endpoint_url, bucket_name, object_key), as buckets of different endpoints are unrelated
+ACL_CACHE_TTL = 300
+PUBLIC_ACLS = ('public-read', 'public-read-write')
+_MISSING = object()
+_object_public = TTLCache(ttl=ACL_CACHE_TTL)
+
 def get_session_with_profile(profile_name):
     session = boto3.Session(profile_name=profile_name)
     return session
@@ -45,29 +56,24 @@ def get_userdata(profile=os.environ.get('S3_PROFILE', None)):
     return userdata
 
 def get_session_with_userdata(profile, region_name=None):
-    userdata = get_userdata(profile=profile)
-    session = boto3.Session(aws_access_key_id=userdata.get('S3_ACCESS_KEY_ID'),
-                            aws_secret_access_key=userdata.get('S3_SECRET_ACCESS_KEY'),
-                            region_name=region_name)
+    session = clients.get_session(profile, region_name=region_name)
     return session
 
 def get_bucket_region(session, bucket_name, endpoint_url):
-    s3_client = session.client('s3', endpoint_url=endpoint_url)
-    bucket_location = s3_client.get_bucket_location(Bucket=bucket_name)['LocationConstraint']
+    bucket_location = clients.bucket_regions.get((endpoint_url, bucket_name), _MISSING)
+    if bucket_location is _MISSING:
+        s3_client = session.client('s3', endpoint_url=endpoint_url)
+        bucket_location = s3_client.get_bucket_location(Bucket=bucket_name)['LocationConstraint']
+        clients.bucket_regions.set((endpoint_url, bucket_name), bucket_location)
 
     return bucket_location 
 
 def get_bucket_location(bucket_name, profile=os.environ.get('S3_PROFILE', None)):
-    s3_client = get_client_with_userdata(profile)
-    bucket_location = s3_client.get_bucket_location(Bucket=bucket_name)['LocationConstraint']
+    bucket_location = clients.get_bucket_region(bucket_name, profile=profile)
     return bucket_location 
 
 def get_client_with_userdata(profile=os.environ.get('S3_PROFILE', None)):
-    userdata = get_userdata(profile=profile)
-    s3_client = boto3.client('s3', 
-                             aws_access_key_id=userdata.get('S3_ACCESS_KEY_ID'),
-                             aws_secret_access_key=userdata.get('S3_SECRET_ACCESS_KEY'),
-                             endpoint_url=userdata.get('S3_ENDPOINT_URL'))
+    s3_client = clients.get_client(profile)
 
     return s3_client
 
@@ -81,16 +87,57 @@ def get_public_s3_object_url(bucket_name, object_name):
 
     return response    
 
-def generate_url(s3_client, bucket_name, bucket_key, bucket_region=None, profile=os.environ.get('S3_PROFILE', None), expires_in_seconds=3600):
-    if is_object_private(s3_client, bucket_name, bucket_key):        
+@metrics.timed()
+def generate_url(s3_client, bucket_name, bucket_key, bucket_region=None, profile=os.environ.get('S3_PROFILE', None), expires_in_seconds=3600,
+                 default_acl=None):
+    if is_object_private(s3_client, bucket_name, bucket_key, default_acl=default_acl):
         url = generate_presigned_url(s3_client, bucket_name, bucket_key, expires_in_seconds=expires_in_seconds)
     else:
         url = get_url(bucket_name, bucket_key, bucket_region=bucket_region, profile=profile)
     
     return url
 
+def generate_urls(s3_client, bucket_name, bucket_keys, bucket_region=None, profile=os.environ.get('S3_PROFILE', None),
+                  expires_in_seconds=3600, default_acl=None, max_workers=None):
+    """
+    Generate urls for many objects of one bucket.
+
+    The bucket region is resolved once, and the public/private status of objects that are
+    not already cached is looked up concurrently.
+
+    Parameters:
+    - bucket_keys: The object keys.
+    - default_acl: If given, objects whose status is not cached are assumed to have this canned ACL
+                   (e.g., the store's acl) instead of being looked up.
+    - max_workers: The maximum number of concurrent ACL lookups.
+
+    Lookups that still fail after retries are reported and the first of their errors is raised.
+    """
+    bucket_keys = list(bucket_keys)
+    public = {}
+    if default_acl is None:
+        unknown = [key for key in dict.fromkeys(bucket_keys) if cached_object_public(s3_client, bucket_name, key) is None]
+        results, errors = transfer.run_batch(lambda key: is_object_public(s3_client, bucket_name, key), unknown,
+                                             max_workers=max_workers)
+        if errors:
+            transfer.report_errors(errors)
+            raise errors[0][1]
+        # the batch's answers are used as is: uncached ones (e.g., no permission to read the ACL) are not looked up again
+        public = dict(zip(unknown, results))
+    for key in bucket_keys:
+        if key not in public:
+            public[key] = is_object_public(s3_client, bucket_name, key, default_acl=default_acl)
+
+    if bucket_region is None and any(public.values()):
+        bucket_region = get_bucket_location(bucket_name, profile=profile)
+
+    urls = [get_url(bucket_name, key, bucket_region=bucket_region, profile=profile) if public[key]
+            else generate_presigned_url(s3_client, bucket_name, key, expires_in_seconds=expires_in_seconds)
+            for key in bucket_keys]
+    return urls
+
 def get_url(bucket_name, object_name, bucket_region=None, profile=os.environ.get('S3_PROFILE', None)):
-    domain = 'wasabisys.com' if 'wasabi' in profile else 'amazonaws.com'
+    domain = 'wasabisys.com' if profile is not None and 'wasabi' in profile else 'amazonaws.com'
 
     if bucket_region is None:
         bucket_region = get_bucket_location(bucket_name, profile=profile)
@@ -110,24 +157,62 @@ def generate_presigned_url(s3_client, bucket_name, object_name, expires_in_secon
                                                    HttpMethod='GET')
     return signed_url  
 
-def is_object_private(s3_client, bucket_name, object_key):
-    is_public = is_object_public(s3_client, bucket_name, object_key)
+def is_object_private(s3_client, bucket_name, object_key, default_acl=None):
+    is_public = is_object_public(s3_client, bucket_name, object_key, default_acl=default_acl)
     return is_public==False
 
-def is_object_public(s3_client, bucket_name, object_key):
+def _acl_cache_key(s3_client, bucket_name, object_key):
+    return (getattr(s3_client.meta, 'endpoint_url', None), bucket_name, object_key)
+
+def remember_object_acl(s3_client, bucket_name, object_key, acl):
+    '''Record the canned ACL an object was just written with, so its url can be generated without an ACL lookup.'''
+    if acl is None: return
+    remember_object_public(s3_client, bucket_name, object_key, acl in PUBLIC_ACLS)
+
+def remember_object_public(s3_client, bucket_name, object_key, is_public):
+    _object_public.set(_acl_cache_key(s3_client, bucket_name, object_key), is_public)
+
+def cached_object_public(s3_client, bucket_name, object_key):
+    '''The cached public status of an object on s3_client's endpoint (None if it is not cached).'''
+    return _object_public.get(_acl_cache_key(s3_client, bucket_name, object_key))
+
+def grants_public_read(grants):
+    '''Whether an object ACL's Grants give read access to everyone.'''
+    for grant in grants:
+        grantee = grant.get('Grantee', {})
+        permission = grant.get('Permission')
+        if grantee.get('URI') == 'http://acs.amazonaws.com/groups/global/AllUsers' and permission == 'READ':
+            return True
+    return False
+
+def is_object_public(s3_client, bucket_name, object_key, default_acl=None):
+    '''Whether the object grants public read access; results are cached for ACL_CACHE_TTL seconds.
+
+      If default_acl is given and the object's status is not cached, the object is assumed to have that ACL.
+      Throttling and transient errors are retried and raised if they persist (a public object must not be
+      reported as private because the endpoint was busy); other errors (e.g., no permission to read the ACL)
+      are reported and the object is treated as private, without caching that answer.
+    '''
+    is_public = cached_object_public(s3_client, bucket_name, object_key)
+    if is_public is not None:
+        metrics.cache_hit('acl')
+        return is_public
+    if default_acl is not None:
+        return default_acl in PUBLIC_ACLS
+
+    metrics.cache_miss('acl')
     try:
         # Get the ACL of the object
-        acl = s3_client.get_object_acl(Bucket=bucket_name, Key=object_key)
+        acl = retry.call(s3_client.get_object_acl, Bucket=bucket_name, Key=object_key)
         # Check if the ACL grants public read access
-        for grant in acl['Grants']:
-            grantee = grant.get('Grantee', {})
-            permission = grant.get('Permission')
-            if grantee.get('URI') == 'http://acs.amazonaws.com/groups/global/AllUsers' and permission == 'READ':
-                return True
+        is_public = grants_public_read(acl['Grants'])
         
-        return False
+        remember_object_public(s3_client, bucket_name, object_key, is_public)
+        return is_public
     
     except Exception as e:
+        if retry.is_retryable(e):
+            raise
         print(f"Error getting ACL for {object_key} in {bucket_name}: {e}")
         return False   
     
@@ -0,0 +1,232 @@
+import os
+import time
+import sqlite3
+import threading
+import contextlib
+
+from urllib.parse import urlparse, unquote
+
+from .utils import parse_s3_url
+
+INDEX_FILENAME = '.cache_index.sqlite'
+
+# seconds a cached file of a mutable key (one without a hash id) is used before it is revalidated
+# with a conditional request; 0 revalidates on every use, None never does
+CACHE_MAX_AGE = 0
+
+# once the cache exceeds max_bytes, entries are evicted down to this fraction of it, so eviction
+# runs about once per tenth of the budget downloaded rather than after every download
+PRUNE_TARGET = 0.9
+
+class CacheManager(object):
+    """
+    Local cache of downloaded objects with an on-disk index and LRU eviction.
+
+    Files are stored under cache_dir/<bucket>/<key>, so objects with the same filename
+    in different prefixes or buckets never collide. A sqlite index in the cache_dir records
+    the ETag, Last-Modified, sha256, size, last-access and last-validation time of every entry,
+    and triggers keep a running total of their sizes. When max_bytes is set and an insert takes the
+    total over it, the least recently used entries are evicted down to PRUNE_TARGET * max_bytes.
+    Files added inside a batch() are not evicted until the batch ends.
+    """
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._batch_paths = set()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.cache_dir, INDEX_FILENAME), timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS entries ("
+                               "path TEXT PRIMARY KEY, bucket TEXT, key TEXT, etag TEXT, sha256 TEXT, "
+                               "size INTEGER, created REAL, last_access REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            # indexes created before revalidation lack these columns; their entries count as never validated
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(entries)")]
+            for column, column_type in (('last_modified', 'TEXT'), ('validated', 'REAL')):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE entries ADD COLUMN {column} {column_type}")
+            # running total of the entries' sizes, initialized from the entries of indexes created without it
+            self._conn.execute("CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER)")
+            self._conn.execute("INSERT OR IGNORE INTO totals VALUES (0, (SELECT COALESCE(SUM(size), 0) FROM entries))")
+            self._conn.execute("CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries "
+                               "BEGIN UPDATE totals SET bytes = bytes + new.size WHERE id = 0; END")
+            self._conn.execute("CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries "
+                               "BEGIN UPDATE totals SET bytes = bytes - old.size WHERE id = 0; END")
+            self._conn.execute("CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries "
+                               "BEGIN UPDATE totals SET bytes = bytes + new.size - old.size WHERE id = 0; END")
+
+    def cache_path(self, bucket_name, object_key):
+        """The local filename for bucket_name/object_key (relative path components are dropped)."""
+        parts = [p for p in object_key.split('/') if p not in ('', '.', '..')]
+        return os.path.join(self.cache_dir, bucket_name, *parts)
+
+    def lookup(self, bucket_name, object_key):
+        """Return the cached filename for the object and mark it as recently used, or None on a miss."""
+        filename = self.cache_path(bucket_name, object_key)
+        path = os.path.relpath(filename, self.cache_dir)
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT size FROM entries WHERE path=?", (path,)).fetchone()
+            if not os.path.isfile(filename):
+                if row is not None:
+                    self._conn.execute("DELETE FROM entries WHERE path=?", (path,))
+                return None
+            if row is None:
+                # file predates the index (or the index was removed), adopt it
+                self._insert(path, bucket_name, object_key, None, None, os.path.getsize(filename))
+            else:
+                self._conn.execute("UPDATE entries SET last_access=? WHERE path=?", (time.time(), path))
+        return filename
+
+    def add(self, bucket_name, object_key, etag=None, sha256=None, last_modified=None):
+        """Register a file that was just written to cache_path(bucket_name, object_key), then enforce max_bytes."""
+        filename = self.cache_path(bucket_name, object_key)
+        path = os.path.relpath(filename, self.cache_dir)
+        with self._lock, self._conn:
+            self._insert(path, bucket_name, object_key, etag, sha256, os.path.getsize(filename), last_modified=last_modified,
+                         validated=time.time())
+            total = self._total_bytes()
+            if self._batches:
+                self._batch_paths.add(path)
+                return filename
+        if self.max_bytes is not None and total > self.max_bytes:
+            self.prune(max_bytes=int(self.max_bytes * PRUNE_TARGET), keep=(path,))
+        return filename
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Defer eviction while a batch of downloads is in flight, so files returned earlier in the batch are
+        still there when the caller opens them; the cache is pruned once when the batch ends, keeping them.
+        """
+        with self._lock:
+            self._batches += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batches -= 1
+                keep = set(self._batch_paths)
+                if self._batches == 0: self._batch_paths.clear()
+                total = self._total_bytes()
+            if self.max_bytes is not None and total > self.max_bytes:
+                self.prune(max_bytes=int(self.max_bytes * PRUNE_TARGET), keep=keep)
+
+    def get_entry(self, bucket_name, object_key):
+        path = os.path.relpath(self.cache_path(bucket_name, object_key), self.cache_dir)
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM entries WHERE path=?", (path,))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([c[0] for c in cursor.description], row))
+
+    def is_fresh(self, bucket_name, object_key, max_age=CACHE_MAX_AGE):
+        """Whether the entry was downloaded or revalidated within max_age seconds (always True for max_age=None)."""
+        if max_age is None:
+            return True
+        entry = self.get_entry(bucket_name, object_key)
+        return entry is not None and entry['validated'] is not None and time.time() - entry['validated'] <= max_age
+
+    def mark_validated(self, bucket_name, object_key):
+        """Record that the remote object was found unchanged (e.g. a 304 response to a conditional request)."""
+        path = os.path.relpath(self.cache_path(bucket_name, object_key), self.cache_dir)
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE entries SET validated=? WHERE path=?", (time.time(), path))
+
+    def remove(self, bucket_name, object_key):
+        filename = self.cache_path(bucket_name, object_key)
+        with self._lock, self._conn:
+            self._remove(os.path.relpath(filename, self.cache_dir))
+
+    def cache_info(self):
+        """Summary of the cache: location, number of entries, total bytes and the byte budget."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            size = self._total_bytes()
+        return dict(cache_dir=self.cache_dir, entries=entries, bytes=size, max_bytes=self.max_bytes)
+
+    def prune(self, max_bytes=None, older_than=None, keep=()):
+        """
+        Evict cache entries.
+
+        Parameters:
+        - max_bytes: Evict least recently used entries until the cache fits (defaults to self.max_bytes).
+        - older_than: Also evict every entry not accessed within this many seconds.
+        - keep: Relative paths that must not be evicted.
+
+        Returns:
+        - dict with the number of removed entries and the number of bytes freed.
+        """
+        if max_bytes is None: max_bytes = self.max_bytes
+        removed, freed = 0, 0
+        with self._lock, self._conn:
+            total = self._total_bytes()
+            cutoff = time.time() - older_than if older_than is not None else None
+            # walk the last_access index from the least recently used entry, stopping as soon as nothing else can go
+            victims = []
+            for path, size, last_access in self._conn.execute("SELECT path, size, last_access FROM entries ORDER BY last_access"):
+                over_budget = max_bytes is not None and total > max_bytes
+                expired = cutoff is not None and last_access < cutoff
+                if not (over_budget or expired):
+                    break
+                if path in keep: continue
+                victims.append(path)
+                total -= size
+                freed += size
+            for path in victims:
+                self._remove(path)
+            removed = len(victims)
+        return dict(removed=removed, freed_bytes=freed)
+
+    def _total_bytes(self):
+        return self._conn.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+
+    def _insert(self, path, bucket_name, object_key, etag, sha256, size, last_modified=None, validated=None):
+        now = time.time()
+        # delete + insert rather than INSERT OR REPLACE, whose implicit delete does not fire the totals trigger
+        self._conn.execute("DELETE FROM entries WHERE path=?", (path,))
+        self._conn.execute("INSERT INTO entries (path, bucket, key, etag, sha256, size, created, last_access, "
+                           "last_modified, validated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (path, bucket_name, object_key, etag, sha256, size, now, now, last_modified, validated))
+
+    def _remove(self, path):
+        self._conn.execute("DELETE FROM entries WHERE path=?", (path,))
+        try:
+            os.remove(os.path.join(self.cache_dir, path))
+        except FileNotFoundError:
+            pass
+
+def cache_key_for_url(url):
+    """
+    (bucket_name, object_key) for an s3:// or S3 https url; other hosts are namespaced by hostname.
+
+    Virtual-hosted and path-style urls (with or without a region) map to the same key and the query
+    string is ignored, so the public and presigned urls of an object share one cache entry.
+    """
+    parsed_url = urlparse(url)
+    if parsed_url.scheme == 's3':
+        return parsed_url.netloc, unquote(parsed_url.path.lstrip('/'))
+    try:
+        bucket_name, object_key, _, _ = parse_s3_url(url)
+    except ValueError:
+        bucket_name, object_key = None, None
+    if bucket_name is None:
+        bucket_name, object_key = parsed_url.hostname, unquote(parsed_url.path.lstrip('/'))
+    return bucket_name, object_key
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+def get_cache(cache_dir, max_bytes=None):
+    """Return the process-wide CacheManager for cache_dir, updating its byte budget if max_bytes is given."""
+    key = os.path.realpath(os.path.expanduser(cache_dir))
+    with _CACHES_LOCK:
+        cache = _CACHES.get(key)
+        if cache is None:
+            cache = _CACHES[key] = CacheManager(cache_dir, max_bytes=max_bytes)
+        elif max_bytes is not None:
+            cache.max_bytes = max_bytes
+    return cache
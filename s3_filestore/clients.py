@@ -0,0 +1,112 @@
+"""
+Process-wide registry of boto3 sessions and clients.
+
+Credentials are read once per profile, sessions are shared per (profile, region) and clients per
+(profile, endpoint, region, pool size), so creating many S3FileStore objects (or calling the auth
+helpers repeatedly) does not rebuild clients. boto3 clients are thread-safe and can be shared by
+all workers; resources are not, so get_resource returns one resource per thread, and work handed to
+worker threads only uses a resource's client (bucket.meta.client) or the shared client. Every client
+is instrumented with retry.observe_client and metrics.instrument_client.
+"""
+
+import os
+import threading
+import boto3
+
+from botocore.config import Config
+
+from . import auth
+from . import retry
+from . import metrics
+from .utils import TTLCache
+
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+# botocore's standard retry mode (3 attempts, with a retry quota); retry.py retries on top of it
+RETRY_CONFIG = {'mode': 'standard'}
+REGION_CACHE_TTL = 24 * 3600
+
+_MISSING = object()
+_lock = threading.RLock()
+_userdata = {}
+_sessions = {}
+_clients = {}
+_resources = threading.local()
+
+# (endpoint_url, bucket_name) -> LocationConstraint; bucket regions practically never change
+bucket_regions = TTLCache(ttl=REGION_CACHE_TTL)
+
+def get_userdata(profile=os.environ.get('S3_PROFILE', None)):
+    with _lock:
+        if profile not in _userdata:
+            _userdata[profile] = auth.get_userdata(profile=profile)
+        return _userdata[profile]
+
+def get_session(profile=os.environ.get('S3_PROFILE', None), region_name=None):
+    key = (profile, region_name)
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            userdata = get_userdata(profile)
+            session = _sessions[key] = boto3.Session(aws_access_key_id=userdata.get('S3_ACCESS_KEY_ID'),
+                                                     aws_secret_access_key=userdata.get('S3_SECRET_ACCESS_KEY'),
+                                                     region_name=region_name)
+        return session
+
+def get_client(profile=os.environ.get('S3_PROFILE', None), endpoint_url=None, region_name=None, max_pool_connections=None):
+    """
+    Return the shared s3 client for (profile, endpoint_url, region_name).
+
+    Parameters:
+    - profile: The credentials profile (None to read credentials from the environment).
+    - endpoint_url: The endpoint url (defaults to the profile's endpoint).
+    - region_name: The region name.
+    - max_pool_connections: The size of the client's connection pool (defaults to DEFAULT_MAX_POOL_CONNECTIONS).
+    """
+    if endpoint_url is None: endpoint_url = get_userdata(profile).get('S3_ENDPOINT_URL')
+    if max_pool_connections is None: max_pool_connections = DEFAULT_MAX_POOL_CONNECTIONS
+    key = (profile, endpoint_url, region_name, max_pool_connections)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            config = Config(max_pool_connections=max_pool_connections, tcp_keepalive=True, retries=RETRY_CONFIG)
+            session = get_session(profile, region_name=region_name)
+            client = session.client('s3', endpoint_url=endpoint_url, config=config)
+            client = _clients[key] = metrics.instrument_client(retry.observe_client(client))
+        return client
+
+def get_resource(profile=os.environ.get('S3_PROFILE', None), endpoint_url=None, region_name=None, max_pool_connections=None):
+    """Return an s3 resource for (profile, endpoint_url, region_name, max_pool_connections), cached per thread."""
+    if endpoint_url is None: endpoint_url = get_userdata(profile).get('S3_ENDPOINT_URL')
+    if max_pool_connections is None: max_pool_connections = DEFAULT_MAX_POOL_CONNECTIONS
+    cache = getattr(_resources, 'cache', None)
+    if cache is None:
+        cache = _resources.cache = {}
+    key = (profile, endpoint_url, region_name, max_pool_connections)
+    resource = cache.get(key)
+    if resource is None:
+        with _lock:
+            session = get_session(profile, region_name=region_name)
+            config = Config(max_pool_connections=max_pool_connections, tcp_keepalive=True, retries=RETRY_CONFIG)
+            resource = cache[key] = session.resource('s3', endpoint_url=endpoint_url, config=config)
+            metrics.instrument_client(retry.observe_client(resource.meta.client))
+    return resource
+
+def get_bucket_region(bucket_name, profile=os.environ.get('S3_PROFILE', None), endpoint_url=None):
+    """The bucket's LocationConstraint (None for us-east-1), looked up once per REGION_CACHE_TTL."""
+    if endpoint_url is None: endpoint_url = get_userdata(profile).get('S3_ENDPOINT_URL')
+    bucket_location = bucket_regions.get((endpoint_url, bucket_name), _MISSING)
+    metrics.cache_hit('bucket_region', bucket_location is not _MISSING)
+    if bucket_location is _MISSING:
+        s3_client = get_client(profile, endpoint_url=endpoint_url)
+        bucket_location = s3_client.get_bucket_location(Bucket=bucket_name)['LocationConstraint']
+        bucket_regions.set((endpoint_url, bucket_name), bucket_location)
+    return bucket_location
+
+def clear():
+    """Drop cached credentials, sessions, clients (and this thread's resources) and bucket regions."""
+    with _lock:
+        _userdata.clear()
+        _sessions.clear()
+        _clients.clear()
+        _resources.__dict__.clear()
+        bucket_regions.clear()
@@ -0,0 +1,130 @@
+"""
+Opt-in compression of uploaded objects (gzip, or zstd with pip install zstandard).
+
+A compressed object keeps its key (e.g. results.csv) and is marked with a Content-Encoding header,
+so downloads through this package decompress it while streaming: the download cache holds the
+decompressed file, and load_object / load_file / iter_csv see the original bytes.
+
+The object's sha256 metadata (and the hash id of hash-suffixed keys) keeps its meaning: the hash
+of the uncompressed payload. The hash of the stored (compressed) bytes is recorded as well, under
+stored-sha256, for readers that verify the raw stream.
+"""
+import io
+import zlib
+import hashlib
+import tempfile
+
+CODECS = ('gzip', 'zstd')
+CHUNK_SIZE = 1024 * 1024
+SPILL_THRESHOLD = 64 * 1024 * 1024
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compression requires the zstandard package (pip install zstandard)")
+    return zstandard
+
+def check_codec(codec):
+    """codec if it is a supported codec, None for None / False, ValueError otherwise."""
+    if codec is None or codec is False:
+        return None
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported compression {codec!r}, expected one of {CODECS}")
+    if codec == 'zstd': _zstd()
+    return codec
+
+def response_codec(content_encoding):
+    """The codec of a response's Content-Encoding, or None if it is not compressed with a supported codec."""
+    if not content_encoding:
+        return None
+    content_encoding = content_encoding.strip().lower()
+    return content_encoding if content_encoding in CODECS else None
+
+def compressor(codec, level=None):
+    """A streaming compressor with compress(data) and flush() methods."""
+    if codec == 'gzip':
+        return zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    zstandard = _zstd()
+    return zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+
+class Decompressor(object):
+    """A streaming decompressor: decompress(chunk) for every chunk as it arrives, then finish()."""
+    def __init__(self, codec):
+        self.codec = codec
+        if codec == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._decompressor = _zstd().ZstdDecompressor().decompressobj()
+
+    def decompress(self, chunk):
+        return self._decompressor.decompress(chunk)
+
+    def finish(self):
+        """Remaining output; raises IOError if the compressed stream was truncated."""
+        data = self._decompressor.flush() if self.codec == 'gzip' else b''
+        if not self._decompressor.eof:
+            raise IOError(f"Truncated {self.codec} stream")
+        return data
+
+class DecompressingReader(io.RawIOBase):
+    """A read-only binary file decompressing the binary file object raw as it is read."""
+    def __init__(self, raw, codec, chunk_size=CHUNK_SIZE):
+        super().__init__()
+        self.raw = raw
+        self.name = getattr(raw, 'name', None)
+        self.chunk_size = chunk_size
+        self._decompressor = Decompressor(codec)
+        self._pending = b''
+        self._offset = 0
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._offset == len(self._pending) and not self._done:
+            chunk = self.raw.read(self.chunk_size)
+            if chunk:
+                self._pending = self._decompressor.decompress(chunk)
+            else:
+                self._pending = self._decompressor.finish()
+                self._done = True
+            self._offset = 0
+        n = min(len(buffer), len(self._pending) - self._offset)
+        buffer[:n] = memoryview(self._pending)[self._offset:self._offset + n]
+        self._offset += n
+        return n
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+def compress_fileobj(fileobj, codec, level=None, spill_threshold=SPILL_THRESHOLD, chunk_size=CHUNK_SIZE):
+    """
+    Compress the binary file object fileobj (from its current position) in chunks.
+
+    Parameters:
+    - fileobj: The binary file object to compress.
+    - codec: 'gzip' or 'zstd'.
+    - level: The compression level (codec default if None).
+    - spill_threshold: Compressed output larger than this many bytes is written to a temporary file.
+    - chunk_size: The number of bytes read per iteration.
+
+    Returns:
+    - buffer: A SpooledTemporaryFile with the compressed bytes, positioned at 0 (close it when done).
+    - sha256: The SHA-256 checksum of the uncompressed input.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=spill_threshold, mode='w+b')
+    c = compressor(codec, level)
+    sha256 = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(chunk_size), b''):
+        sha256.update(chunk)
+        buffer.write(c.compress(chunk))
+    buffer.write(c.flush())
+    buffer.seek(0)
+    return buffer, sha256.hexdigest()
+
+def upload_metadata(metadata, codec, stored_sha256):
+    """metadata (with the uncompressed sha256) extended with the codec and the sha256 of the stored bytes."""
+    return dict(metadata or {}, compression=codec, **{'stored-sha256': stored_sha256})
@@ -1,71 +1,110 @@
 import io
+import os
 import hashlib
-import pandas as pd
+import tempfile
 import json
-import torch
-import numpy as np
-
-def contains_numpy_or_torch(data):
-    """Recursively check if a dictionary contains any numpy arrays or torch tensors."""
-    if isinstance(data, dict):
-        for value in data.values():
-            if isinstance(value, (np.ndarray, torch.Tensor)):
-                return True
-            if isinstance(value, dict):
-                if contains_numpy_or_torch(value):
-                    return True
-            if isinstance(value, list):
-                if any(isinstance(item, (np.ndarray, torch.Tensor)) for item in value):
-                    return True
-                if any(isinstance(item, dict) and contains_numpy_or_torch(item) for item in value):
-                    return True
-    return False
-
-def prepare_data_for_upload(data, hash_length, data_format=None):
+
+from . import serializers
+from . import compression as C
+from .serializers import contains_numpy_or_torch
+
+# serialized data stays in memory up to this size, larger payloads spill to a temporary file
+SPILL_THRESHOLD = 64 * 1024 * 1024
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+def hash_buffer(buffer, chunk_size=HASH_CHUNK_SIZE):
+    '''sha256 and size of a seekable binary buffer, without copying it (memoryview for BytesIO, chunked reads otherwise).'''
+    sha256 = hashlib.sha256()
+    if isinstance(buffer, io.BytesIO):
+        with buffer.getbuffer() as view:
+            sha256.update(view)
+            size = view.nbytes
+    else:
+        buffer.seek(0)
+        size = 0
+        for chunk in iter(lambda: buffer.read(chunk_size), b''):
+            sha256.update(chunk)
+            size += len(chunk)
+    buffer.seek(0)
+    return sha256.hexdigest(), size
+
+class _BufferReader(io.RawIOBase):
+    # raw reader over the public read / seek / tell of a binary file object
+    def __init__(self, buffer):
+        super().__init__()
+        self.buffer = buffer
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.buffer.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.buffer.seek(offset, whence)
+
+    def tell(self):
+        return self.buffer.tell()
+
+def buffer_reader(buffer):
+    '''
+    A binary io object reading buffer (e.g., a SpooledTemporaryFile) from its current position.
+
+    SpooledTemporaryFile only implements the io interface (readable(), readinto(), ...) needed by
+    io.TextIOWrapper and most readers from Python 3.11 on; other buffers are wrapped in an
+    io.BufferedReader over their read / seek / tell. Closing the reader leaves buffer open.
+    '''
+    if isinstance(buffer, io.IOBase):
+        return buffer
+    return io.BufferedReader(_BufferReader(buffer))
+
+def prepare_data_for_upload(data, hash_length, data_format=None, spill_threshold=SPILL_THRESHOLD, compression=None,
+                            compression_level=None):
     """
     Prepare data for upload to S3 without writing to a file.
+
+    Data is serialized into a SpooledTemporaryFile: it stays in memory up to spill_threshold
+    bytes and spills to a temporary file beyond that, so large payloads cost about one copy
+    (the data itself) in RAM. Hashing reads the buffer in place or in fixed-size chunks.
     
     Parameters:
-    - data: The data to be uploaded. Can be a DataFrame, dict, or PyTorch tensor.
-    - data_format: The format of the data ('.csv' for DataFrames, '.json' for dicts, '.pth' for PyTorch tensors).
+    - data: The data to be uploaded. Can be a DataFrame, dict, numpy array, or PyTorch tensor.
+    - data_format: The format of the data ('.csv' for DataFrames, '.json' for dicts, '.pth' for PyTorch tensors,
+                   or any other format in the serializers registry, e.g., '.npy', '.parquet', '.safetensors').
+
+    - spill_threshold: Serialized data larger than this many bytes is written to a temporary file.
+    - compression: 'gzip' or 'zstd' to compress the serialized data (see compression.py), None to upload it as is.
+    - compression_level: The compression level (codec default if None).
     
     Returns:
-    - buffer: The buffer containing the data ready for upload.
-    - sha256sum: The SHA-256 checksum of the data.
+    - buffer: The buffer containing the data ready for upload (close it when done to remove any spill file).
+    - sha256sum: The SHA-256 checksum of the data (of the serialized data before compression).
     """
     # Determine the data format if not provided
     if data_format is None:
-        if isinstance(data, pd.DataFrame):
-            data_format = '.csv'
-        elif isinstance(data, dict):
-            if contains_numpy_or_torch(data):
-                data_format = '.pth'
-            else:
-                data_format = '.json'
-        else:
-            raise ValueError(f"Unsupported data type: {type(data)}")
-
-    buffer = io.BytesIO()
-    sha256 = hashlib.sha256()
+        data_format = serializers.infer_format(data)
 
-    if data_format == '.csv' and isinstance(data, pd.DataFrame):
-        data.to_csv(buffer, index=False)
-    elif data_format == '.json' and isinstance(data, dict):
-        buffer.write(json.dumps(data).encode('utf-8'))
-    elif data_format == '.pth' and isinstance(data, dict):
-        torch.save(data, buffer)
-    else:
-        raise ValueError(f"Unsupported data format: {data_format} or data type: {type(data)}")
+    buffer = tempfile.SpooledTemporaryFile(max_size=spill_threshold, mode='w+b')
+
+    serializers.dump(data, buffer, data_format)
     
-    # Compute SHA-256 checksum
-    buffer.seek(0)
-    sha256.update(buffer.read())
-    full_hash = sha256.hexdigest()
+    if C.check_codec(compression) is not None:
+        # the serialized data is hashed while it is compressed
+        with buffer:
+            buffer.seek(0)
+            buffer, full_hash = C.compress_fileobj(buffer, compression, level=compression_level,
+                                                   spill_threshold=spill_threshold)
+    else:
+        # Compute SHA-256 checksum (leaves the buffer at the beginning)
+        full_hash, _ = hash_buffer(buffer)
 
+    readable_hash = full_hash
     if isinstance(hash_length, (int)):
         readable_hash = full_hash[0:hash_length] 
-
-    # Reset buffer position to the beginning
-    buffer.seek(0)
     
     return buffer, full_hash, readable_hash, data_format
\ No newline at end of file
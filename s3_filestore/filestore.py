@@ -1,28 +1,50 @@
 import os
+import time
 import boto3
 from tqdm import tqdm
 import posixpath
 import botocore.exceptions
 import hashlib
 import json
-import pandas as pd
 from pprint import pformat
 from pathlib import Path
+from collections import namedtuple
 from urllib.parse import urljoin, urlparse, urlunparse
 
-from pdb import set_trace
-
 from . import functional as F
 from . import auth
 from . import api
-from .utils import get_object_name_with_hash_id, parse_s3_url
-from .data import prepare_data_for_upload
+from . import clients
+from . import retry
+from . import metrics
+from . import transfer
+from . import compression as C
+from .utils import get_object_name_with_hash_id, get_file_hash, parse_s3_uri
+from .data import prepare_data_for_upload, hash_buffer, SPILL_THRESHOLD
+from .cache import get_cache, CACHE_MAX_AGE
+from .inventory import get_inventory, INVENTORY_MAX_AGE
+from .objcache import ObjectCache
+from .sync import sync_to_s3, sync_from_s3, list_remote
+from .remote import open_object, BLOCK_SIZE, CACHE_BLOCKS, MAX_READAHEAD
+from .serializers import CSV_CHUNKSIZE, CSV_BLOCK_SIZE
+
+# per-file result of S3FileStore.upload_files; status is 'uploaded', 'skipped' or 'failed'
+UploadResult = namedtuple('UploadResult', ['filename', 'key', 'url', 'status', 'bytes', 'seconds', 'error'])
 
 class S3FileStore(object):
-    def __init__(self, bucket_name, profile='wasabi', endpoint_url=None, acl='public-read', hash_length=10, cache_dir=None, expires_in_seconds=3600):        
+    def __init__(self, bucket_name, profile='wasabi', endpoint_url=None, acl='public-read', hash_length=10, cache_dir=None, expires_in_seconds=3600,
+                 max_workers=transfer.DEFAULT_MAX_WORKERS, multipart_threshold=transfer.MULTIPART_THRESHOLD,
+                 multipart_chunksize=transfer.MULTIPART_CHUNKSIZE, cache_max_bytes=None, max_pool_connections=None,
+                 inventory=None, inventory_max_age=INVENTORY_MAX_AGE, object_cache=None, cache_max_age=CACHE_MAX_AGE,
+                 compression=None):
         if cache_dir is None: cache_dir = F.CACHE_DIR
+        if inventory is True: inventory = get_inventory()
+        elif isinstance(inventory, str): inventory = get_inventory(inventory)
+        if object_cache is True: object_cache = ObjectCache()
 
         self.cache_dir = cache_dir
+        self.cache = get_cache(cache_dir, max_bytes=cache_max_bytes)
+        self.cache_max_age = cache_max_age
         self.profile = profile
         if endpoint_url is None:
             self.endpoint_url = auth.WASABI_ENDPOINT if 'wasabi' in profile else auth.AWS_ENDPOINT
@@ -32,96 +54,286 @@ class S3FileStore(object):
         self.acl = acl
         self.expires_in_seconds = expires_in_seconds
         self.hash_length = hash_length
+        self.max_workers = max_workers
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.max_pool_connections = max_pool_connections
+        self.inventory = inventory
+        self.inventory_max_age = inventory_max_age
+        self.object_cache = object_cache
+        self.compression = C.check_codec(compression)
         self.bucket_name = bucket_name
         self.set_session_bucket()
 
     def set_session_bucket(self):
-        # temporary session without region name
-        tmp_session = auth.get_session_with_userdata(self.profile, region_name=None)
-        # get region name for this bucket, add to endpoint_url
-        region_name = auth.get_bucket_region(tmp_session, self.bucket_name, self.endpoint_url)
+        # get region name for this bucket (cached per process), add to endpoint_url
+        region_name = clients.get_bucket_region(self.bucket_name, profile=self.profile, endpoint_url=self.endpoint_url)
         if region_name is not None:
             endpoint_url = self.endpoint_url.replace("s3.", f"s3.{region_name}.")
         else:
             endpoint_url = self.endpoint_url
-        # now we can start a proper session and setup bucket access:
+        # sessions, clients and resources are shared by every store with the same profile/endpoint/region
         self.bucket_region = region_name
-        self.session = auth.get_session_with_userdata(self.profile, region_name=region_name)
-        self.s3_client = self.session.client('s3', endpoint_url=endpoint_url)
-        self.s3 = self.session.resource('s3', endpoint_url=endpoint_url)
+        self.session = clients.get_session(self.profile, region_name=region_name)
+        self.s3_client = clients.get_client(self.profile, endpoint_url=endpoint_url, region_name=region_name,
+                                            max_pool_connections=self.max_pool_connections)
+        self.s3 = clients.get_resource(self.profile, endpoint_url=endpoint_url, region_name=region_name,
+                                       max_pool_connections=self.max_pool_connections)
+        # worker threads only use the bucket's name, region and client (see clients.py)
         self.bucket = self.s3.Bucket(self.bucket_name)
         self.bucket.region = region_name
 
-    def list_objects(self, prefix='', depth=None, directory_filter=None, verbose=False):
+    def list_objects(self, prefix='', depth=None, directory_filter=None, verbose=False, parallel=False, max_workers=None):
         """
         List objects in an S3 bucket with optional depth and directory exclusion.
 
         Parameters:
         - prefix: The prefix (subfolder) to filter objects.
-        - depth: The maximum depth of subfolders to include.
-        - include_directories: Whether to include directories in the listing.
+        - depth: The depth of subfolders to include (None for all).
+        - directory_filter: Filter to include everything (None), directories only (True), or files only (False).
+        - parallel: Partition the key space and list the partitions concurrently (for very large prefixes).
+        - max_workers: The number of concurrent listings when parallel (defaults to self.max_workers).
         """
+        if self.inventory is not None:
+            objects = []
+            for key in self.iter_objects(prefix=prefix, depth=depth, directory_filter=directory_filter):
+                if verbose: print(key)
+                objects.append(key)
+            return objects
+
+        if max_workers is None and parallel: max_workers = self.max_workers
         objects = F.list_objects(self.bucket,
                                  prefix=prefix,
                                  depth=depth,
                                  directory_filter=directory_filter,
-                                 verbose=verbose)
+                                 verbose=verbose,
+                                 max_workers=max_workers)
 
         return objects  
+
+    def iter_objects(self, prefix='', depth=None, directory_filter=None, parallel=False, max_workers=None):
+        """
+        Like list_objects, but yields keys page by page so memory stays flat on huge prefixes.
+
+        With an inventory, keys are answered from it (refreshed first if staler than inventory_max_age).
+        """
+        if self.inventory is not None:
+            return F.filter_keys(self.inventory_keys(prefix), prefix=prefix, depth=depth, directory_filter=directory_filter)
+        if max_workers is None and parallel: max_workers = self.max_workers
+        return F.iter_objects(self.bucket, prefix=prefix, depth=depth, directory_filter=directory_filter, max_workers=max_workers)
+
+    def refresh_inventory(self, prefix='', full=None):
+        """
+        List prefix into the inventory: only keys after the last seen key, or everything if full
+        (by default a full refresh is made once per inventory.full_refresh_interval).
+        """
+        if self.inventory is None:
+            raise ValueError("This S3FileStore has no inventory (pass inventory=True)")
+        return self.inventory.refresh(self.s3_client, self.bucket.name, prefix=F.normalize_prefix(prefix), full=full)
+
+    def inventory_keys(self, prefix=''):
+        """The keys under prefix according to the inventory, refreshing it first if it is stale."""
+        prefix = F.normalize_prefix(prefix)
+        if not self.inventory.is_fresh(self.bucket.name, prefix, max_age=self.inventory_max_age):
+            self.refresh_inventory(prefix)
+        return self.inventory.keys(self.bucket.name, prefix)
     
     def file_exists(self, key):
+        if self.inventory is not None and self.inventory.is_fresh(self.bucket.name, key, max_age=self.inventory_max_age):
+            return self.inventory.get(self.bucket.name, key) is not None
         return F.file_exists(self.s3_client, self.bucket.name, key)
     
-    def list_urls(self, prefix='', depth=None, verbose=False):
-        objects = self.list_objects(prefix=prefix, depth=depth, include_directories=False, verbose=verbose)
-        urls = [auth.generate_url(self.s3_client, self.bucket.name, bucket_key, bucket_region=self.bucket.region, 
-                                  profile=self.profile, expires_in_seconds=self.expires_in_seconds) 
-                for bucket_key in objects]
+    def iter_urls(self, prefix='', depth=None, assume_default_acl=False, batch_size=F.LIST_PAGE_SIZE):
+        """
+        Yield urls for the objects under prefix, resolving them in batches of batch_size keys as the listing streams.
+
+        ACL lookups are done concurrently and cached; with assume_default_acl=True, objects whose ACL
+        is not already known are assumed to have the store's acl (no lookups at all).
+        """
+        batch = []
+        for bucket_key in self.iter_objects(prefix=prefix, depth=depth, directory_filter=False):
+            batch.append(bucket_key)
+            if len(batch) == batch_size:
+                for url in self._generate_urls(batch, assume_default_acl): yield url
+                batch = []
+        for url in self._generate_urls(batch, assume_default_acl): yield url
+
+    def _generate_urls(self, bucket_keys, assume_default_acl=False):
+        if not bucket_keys: return []
+        return auth.generate_urls(self.s3_client, self.bucket.name, bucket_keys, bucket_region=self.bucket.region,
+                                  profile=self.profile, expires_in_seconds=self.expires_in_seconds,
+                                  default_acl=self.acl if assume_default_acl else None, max_workers=self.max_workers)
+
+    def list_urls(self, prefix='', depth=None, verbose=False, assume_default_acl=False):
+        """
+        List urls for the objects under prefix (see iter_urls).
+        """
+        urls = []
+        for url in self.iter_urls(prefix=prefix, depth=depth, assume_default_acl=assume_default_acl):
+            if verbose: print(url)
+            urls.append(url)
         return urls 
+
+    def iter_s3_urls(self, prefix='', depth=None):
+        for bucket_key in self.iter_objects(prefix=prefix, depth=depth, directory_filter=False):
+            yield f"s3://{self.bucket.name}/{bucket_key}"
     
     def list_s3_urls(self, prefix='', depth=None, verbose=False):
-        objects = self.list_objects(prefix=prefix, depth=depth, include_directories=False, verbose=verbose)
-        urls = [f"s3://{self.bucket.name}/{bucket_key}" for bucket_key in objects]
+        urls = []
+        for url in self.iter_s3_urls(prefix=prefix, depth=depth):
+            if verbose: print(url)
+            urls.append(url)
         return urls
 
-    def load_file(self, filename, cache_dir=None, progress=True, check_hash=True):
+    def load_file(self, filename, cache_dir=None, progress=True, check_hash=True, cache=True, spill_threshold=SPILL_THRESHOLD):
+        """
+        Load a local file, an https:// url or an s3:// url with the loader registered for its extension.
+
+        With cache=False, urls are loaded from memory instead of through the download cache (see load_object).
+        """
         if cache_dir is None: cache_dir = self.cache_dir
         if filename.startswith("https://"):
+            if not cache:
+                buffer = F.download_url_to_buffer(filename, progress=progress, check_hash=check_hash, spill_threshold=spill_threshold)
+                return F.load_buffer(buffer, urlparse(filename).path)
             local_filename = self.download_url(filename, cache_dir=cache_dir, progress=progress, check_hash=check_hash)
             return F.load_file(local_filename)
         elif filename.startswith("s3://"):
-            bucket_name, bucket_key = parse_s3_url(filename)
+            bucket_name, bucket_key = parse_s3_uri(filename)
+            return self._load_object(bucket_name, bucket_key, cache_dir=cache_dir, progress=progress, check_hash=check_hash,
+                                     cache=cache, spill_threshold=spill_threshold)
+        return F.load_file(filename)
+
+    @metrics.timed('load_object')
+    def load_object(self, bucket_key, cache_dir=None, progress=True, check_hash=True, cache=True, spill_threshold=SPILL_THRESHOLD):
+        """
+        Download (if needed) and load an object with the loader registered for its extension.
+
+        With cache=False the object is not written to the download cache: its body is streamed into a
+        buffer that stays in memory up to spill_threshold bytes (and spills to an anonymous temporary
+        file beyond that), its sha256 is checked as the bytes arrive, and it is deserialized from the
+        buffer. Use it for objects that are read once, or on machines with little or slow local disk.
+        Memory-mapped formats (.npy, .feather, .safetensors) are read into memory in this mode.
+
+        With an object_cache (see objcache.ObjectCache), unchanged objects are returned from memory: hash-suffixed
+        keys without any request, other keys after a HEAD request comparing the ETag.
+
+        Parameters:
+        - bucket_key: The object key.
+        - cache_dir: The download cache directory (cache=True).
+        - progress: Whether to display a progress bar.
+        - check_hash: Verify the sha256 against the key's hash suffix or the object's sha256 metadata.
+        - cache: Whether to go through the download cache.
+        - spill_threshold: The number of bytes kept in memory before spilling to a temporary file (cache=False).
+        """
+        return self._load_object(self.bucket.name, bucket_key, cache_dir=cache_dir, progress=progress, check_hash=check_hash,
+                                 cache=cache, spill_threshold=spill_threshold)
+
+    def _load_object(self, bucket_name, bucket_key, cache_dir=None, progress=True, check_hash=True, cache=True,
+                     spill_threshold=SPILL_THRESHOLD):
+        if self.object_cache is not None:
+            version = F.get_object_version(self.s3_client, bucket_name, bucket_key, hash_length=self.hash_length)
+            hit, value = self.object_cache.get(bucket_name, bucket_key, version)
+            if hit:
+                return value
+
+        if not cache:
+            buffer = F.download_object_to_buffer(self.s3_client, bucket_name, bucket_key, progress=progress,
+                                                 check_hash=check_hash, spill_threshold=spill_threshold)
+            value = F.load_buffer(buffer, bucket_key)
+        else:
+            if cache_dir is None: cache_dir = self.cache_dir
             bucket_region = self.bucket.region if bucket_name==self.bucket.name else None
             local_filename = F.download_object(self.s3_client, bucket_name, bucket_key, self.profile, bucket_region=bucket_region,
-                                               cache_dir=cache_dir, progress=progress, check_hash=check_hash)
-            return F.load_file(local_filename)
-        return F.load_file(filename)
+                                               cache_dir=cache_dir, progress=progress, check_hash=check_hash,
+                                               max_age=self.cache_max_age, hash_length=self.hash_length)
+            value = F.load_file(local_filename)
 
-    def load_object(self, bucket_key, cache_dir=None, progress=True, check_hash=True):
-        if cache_dir is None: cache_dir = self.cache_dir
-        local_filename = F.download_object(self.s3_client, self.bucket.name, bucket_key, self.profile, bucket_region=self.bucket.region,
-                                           cache_dir=cache_dir, progress=progress, check_hash=check_hash)
-        return F.load_file(local_filename)
+        if self.object_cache is not None:
+            value = self.object_cache.put(bucket_name, bucket_key, version, value)
+        return value
+
+    def open(self, bucket_key, mode='rb', block_size=BLOCK_SIZE, cache_blocks=CACHE_BLOCKS, max_readahead=MAX_READAHEAD):
+        """
+        Open an object as a seekable, read-only file that fetches only the byte ranges it reads (see remote.S3RangeFile).
+
+        Readers work on it directly, e.g. pd.read_csv(f, nrows=10) or torch.load(f), and stop transferring
+        as soon as they stop reading. Memory-mapped loading needs a local file (use load_object).
+
+        Parameters:
+        - bucket_key: The object key.
+        - mode: 'rb' (or 'r' for utf-8 text).
+        - block_size: The unit of fetching and caching, in bytes.
+        - cache_blocks: The number of blocks kept in the file's LRU block cache.
+        - max_readahead: The maximum number of bytes fetched ahead of sequential reads.
+        """
+        return open_object(self.s3_client, self.bucket.name, bucket_key, mode=mode, block_size=block_size,
+                           cache_blocks=cache_blocks, max_readahead=max_readahead)
+
+    def iter_csv(self, bucket_key, columns=None, engine='c', chunksize=CSV_CHUNKSIZE, block_size=CSV_BLOCK_SIZE, as_arrow=False,
+                 check_hash=True, **kwargs):
+        """
+        Iterate over a CSV object in chunks, parsed while its body streams in (nothing is written to disk).
+
+        For results too large to download and load at once: each chunk can be processed (and dropped)
+        before the next one arrives, e.g. sum(chunk['loss'].sum() for chunk in s3.iter_csv(key, columns=['loss'])).
+
+        Parameters:
+        - bucket_key: The object key.
+        - columns: Only parse these columns (None for all).
+        - engine: 'c' or 'python' (pandas.read_csv), or 'pyarrow' (multithreaded pyarrow.csv.open_csv).
+        - chunksize: The number of rows per chunk (pandas engines).
+        - block_size: The number of bytes of CSV per chunk (pyarrow engine).
+        - as_arrow: Yield pyarrow.RecordBatch instead of DataFrame (pyarrow engine).
+        - check_hash: Verify the sha256 once the whole object has been read (raises after the last chunk).
+        - kwargs: Passed to the parser.
+        """
+        return F.iter_csv(self.s3_client, self.bucket.name, bucket_key, check_hash=check_hash, columns=columns, engine=engine,
+                          chunksize=chunksize, block_size=block_size, as_arrow=as_arrow, **kwargs)
 
     def download_object(self, bucket_key, cache_dir=None, progress=True, check_hash=True):
         if cache_dir is None: cache_dir = self.cache_dir
         return F.download_object(self.s3_client, self.bucket.name, bucket_key, self.profile,
                                  bucket_region=self.bucket.region, cache_dir=cache_dir, 
-                                 progress=progress, check_hash=check_hash)
+                                 progress=progress, check_hash=check_hash, max_age=self.cache_max_age,
+                                 hash_length=self.hash_length)
 
-    def download_objects(self, objects, cache_dir=None, progress=True, check_hash=True):
-        filenames = [self.download_object(object_key, cache_dir=cache_dir, progress=progress, check_hash=check_hash) 
-                     for object_key in objects]
+    def download_objects(self, objects, cache_dir=None, progress=True, check_hash=True, max_workers=None, return_errors=False):
+        """
+        Download objects concurrently with one combined progress bar.
+
+        Failed downloads do not stop the batch: their filename is None and the errors
+        are reported at the end (or returned as (object_key, exception) pairs if return_errors=True).
+        """
+        if cache_dir is None: cache_dir = self.cache_dir
+        if max_workers is None: max_workers = self.max_workers
+        filenames, errors = F.download_objects(self.s3_client, self.bucket.name, list(objects), self.profile,
+                                               bucket_region=self.bucket.region, cache_dir=cache_dir, progress=progress,
+                                               check_hash=check_hash, expires_in_seconds=self.expires_in_seconds,
+                                               max_workers=max_workers, max_age=self.cache_max_age, hash_length=self.hash_length)
+        if return_errors:
+            return filenames, errors
+        transfer.report_errors(errors)
 
         return filenames
 
     def download_url(self, url, cache_dir=None, progress=True, check_hash=True):
         if cache_dir is None: cache_dir = self.cache_dir
-        return F.download_if_needed(url, cache_dir=cache_dir, progress=progress, check_hash=check_hash)
+        return F.download_if_needed(url, cache_dir=cache_dir, progress=progress, check_hash=check_hash,
+                                    max_age=self.cache_max_age, hash_length=self.hash_length)
 
-    def download_urls(self, urls, cache_dir=None, progress=True, check_hash=True):
-        filenames = [self.download_url(url, cache_dir=cache_dir, progress=progress, check_hash=check_hash) 
-                     for url in urls]
+    def download_urls(self, urls, cache_dir=None, progress=True, check_hash=True, max_workers=None, return_errors=False):
+        """
+        Download urls concurrently with one combined progress bar (see download_objects).
+        """
+        if cache_dir is None: cache_dir = self.cache_dir
+        if max_workers is None: max_workers = self.max_workers
+        filenames, errors = F.download_urls(list(urls), cache_dir=cache_dir, progress=progress,
+                                            check_hash=check_hash, max_workers=max_workers, max_age=self.cache_max_age,
+                                            hash_length=self.hash_length)
+        if return_errors:
+            return filenames, errors
+        transfer.report_errors(errors)
         
         return filenames    
     
@@ -133,42 +345,190 @@ class S3FileStore(object):
         
         return metadata
             
-    def upload_file(self, local_filename, bucket_subfolder, new_filename=None, acl=None, hash_length=None, verbose=True, profile=None, expires_in_seconds=None):        
+    def upload_file(self, local_filename, bucket_subfolder, new_filename=None, acl=None, hash_length=None, verbose=True, profile=None, expires_in_seconds=None,
+                    compression=None, compression_level=None):
         if acl is None: acl = self.acl
+        if compression is None: compression = self.compression
         if hash_length is None: hash_length = self.hash_length
         if not bucket_subfolder.endswith('/'): bucket_subfolder += '/'
         if profile is None: profile = self.profile
         if expires_in_seconds is None: expires_in_seconds = self.expires_in_seconds
 
+        # the object name needs the hash before the upload starts, so the file cannot be hashed on the way up
+        # (see F.upload_file); the full hash comes from the persistent hash index when the file is unchanged
+        # since it was last hashed, and is passed on as metadata so F.upload_file does not hash it again
+        full_hash = get_file_hash(local_filename)
         object_name = get_object_name_with_hash_id(local_filename, object_name=new_filename, hash_length=hash_length)
         object_key = urljoin(bucket_subfolder, object_name)
         object_url = F.upload_file(self.s3_client, self.bucket, local_filename, object_key, acl=acl, 
-                                   verbose=verbose, profile=profile, expires_in_seconds=expires_in_seconds)
+                                   verbose=verbose, profile=profile, expires_in_seconds=expires_in_seconds,
+                                   metadata={"sha256": full_hash},
+                                   multipart_threshold=self.multipart_threshold,
+                                   multipart_chunksize=self.multipart_chunksize,
+                                   max_concurrency=self.max_workers,
+                                   inventory=self.inventory, inventory_max_age=self.inventory_max_age,
+                                   compression=compression, compression_level=compression_level)
 
         return object_url
 
-    def upload_files(self, filenames, bucket_subfolder, acl=None, hash_length=None, verbose=True, profile=None, expires_in_seconds=None):
+    def upload_files(self, filenames, bucket_subfolder, acl=None, hash_length=None, verbose=True, profile=None, expires_in_seconds=None,
+                     max_workers=None, compression=None, compression_level=None):
+        """
+        Upload many files as one batch.
+
+        Files are hashed concurrently (unchanged files hit the hash index), each target subfolder is listed
+        once to decide which files already exist with the same size, the rest are uploaded on a bounded
+        thread pool, and urls are generated in bulk.
+
+        Parameters:
+        - filenames: The local files.
+        - bucket_subfolder: One subfolder for all files, or a list with one subfolder per file.
+        - max_workers: The number of concurrent hashing / upload workers (defaults to self.max_workers).
+        - compression: 'gzip' or 'zstd' (defaults to the store's compression; False to disable). Compressed objects
+                       are listed with their compressed size, so an existing object with the file's key is skipped.
+        - compression_level: The compression level (codec default if None).
+
+        Returns:
+        - One UploadResult(filename, key, url, status, bytes, seconds, error) per file, in input order,
+          with status 'uploaded', 'skipped' or 'failed'.
+        """
+        if acl is None: acl = self.acl
+        if hash_length is None: hash_length = self.hash_length
+        if profile is None: profile = self.profile
+        if expires_in_seconds is None: expires_in_seconds = self.expires_in_seconds
+        if max_workers is None: max_workers = self.max_workers
+        if compression is None: compression = self.compression
+        compression = C.check_codec(compression)
+        filenames = list(filenames)
         if isinstance(bucket_subfolder, (str)):
             bucket_subfolders = [bucket_subfolder]*len(filenames)
-        elif isinstance(bucket_subfolders, (list,tuple)):
-            bucket_subfolders = bucket_subfolder
+        elif isinstance(bucket_subfolder, (list,tuple)):
+            bucket_subfolders = list(bucket_subfolder)
+            if len(bucket_subfolders) != len(filenames):
+                raise ValueError(f"Got {len(bucket_subfolders)} bucket_subfolders for {len(filenames)} files")
+        else:
+            raise TypeError(f"bucket_subfolder must be a str or a list of str, got {type(bucket_subfolder)}")
+        bucket_subfolders = [subfolder if subfolder.endswith('/') else subfolder + '/' for subfolder in bucket_subfolders]
 
-        urls = [self.upload_file(local_filename, bucket_subfolder, acl=acl, hash_length=hash_length, verbose=verbose, 
-                                 profile=profile, expires_in_seconds=expires_in_seconds)
-                for local_filename,bucket_subfolder in zip(filenames, bucket_subfolders)]
-        return urls
+        # hash concurrently (hashlib releases the GIL while hashing)
+        def plan(idx):
+            local_filename = filenames[idx]
+            full_hash = get_file_hash(local_filename)
+            object_name = get_object_name_with_hash_id(local_filename, hash_length=hash_length)
+            return urljoin(bucket_subfolders[idx], object_name), full_hash, os.path.getsize(local_filename)
+        plans, errors = transfer.run_batch(plan, range(len(filenames)), max_workers=max_workers)
+        results = [None] * len(filenames)
+        for idx, e in errors:
+            results[idx] = UploadResult(filenames[idx], None, None, 'failed', 0, 0.0, e)
+
+        # one listing per subfolder decides skip vs upload
+        remote = {}
+        for subfolder in sorted(set(bucket_subfolders)):
+            remote.update(list_remote(self.s3_client, self.bucket.name, F.normalize_prefix(subfolder)))
+
+        to_upload, skipped = [], []
+        for idx, p in enumerate(plans):
+            if p is None: continue
+            object_key, _, size = p
+            if object_key in remote and (compression is not None or remote[object_key][0] == size):
+                skipped.append(idx)
+            else:
+                to_upload.append(idx)
+
+        def upload(idx):
+            object_key, full_hash, size = plans[idx]
+            start = time.time()
+            url = F.upload_file(self.s3_client, self.bucket, filenames[idx], object_key, acl=acl, verbose=False,
+                                profile=profile, expires_in_seconds=expires_in_seconds, metadata={"sha256": full_hash},
+                                multipart_threshold=self.multipart_threshold, multipart_chunksize=self.multipart_chunksize,
+                                max_concurrency=max_workers, inventory=self.inventory, check_existing=False,
+                                compression=compression, compression_level=compression_level)
+            return UploadResult(filenames[idx], object_key, url, 'uploaded', size, time.time() - start, None)
+        uploaded, upload_errors = transfer.run_batch(upload, to_upload, max_workers=max_workers)
+        for idx, result in zip(to_upload, uploaded):
+            if result is not None: results[idx] = result
+        for idx, e in upload_errors:
+            results[idx] = UploadResult(filenames[idx], plans[idx][0], None, 'failed', 0, 0.0, e)
+
+        skipped_keys = [plans[idx][0] for idx in skipped]
+        for idx, url in zip(skipped, auth.generate_urls(self.s3_client, self.bucket.name, skipped_keys, bucket_region=self.bucket.region,
+                                                        profile=profile, expires_in_seconds=expires_in_seconds,
+                                                        max_workers=max_workers) if skipped_keys else []):
+            results[idx] = UploadResult(filenames[idx], plans[idx][0], url, 'skipped', 0, 0.0, None)
+
+        if verbose:
+            for result in results:
+                print(f"{result.status}: {result.filename} -> {result.key}" + (f" ({result.error!r})" if result.error else ""))
+            counts = {status: sum(r.status == status for r in results) for status in ('uploaded', 'skipped', 'failed')}
+            print(f"{counts['uploaded']} uploaded ({sum(r.bytes for r in results)} bytes), {counts['skipped']} skipped, "
+                  f"{counts['failed']} failed")
+
+        return results
+
+    def sync(self, local_dir, bucket_subfolder, include=None, exclude=None, delete=False, dry_run=False, acl=None, hash_length=None,
+             max_workers=None, verbose=True, compression=None, compression_level=None):
+        """
+        Upload the new or modified files of local_dir to bucket_subfolder (see sync.sync_to_s3).
+
+        Files keep the upload_file naming convention (name-<hash_id>.ext); the diff comes from one listing
+        of bucket_subfolder and the hash index, so unchanged files are neither read nor re-uploaded.
+
+        Parameters:
+        - local_dir: The local directory to push.
+        - bucket_subfolder: The destination prefix.
+        - include, exclude: Glob patterns over paths relative to local_dir.
+        - delete: Also delete the objects under bucket_subfolder that no local file maps to.
+        - dry_run: Only return what would be uploaded and deleted.
+        - compression: 'gzip' or 'zstd' (defaults to the store's compression; False to disable).
+        """
+        if acl is None: acl = self.acl
+        if compression is None: compression = self.compression
+        if hash_length is None: hash_length = self.hash_length
+        if max_workers is None: max_workers = self.max_workers
+        return sync_to_s3(self.s3_client, self.bucket, local_dir, bucket_subfolder, hash_length=hash_length, acl=acl,
+                          profile=self.profile, expires_in_seconds=self.expires_in_seconds, include=include, exclude=exclude,
+                          delete=delete, dry_run=dry_run, max_workers=max_workers, verbose=verbose,
+                          multipart_threshold=self.multipart_threshold, multipart_chunksize=self.multipart_chunksize,
+                          inventory=self.inventory, compression=compression, compression_level=compression_level)
+
+    def sync_download(self, bucket_subfolder, local_dir, include=None, exclude=None, delete=False, dry_run=False, hash_length=None,
+                      max_workers=None, verbose=True):
+        """
+        Download the new or modified objects under bucket_subfolder into local_dir (see sync.sync_from_s3);
+        hash ids are stripped from the local filenames, so sync_download reverses sync.
+        """
+        if hash_length is None: hash_length = self.hash_length
+        if max_workers is None: max_workers = self.max_workers
+        return sync_from_s3(self.s3_client, self.bucket.name, bucket_subfolder, local_dir, hash_length=hash_length,
+                            include=include, exclude=exclude, delete=delete, dry_run=dry_run, max_workers=max_workers,
+                            verbose=verbose)
 
     def update_object_acl(self, object_key, acl, verbose=True):
         return api.update_object_acl(self.s3_client, self.bucket.name, object_key, acl, verbose=verbose)
 
-    def upload_data(self, data, bucket_key, data_format=None, acl=None, hash_length=None, verbose=True, profile=None, expires_in_seconds=None, add_hash_suffix=False):
+    @metrics.timed('upload_data')
+    def upload_data(self, data, bucket_key, data_format=None, acl=None, hash_length=None, verbose=True, profile=None, expires_in_seconds=None, add_hash_suffix=False,
+                    spill_threshold=None, compression=None, compression_level=None):
+        """
+        Serialize data (see serializers.py) and upload it to bucket_key.
+
+        With compression ('gzip' or 'zstd', defaulting to the store's compression; False to disable), the
+        serialized bytes are compressed before the upload and stored with Content-Encoding set: the key
+        keeps its extension, downloads decompress it transparently, and the sha256 metadata and hash id
+        still refer to the uncompressed data (see compression.py).
+        """
         if acl is None: acl = self.acl
+        if compression is None: compression = self.compression
         if hash_length is None: hash_length = self.hash_length
         if profile is None: profile = self.profile
         if expires_in_seconds is None: expires_in_seconds = self.expires_in_seconds
+        if spill_threshold is None: spill_threshold = SPILL_THRESHOLD
 
         # get the buffer and hash_id
-        buf, full_hash, hash_id, data_format = prepare_data_for_upload(data, hash_length, data_format=data_format)
+        with metrics.timer('serialize'):
+            buf, full_hash, hash_id, data_format = prepare_data_for_upload(data, hash_length, data_format=data_format,
+                                                                           spill_threshold=spill_threshold, compression=compression,
+                                                                           compression_level=compression_level)
         
         # new filename with hash_id
         path = Path(bucket_key)
@@ -181,16 +541,64 @@ class S3FileStore(object):
         
         bucket_key = urljoin(bucket_subfolder, filename)
 
-        url = F.upload_buffer(self.s3_client, self.bucket, buf, bucket_key, acl=acl, 
-                              verbose=verbose, profile=profile, 
-                              metadata={"sha256": full_hash},
-                              expires_in_seconds=expires_in_seconds)
+        with buf:
+            metadata = {"sha256": full_hash}
+            compression = C.check_codec(compression)
+            if compression is not None:
+                stored_hash, _ = hash_buffer(buf)
+                metadata = C.upload_metadata(metadata, compression, stored_hash)
+            url = F.upload_buffer(self.s3_client, self.bucket, buf, bucket_key, acl=acl,
+                                  verbose=verbose, profile=profile,
+                                  metadata=metadata,
+                                  expires_in_seconds=expires_in_seconds,
+                                  multipart_threshold=self.multipart_threshold,
+                                  multipart_chunksize=self.multipart_chunksize,
+                                  max_concurrency=self.max_workers,
+                                  inventory=self.inventory, inventory_max_age=self.inventory_max_age,
+                                  content_encoding=compression)
 
         return bucket_key, url
 
+    def retry_stats(self):
+        """Process-wide retry, throttle and failure counts, and the current adaptive concurrency limit (see retry.py)."""
+        return retry.snapshot()
+
+    def stats(self, reset=False):
+        """
+        Process-wide metrics of every store (clients and caches are shared): per-operation and per-API-call
+        counts, latencies and bytes, cache hits / misses and retry counts (see metrics.py).
+
+        Parameters:
+        - reset: Reset the metrics after taking the snapshot.
+        """
+        snapshot = metrics.snapshot()
+        if reset: metrics.reset()
+        return snapshot
+
+    def add_metrics_exporter(self, exporter):
+        """Call exporter(event) for every timed operation and API call (see metrics.Event and metrics.print_exporter)."""
+        return metrics.add_exporter(exporter)
+
+    def remove_metrics_exporter(self, exporter):
+        metrics.remove_exporter(exporter)
+
+    def cache_info(self):
+        """Number of entries, total bytes and byte budget of the local cache."""
+        return self.cache.cache_info()
+
+    def prune(self, max_bytes=None, older_than=None):
+        """
+        Evict entries from the local cache.
+
+        Parameters:
+        - max_bytes: Evict least recently used files until the cache fits (defaults to cache_max_bytes).
+        - older_than: Also evict files not accessed within this many seconds.
+        """
+        return self.cache.prune(max_bytes=max_bytes, older_than=older_than)
+
     def __repr__(self):
         return (f"{self.__class__.__name__}(bucket_name={self.bucket_name!r}, profile={self.profile!r}, "
                 f"endpoint_url={self.endpoint_url!r}, bucket_region={self.bucket_region!r},\n"
                 f"\t acl={self.acl!r}, expires_in_seconds={self.expires_in_seconds!r}, hash_length={self.hash_length!r}, "
-                f"cache_dir={self.cache_dir!r})")
+                f"cache_dir={self.cache_dir!r}, max_workers={self.max_workers!r})")
 
@@ -1,85 +1,293 @@
 import os
 import sys
-import torch
-import pandas as pd
 import requests
 import botocore
 import re
 import json 
+import string
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 
-from torch.hub import download_url_to_file
 from typing import Any, Callable, Dict, List, Mapping, Optional, Type, TypeVar, Union
 from urllib.parse import urlparse
 
 from . import auth
 from . import api
+from . import retry
+from . import metrics
+from . import transfer
+from . import serializers
+from . import compression as C
+from .cache import get_cache, cache_key_for_url, CACHE_MAX_AGE
+from .hashindex import get_hash_index
+from .inventory import INVENTORY_MAX_AGE
+from .utils import HashingReader, strip_hash_id
+from .data import SPILL_THRESHOLD, hash_buffer, buffer_reader
+from .remote import open_stream
 
 HASH_REGEX = re.compile(r'-([a-f0-9]*)\.')
-CACHE_DIR = torch.hub.get_dir().replace("/hub", "/results")
 
+def get_cache_dir():
+    '''torch.hub.get_dir().replace("/hub", "/results"), resolved without importing torch unless it is already loaded.'''
+    if 'torch' in sys.modules:
+        return sys.modules['torch'].hub.get_dir().replace("/hub", "/results")
+    torch_home = os.getenv('TORCH_HOME', os.path.join(os.getenv('XDG_CACHE_HOME', '~/.cache'), 'torch'))
+    return os.path.join(os.path.expanduser(torch_home), 'results')
+
+CACHE_DIR = get_cache_dir()
+
+@metrics.timed()
 def download_object(s3_client, bucket_name, bucket_key, profile, bucket_region=None, 
-                    cache_dir=None, progress=True, check_hash=True, expires_in_seconds=3600):
+                    cache_dir=None, progress=True, check_hash=True, expires_in_seconds=3600, progress_bar=None,
+                    max_age=CACHE_MAX_AGE, hash_length=None):
     if cache_dir is None: cache_dir = CACHE_DIR
     url = auth.generate_url(s3_client, bucket_name, bucket_key, bucket_region=bucket_region, profile=profile, expires_in_seconds=expires_in_seconds)    
-    response = download_if_needed(url, cache_dir=cache_dir, progress=progress, check_hash=check_hash)
+    response = download_if_needed(url, cache_dir=cache_dir, progress=progress, check_hash=check_hash, progress_bar=progress_bar,
+                                  max_age=max_age, hash_length=hash_length)
     return response
 
-def download_if_needed(url, cache_dir=None, progress=True, check_hash=True) -> Mapping[str, Any]:
+def download_objects(s3_client, bucket_name, bucket_keys, profile, bucket_region=None, cache_dir=None, progress=True,
+                     check_hash=True, expires_in_seconds=3600, max_workers=None, max_age=CACHE_MAX_AGE, hash_length=None):
+    '''Download many objects concurrently, sharing one s3_client and one progress bar.
+
+      Returns the local filenames in input order (None for failed downloads) and a list of (bucket_key, exception) errors.
+      The cache is pruned once after the batch, so none of the returned files is evicted by a later download of the batch.
+    '''
+    if cache_dir is None: cache_dir = CACHE_DIR
+    with get_cache(cache_dir).batch(), \
+         transfer.ProgressBar(desc=f"Downloading {len(bucket_keys)} files", disable=not progress) as progress_bar:
+        def download(bucket_key):
+            return download_object(s3_client, bucket_name, bucket_key, profile, bucket_region=bucket_region,
+                                   cache_dir=cache_dir, progress=False, check_hash=check_hash,
+                                   expires_in_seconds=expires_in_seconds, progress_bar=progress_bar,
+                                   max_age=max_age, hash_length=hash_length)
+        filenames, errors = transfer.run_batch(download, bucket_keys, max_workers=max_workers)
+
+    return filenames, errors
+
+def download_urls(urls, cache_dir=None, progress=True, check_hash=True, max_workers=None, max_age=CACHE_MAX_AGE, hash_length=None):
+    '''Download many urls concurrently with one combined progress bar.
+
+      Returns the local filenames in input order (None for failed downloads) and a list of (url, exception) errors.
+      The cache is pruned once after the batch, so none of the returned files is evicted by a later download of the batch.
+    '''
+    if cache_dir is None: cache_dir = CACHE_DIR
+    with get_cache(cache_dir).batch(), \
+         transfer.ProgressBar(desc=f"Downloading {len(urls)} files", disable=not progress) as progress_bar:
+        def download(url):
+            return download_if_needed(url, cache_dir=cache_dir, progress=False, check_hash=check_hash, progress_bar=progress_bar,
+                                      max_age=max_age, hash_length=hash_length)
+        filenames, errors = transfer.run_batch(download, urls, max_workers=max_workers)
+
+    return filenames, errors
+
+def download_if_needed(url, cache_dir=None, progress=True, check_hash=True, progress_bar=None, max_age=CACHE_MAX_AGE,
+                       hash_length=None) -> Mapping[str, Any]:
     '''Download a file given a url. 
 
-      File is stored in the cache_dir, which defaults to torch.hub.get_dir().replace("/hub", "/results").      
+      File is stored in the cache_dir, which defaults to torch.hub.get_dir().replace("/hub", "/results"),
+      under <bucket>/<key> and is tracked by the cache's index (see cache.CacheManager).
+
+      Cached files of keys with a hash id (of hash_length hex digits, if given) never change and are used as is.
+      Other cached files are used for max_age seconds after they were downloaded or last revalidated (None: forever);
+      after that, a conditional request (If-None-Match with the cached ETag) either confirms them with an empty
+      304 response or downloads the new version. If that request fails with a transient error, the cached file is used.
     '''  
     if cache_dir is None: cache_dir = CACHE_DIR
 
-    os.makedirs(cache_dir, exist_ok=True)
+    cache = get_cache(cache_dir)
+    bucket_name, bucket_key = cache_key_for_url(url)
+    cache_filename = cache.lookup(bucket_name, bucket_key)
+    entry = None
+    if cache_filename is not None:
+        immutable = strip_hash_id(os.path.basename(bucket_key), hash_length=hash_length)[1] is not None
+        if immutable or cache.is_fresh(bucket_name, bucket_key, max_age=max_age):
+            metrics.cache_hit('download_cache', True)
+            return cache_filename
+        entry = cache.get_entry(bucket_name, bucket_key)
+
+    if entry is None:
+        cache_filename = cache.cache_path(bucket_name, bucket_key)
+        os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
+        if progress_bar is None: sys.stderr.write(f'Downloading: "{url}" to {cache_filename}\n')
+    hash_prefix = None
+    if check_hash:
+        r = HASH_REGEX.search(os.path.basename(cache_filename))  # r is Optional[Match[str]]
+        hash_prefix = r.group(1) if r else None
 
-    filename = os.path.basename(urlparse(url).path)
-    cache_filename = os.path.join(cache_dir, filename)
+    # without a hash in the filename, the downloader falls back to the object's sha256 metadata
+    # Last-Modified has a resolution of one second, so it is only used for entries without an ETag
+    conditions = {}
+    if entry is not None and entry['etag']: conditions['if_none_match'] = entry['etag']
+    elif entry is not None and entry['last_modified']: conditions['if_modified_since'] = entry['last_modified']
+    try:
+        with metrics.timer('download') as timing:
+            info = transfer.download_url_to_file(url, cache_filename, hash_prefix, progress=progress, progress_bar=progress_bar,
+                                                 check_metadata_hash=check_hash, **conditions)
+            if info is not None: timing.bytes_in = os.path.getsize(cache_filename)
+    except Exception as e:
+        if entry is None or not retry.is_retryable(e):
+            raise
+        sys.stderr.write(f'Could not revalidate {cache_filename} ({e!r}), using the cached file\n')
+        info = None
 
-    if not os.path.exists(cache_filename):
-        sys.stderr.write(f'Downloading: "{url}" to {cache_filename}\n')
-        hash_prefix = None
-        if check_hash:
-            r = HASH_REGEX.search(filename)  # r is Optional[Match[str]]
-            hash_prefix = r.group(1) if r else None
-        if hash_prefix is None:
-            hash_prefix = api.get_s3_url_metadata(url, key='sha256')
-            
-        download_url_to_file(url, cache_filename, hash_prefix, progress=progress)
+    if entry is not None:
+        metrics.cache_hit('revalidation', info is None)
+    metrics.cache_hit('download_cache', info is None)
+    if info is None:
+        cache.mark_validated(bucket_name, bucket_key)
+    else:
+        cache.add(bucket_name, bucket_key, etag=info['etag'], sha256=info['sha256'], last_modified=info['last_modified'])
 
     return cache_filename
 
-def upload_file(s3_client, bucket, local_filename, object_key, acl=None, verbose=True, profile='wasabi', expires_in_seconds=3600):        
-    
-    # try getting the remote file size and comparing to local
-    # if remote not found (404), continue and upload the file
+def download_object_to_buffer(s3_client, bucket_name, bucket_key, progress=True, check_hash=True, progress_bar=None,
+                              spill_threshold=SPILL_THRESHOLD):
+    '''Download bucket_name/bucket_key into a buffer (in memory up to spill_threshold bytes), bypassing the download cache.
+
+      The sha256 is checked while the body streams in, against the key's hash suffix or the object's sha256 metadata.
+      Returns the binary buffer positioned at 0; close it when done.
+    '''
+    hash_prefix = None
+    if check_hash:
+        r = HASH_REGEX.search(os.path.basename(bucket_key))
+        hash_prefix = r.group(1) if r else None
+
+    with metrics.timer('download') as timing:
+        buffer, info = transfer.download_object_to_buffer(s3_client, bucket_name, bucket_key, hash_prefix, progress=progress,
+                                                          progress_bar=progress_bar, check_metadata_hash=check_hash,
+                                                          spill_threshold=spill_threshold)
+        timing.bytes_in = info['size'] or 0
+    return buffer
+
+def download_url_to_buffer(url, progress=True, check_hash=True, progress_bar=None, spill_threshold=SPILL_THRESHOLD):
+    '''Download url into a buffer (in memory up to spill_threshold bytes), bypassing the download cache.'''
+    hash_prefix = None
+    if check_hash:
+        r = HASH_REGEX.search(os.path.basename(urlparse(url).path))
+        hash_prefix = r.group(1) if r else None
+
+    with metrics.timer('download') as timing:
+        buffer, info = transfer.download_url_to_buffer(url, hash_prefix, progress=progress, progress_bar=progress_bar,
+                                                       check_metadata_hash=check_hash, spill_threshold=spill_threshold)
+        timing.bytes_in = info['size'] or 0
+    return buffer
+
+def iter_csv(s3_client, bucket_name, bucket_key, check_hash=True, buffer_size=transfer.CHUNK_SIZE, **kwargs):
+    '''Stream bucket_name/bucket_key through serializers.iter_csv, yielding chunks while the body downloads.
+
+      With check_hash, the sha256 (of the key's hash suffix, or the object's sha256 metadata) is checked once
+      the whole object has been read, so a mismatch raises after the last chunk.
+    '''
+    hash_prefix = None
+    if check_hash:
+        r = HASH_REGEX.search(os.path.basename(bucket_key))
+        hash_prefix = r.group(1) if r else None
+
+    with open_stream(s3_client, bucket_name, bucket_key, hash_prefix=hash_prefix, check_metadata_hash=check_hash,
+                     buffer_size=buffer_size) as f:
+        yield from serializers.iter_csv(f, **kwargs)
+
+@metrics.timed()
+def get_remote_size(bucket, object_key, inventory=None, inventory_max_age=INVENTORY_MAX_AGE):
+    '''The size of bucket/object_key, or None if it does not exist.
+
+      With an inventory that covers object_key and was refreshed within inventory_max_age seconds,
+      the size is answered locally instead of with a HEAD request.
+    '''
+    if inventory is not None:
+        fresh = inventory.is_fresh(bucket.name, object_key, max_age=inventory_max_age)
+        metrics.cache_hit('inventory', fresh)
+        if fresh:
+            entry = inventory.get(bucket.name, object_key)
+            return entry['size'] if entry is not None else None
     try:
-        s3_file_size = bucket.Object(object_key).content_length
-        local_file_size = os.path.getsize(local_filename)
-        if s3_file_size == local_file_size:
-            object_url = auth.generate_url(s3_client, bucket.name, object_key, bucket_region=bucket.region, 
-                                           profile=profile, expires_in_seconds=expires_in_seconds)
-            if verbose: 
-                print(f"The file '{object_key}' already exists in the S3 bucket '{bucket.name}' and has the same size. The file will not be re-uploaded.\n")
-                print(object_url+"\n")
-            return object_url
+        return retry.call(bucket.meta.client.head_object, Bucket=bucket.name, Key=object_key)['ContentLength']
     except botocore.exceptions.ClientError as e:
         if e.response['Error']['Code'] == "404":
             # The key does not exist.
-            pass
+            return None
         elif e.response['Error']['Code'] == 403:
             # Unauthorized, including invalid bucket
             raise e
         else:
-          # Something else has gone wrong.
-          raise e
+            # Something else has gone wrong.
+            raise e
 
-    # Upload the file
-    if metadata is not None:
-        bucket.Object(object_key).put(Body=open(local_filename, 'rb'), ACL=acl, Metadata=metadata)
-    else:
-        bucket.Object(object_key).put(Body=open(local_filename, 'rb'), ACL=acl)
+@metrics.timed()
+def upload_file(s3_client, bucket, local_filename, object_key, acl=None, verbose=True, profile='wasabi', expires_in_seconds=3600, metadata=None,
+                multipart_threshold=transfer.MULTIPART_THRESHOLD, multipart_chunksize=transfer.MULTIPART_CHUNKSIZE,
+                max_concurrency=transfer.DEFAULT_MAX_WORKERS, inventory=None, inventory_max_age=INVENTORY_MAX_AGE,
+                check_existing=True, compression=None, compression_level=None):
+    '''Upload a local file, skipping the upload if an object of the same size already exists.
+
+      Files of at least multipart_threshold bytes are sent as a parallel multipart upload
+      (multipart_chunksize bytes per part, max_concurrency parts in flight). With an inventory,
+      the existence check is answered from it when fresh and the uploaded object is recorded in it.
+      Pass check_existing=False when the caller already knows the object has to be uploaded.
+
+      With compression ('gzip' or 'zstd'), the file is compressed into a buffer and uploaded with
+      Content-Encoding set (see compression.py); the existence check then compares the compressed size.
+    '''
+    if C.check_codec(compression) is not None:
+        with open(local_filename, 'rb') as f:
+            buf, sha256 = C.compress_fileobj(f, compression, level=compression_level)
+        with buf:
+            stored_sha256, _ = hash_buffer(buf)
+            metadata = C.upload_metadata(dict(metadata or {}, sha256=sha256), compression, stored_sha256)
+            return upload_buffer(s3_client, bucket, buf, object_key, acl=acl, verbose=verbose, profile=profile,
+                                 expires_in_seconds=expires_in_seconds, metadata=metadata, multipart_threshold=multipart_threshold,
+                                 multipart_chunksize=multipart_chunksize, max_concurrency=max_concurrency, inventory=inventory,
+                                 inventory_max_age=inventory_max_age, check_existing=check_existing, content_encoding=compression)
+
+    # try getting the remote file size and comparing to local
+    # if remote not found (404), continue and upload the file
+    s3_file_size = None
+    if check_existing:
+        s3_file_size = get_remote_size(bucket, object_key, inventory=inventory, inventory_max_age=inventory_max_age)
+    local_file_size = os.path.getsize(local_filename)
+    if s3_file_size == local_file_size:
+        object_url = auth.generate_url(s3_client, bucket.name, object_key, bucket_region=bucket.region,
+                                       profile=profile, expires_in_seconds=expires_in_seconds)
+        if verbose:
+            print(f"The file '{object_key}' already exists in the S3 bucket '{bucket.name}' and has the same size. The file will not be re-uploaded.\n")
+            print(object_url+"\n")
+        return object_url
+
+    # Upload the file; the sha256 comes from the metadata or the hash index, and only
+    # files missing from both are hashed, on the way up (S3FileStore.upload_file passes the
+    # sha256 as metadata: it needs the hash before uploading, to name the object)
+    stat = os.stat(local_filename)
+    put_args = dict(ACL=acl) if metadata is None else dict(ACL=acl, Metadata=metadata)
+    sha256 = metadata.get('sha256') if metadata is not None else None
+    index = get_hash_index() if sha256 is None else None
+    if index is not None:
+        sha256 = index.get(local_filename, stat=stat)
+        metrics.cache_hit('hash_index', sha256 is not None)
+        if sha256 is not None: index = None
+    with open(local_filename, 'rb') as f, metrics.timer('upload') as timing:
+        timing.bytes_out = stat.st_size
+        if multipart_threshold is not None and stat.st_size >= multipart_threshold:
+            reader = HashingReader(f) if index is not None else f
+            response = transfer.multipart_upload(s3_client, bucket.name, object_key, reader, size=stat.st_size, acl=acl, metadata=metadata,
+                                                 part_size=multipart_chunksize, max_concurrency=max_concurrency)
+            if index is not None:
+                sha256 = reader.hexdigest()
+                index.put(local_filename, sha256, stat=stat)
+        else:
+            # the file is streamed from disk (rewound for every attempt), never held in memory,
+            # and hashed as it is read
+            reader = HashingReader(f) if index is not None else f
+            def put():
+                reader.seek(0)
+                return s3_client.put_object(Bucket=bucket.name, Key=object_key, Body=reader, **put_args)
+            response = retry.call(put)
+            if index is not None:
+                sha256 = reader.hexdigest() if reader.bytes_hashed == stat.st_size else hash_buffer(f)[0]
+                index.put(local_filename, sha256, stat=stat)
+    auth.remember_object_acl(s3_client, bucket.name, object_key, acl)
+    if inventory is not None:
+        inventory.put(bucket.name, object_key, stat.st_size, etag=response.get('ETag'), sha256=sha256)
         
     object_url = auth.generate_url(s3_client, bucket.name, object_key, bucket_region=bucket.region, 
                                    profile=profile, expires_in_seconds=expires_in_seconds)
@@ -89,54 +297,72 @@ def upload_file(s3_client, bucket, local_filename, object_key, acl=None, verbose
     
     return object_url  
 
-def upload_buffer(s3_client, bucket, buf, object_key, acl=None, verbose=True, profile='wasabi', expires_in_seconds=3600, metadata=None):
+@metrics.timed()
+def upload_buffer(s3_client, bucket, buf, object_key, acl=None, verbose=True, profile='wasabi', expires_in_seconds=3600, metadata=None,
+                  multipart_threshold=transfer.MULTIPART_THRESHOLD, multipart_chunksize=transfer.MULTIPART_CHUNKSIZE,
+                  max_concurrency=transfer.DEFAULT_MAX_WORKERS, inventory=None, inventory_max_age=INVENTORY_MAX_AGE,
+                  check_existing=True, content_encoding=None):
     """
     Upload a buffer to an S3 bucket, comparing sizes to avoid redundant uploads.
     
     Parameters:
     - s3_client: The S3 client.
     - bucket: The S3 bucket object.
-    - buf: The buffer containing the data to upload.
+    - buf: The buffer containing the data to upload (any seekable binary file object, e.g., a BytesIO
+           or the SpooledTemporaryFile returned by prepare_data_for_upload).
     - object_key: The key for the S3 object.
     - acl: The ACL for the uploaded object.
     - verbose: Whether to print verbose messages.
     - profile: The profile to use for generating the URL.
     - expires_in_seconds: The expiry time for the generated URL.
+    - metadata: Metadata for the uploaded object (e.g., {"sha256": ...}).
+    - multipart_threshold: Buffers of at least this many bytes are streamed as a multipart upload.
+    - multipart_chunksize: The part size for multipart uploads.
+    - max_concurrency: The maximum number of parts in flight.
+    - inventory: An Inventory answering the existence check when fresh, and recording the upload.
+    - inventory_max_age: The staleness bound (in seconds) for answering from the inventory.
+    - check_existing: Whether to skip the upload if an object of the same size exists (False if the caller already knows).
+    - content_encoding: The Content-Encoding of compressed buffers ('gzip' or 'zstd', see compression.py).
     
     Returns:
     - The URL of the uploaded object.
     """
     
-    # Move the buffer to the beginning
+    # Size the buffer without copying it
+    buf.seek(0, os.SEEK_END)
+    buffer_size = buf.tell()
     buf.seek(0)
-    buffer_size = len(buf.getvalue())
     
-    try:
-        s3_file_size = bucket.Object(object_key).content_length
-        if s3_file_size == buffer_size:
-            object_url = auth.generate_url(s3_client, bucket.name, object_key, bucket_region=bucket.region, 
-                                           profile=profile, expires_in_seconds=expires_in_seconds)
-            if verbose: 
-                print(f"The file '{object_key}' already exists in the S3 bucket '{bucket.name}' and has the same size. The file will not be re-uploaded.\n")
-                print(object_url + "\n")
-            return object_url
-    except botocore.exceptions.ClientError as e:
-        if e.response['Error']['Code'] == "404":
-            # The key does not exist.
-            pass
-        elif e.response['Error']['Code'] == 403:
-            # Unauthorized, including invalid bucket
-            raise e
-        else:
-            # Something else has gone wrong.
-            raise e
+    s3_file_size = None
+    if check_existing:
+        s3_file_size = get_remote_size(bucket, object_key, inventory=inventory, inventory_max_age=inventory_max_age)
+    if s3_file_size == buffer_size:
+        object_url = auth.generate_url(s3_client, bucket.name, object_key, bucket_region=bucket.region,
+                                       profile=profile, expires_in_seconds=expires_in_seconds)
+        if verbose:
+            print(f"The file '{object_key}' already exists in the S3 bucket '{bucket.name}' and has the same size. The file will not be re-uploaded.\n")
+            print(object_url + "\n")
+        return object_url
 
     # Upload the buffer
     buf.seek(0)
-    if metadata is not None:
-        bucket.Object(object_key).put(Body=buf, ACL=acl, Metadata=metadata)
-    else:
-        bucket.Object(object_key).put(Body=buf, ACL=acl, Metadata=metadata)
+    with metrics.timer('upload') as timing:
+        timing.bytes_out = buffer_size
+        if multipart_threshold is not None and buffer_size >= multipart_threshold:
+            response = transfer.multipart_upload(s3_client, bucket.name, object_key, buf, size=buffer_size, acl=acl, metadata=metadata,
+                                                 part_size=multipart_chunksize, max_concurrency=max_concurrency,
+                                                 content_encoding=content_encoding)
+        else:
+            put_args = dict(ACL=acl) if metadata is None else dict(ACL=acl, Metadata=metadata)
+            if content_encoding is not None: put_args['ContentEncoding'] = content_encoding
+            def put():
+                buf.seek(0)
+                return s3_client.put_object(Bucket=bucket.name, Key=object_key, Body=buf, **put_args)
+            response = retry.call(put)
+    auth.remember_object_acl(s3_client, bucket.name, object_key, acl)
+    if inventory is not None:
+        inventory.put(bucket.name, object_key, buffer_size, etag=response.get('ETag'),
+                      sha256=metadata.get('sha256') if metadata is not None else None)
     object_url = auth.generate_url(s3_client, bucket.name, object_key, bucket_region=bucket.region, 
                                    profile=profile, expires_in_seconds=expires_in_seconds)
     if verbose: 
@@ -145,33 +371,241 @@ def upload_buffer(s3_client, bucket, buf, object_key, acl=None, verbose=True, pr
     
     return object_url    
 
-def load_file(filename):
+@metrics.timed()
+def load_file(filename, **kwargs):
+    '''Load a local file with the loader registered for its extension (see serializers.register_format).'''
     local_filename = filename    
     
     assert os.path.isfile(local_filename), f"File not found: {local_filename}"
 
-    if local_filename.endswith(".csv"):
-        df = pd.read_csv(local_filename)
-        return df
-    elif local_filename.endswith(".json"):
-        with open(local_filename, 'r') as file:
-            data = json.load(file)
-        return data
-    elif local_filename.endswith(".txt"):
-        with open(local_filename, 'r') as file:
-            lines = file.readlines()
-
-        # Print each line or process them as needed
-        for line in lines:
-            print(line.strip())  # .strip() removes leading/trailing whitespace including newlines
-        return lines
-    elif local_filename.endswith(".pth") or local_filename.endswith(".pt") or local_filename.endswith(".pth.tar"):
-        data = torch.load(local_filename, map_location='cpu')
-        return data
-    else:
-        raise ValueError(f'Filetype must be one of csv, json, txt, pth, pt, pth.tar, np, got {local_filename}')      
+    return serializers.load(local_filename, **kwargs)
+
+@metrics.timed()
+def load_buffer(buffer, filename, **kwargs):
+    '''Load a downloaded buffer with the loader registered for the extension of filename, then close the buffer.'''
+    try:
+        # loaders wrap file objects (e.g. in io.TextIOWrapper), which needs the full io interface
+        return serializers.load(buffer_reader(buffer), data_format=filename, **kwargs)
+    finally:
+        buffer.close()
+
+LIST_PAGE_SIZE = 1000
+
+def normalize_prefix(prefix):
+    # make sure prefix ends with / (an empty prefix lists the whole bucket)
+    prefix = prefix.strip("/")
+    return prefix + "/" if prefix else ""
+
+def filter_keys(keys, prefix='', depth=None, directory_filter=True):
+    """
+    Apply list_objects' depth / directory_filter semantics to an iterable of keys (all starting with prefix).
+
+    Objects are yielded in the order of keys; directories (directory_filter=True) are yielded sorted,
+    once all keys have been seen.
+    """
+    prefix = normalize_prefix(prefix)
+    directories = set()
+
+    for key in keys:
+        # Calculate the depth of the object's key relative to the prefix
+        relative_key = key[len(prefix):]
+        key_depth = relative_key.count('/')
+
+        if directory_filter:
+            # Track implicit directories
+            implicit_folders = relative_key.split("/")[0:key_depth]
+            for d in range(0, key_depth):
+                if depth is None or d==depth:
+                    directories.add(prefix + "/".join(implicit_folders[0:d+1]) + "/")
+            continue
+
+        # Check if the key is directly within the specified depth
+        if depth is None or key_depth == depth:
+            # Directory filter logic
+            if directory_filter is None:
+                pass  # Include everything
+            elif not directory_filter and key.endswith('/'):
+                continue  # Skip directories if directory_filter is False
+            yield key
+
+    if directory_filter:
+        for directory in sorted(directories):
+            yield directory
+
+def iter_objects(bucket, prefix='', depth=None, directory_filter=True, page_size=LIST_PAGE_SIZE, max_workers=None):
+    """
+    Stream the keys (or directories) under prefix, page by page.
+
+    With a depth, the listing uses list_objects_v2 with Delimiter='/' and descends one level at a
+    time through CommonPrefixes, so only the keys at the requested depth (and the folders above it)
+    are fetched, not everything below it. Without a depth every key under prefix is listed.
+    Keys are yielded in lexicographic order.
+
+    Parameters:
+    - bucket: The S3 bucket object.
+    - prefix: The prefix (subfolder) to filter objects.
+    - depth: The depth of subfolders to include (0 = directly under prefix, None = all).
+    - directory_filter: Filter to include everything (None), directories only (True), or files only (False).
+    - page_size: The number of keys requested per page.
+    - max_workers: List partitions of the key space concurrently on this many workers (see iter_objects_parallel).
+    """
+    if max_workers is not None and max_workers > 1:
+        for key in iter_objects_parallel(bucket, prefix=prefix, depth=depth, directory_filter=directory_filter,
+                                         page_size=page_size, max_workers=max_workers):
+            yield key
+        return
+
+    client = bucket.meta.client
+    paginator = client.get_paginator('list_objects_v2')
+    prefix = normalize_prefix(prefix)
+
+    def pages(level_prefix, delimiter=None):
+        kwargs = dict(Bucket=bucket.name, Prefix=level_prefix, PaginationConfig={'PageSize': page_size})
+        if delimiter is not None: kwargs['Delimiter'] = delimiter
+        return paginator.paginate(**kwargs)
+
+    if depth is None:
+        keys = (obj['Key'] for page in pages(prefix) for obj in page.get('Contents', []))
+        for key in filter_keys(keys, prefix=prefix, depth=depth, directory_filter=directory_filter):
+            yield key
+        return
+
+    def walk(level_prefix, level):
+        for page in pages(level_prefix, delimiter='/'):
+            if level < depth:
+                for common_prefix in page.get('CommonPrefixes', []):
+                    for key in walk(common_prefix['Prefix'], level + 1):
+                        yield key
+            elif directory_filter:
+                # directories at this depth are exactly the CommonPrefixes of this level
+                for common_prefix in page.get('CommonPrefixes', []):
+                    yield common_prefix['Prefix']
+            else:
+                keys = (obj['Key'] for obj in page.get('Contents', []))
+                for key in filter_keys(keys, prefix=prefix, depth=depth, directory_filter=directory_filter):
+                    yield key
 
-def list_objects(bucket, prefix='', depth=None, directory_filter=True, verbose=True):
+    for key in walk(prefix, 0):
+        yield key
+
+# parallel listings split key ranges at later characters of the same class
+SPLIT_CHARACTER_CLASSES = (string.digits, string.ascii_lowercase, string.ascii_uppercase)
+
+def shared_prefix(a, b):
+    n = 0
+    while n < min(len(a), len(b)) and a[n] == b[n]: n += 1
+    return a[:n]
+
+def list_level(client, bucket_name, prefix, page_size=LIST_PAGE_SIZE):
+    """All keys and CommonPrefixes directly under prefix (Delimiter='/')."""
+    keys, common_prefixes = [], []
+    paginator = client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, Delimiter='/', PaginationConfig={'PageSize': page_size}):
+        keys.extend(obj['Key'] for obj in page.get('Contents', []))
+        common_prefixes.extend(p['Prefix'] for p in page.get('CommonPrefixes', []))
+    return keys, common_prefixes
+
+def iter_objects_parallel(bucket, prefix='', depth=None, directory_filter=True, page_size=LIST_PAGE_SIZE, max_workers=8):
+    """
+    Parallel version of iter_objects, with the same depth / directory_filter semantics and sorted output.
+
+    With a depth, each level of CommonPrefixes is listed concurrently. Without a depth, the key
+    space under prefix is partitioned into ranges (start_after, end]: a range whose first page is
+    truncated is split after its last key and the sub-ranges are listed concurrently, recursively,
+    so large listings scale with the number of workers. Results are merged back in key order.
+
+    Split points are the subfolders (CommonPrefixes) that follow the last key, discovered with a
+    Delimiter='/' request in the folder the page's keys share (or its parents); flat folders are
+    split at characters seen in the keys listed so far. Both keep the number of empty ranges
+    (wasted requests) small.
+    """
+    client = bucket.meta.client
+    prefix = normalize_prefix(prefix)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if depth is not None:
+            level_prefixes = [prefix]
+            for level in range(depth):
+                results = executor.map(lambda p: list_level(client, bucket.name, p, page_size), level_prefixes)
+                level_prefixes = [p for _, common_prefixes in results for p in common_prefixes]
+            for keys, common_prefixes in executor.map(lambda p: list_level(client, bucket.name, p, page_size), level_prefixes):
+                if directory_filter:
+                    for common_prefix in common_prefixes:
+                        yield common_prefix
+                else:
+                    for key in filter_keys(keys, prefix=prefix, depth=depth, directory_filter=directory_filter):
+                        yield key
+            return
+
+        def folder_of(key):
+            return key[:max(key.rfind('/') + 1, len(prefix))]
+
+        def folder_split_points(keys, end):
+            # subfolders after the last key (and before end): looked up first in the deepest folder shared by the
+            # page's keys, then in its parents up to the deepest folder shared with end
+            last_key = keys[-1]
+            top = folder_of(shared_prefix(last_key, end)) if end is not None else prefix
+            folder = folder_of(shared_prefix(keys[0], last_key))
+            if not any('/' in key[len(folder):] for key in keys):
+                # a page of files without subfolders, most likely a flat folder
+                return []
+            while True:
+                response = client.list_objects_v2(Bucket=bucket.name, Prefix=folder, Delimiter='/', StartAfter=last_key, MaxKeys=page_size)
+                points = [p['Prefix'] for p in response.get('CommonPrefixes', [])
+                          if p['Prefix'] > last_key and (end is None or p['Prefix'] < end)]
+                if points:
+                    # subfolders smaller than a page (judging by the ones in this page) are grouped into one range
+                    subfolders = set(key[len(folder):].split('/', 1)[0] for key in keys if '/' in key[len(folder):])
+                    step = max(1, page_size * len(subfolders) // len(keys)) if subfolders else 1
+                    return points[step - 1::step] if len(points) >= step else points[-1:]
+                if len(folder) <= len(top):
+                    return points
+                folder = folder_of(folder[:-1])
+
+        def character_split_points(keys, last_key, end):
+            # last_key's prefixes extended by a later character of the same class (digits, lower or upper case
+            # letters), deepest first since they are the likeliest to be non-empty, at most max_workers of them
+            shallowest = len(shared_prefix(last_key, end)) if end is not None else len(prefix)
+            deepest = min(len(shared_prefix(keys[0], last_key)), len(last_key) - 1)
+            points = []
+            for n in range(deepest, shallowest - 1, -1):
+                characters = next((c for c in SPLIT_CHARACTER_CLASSES if last_key[n] in c), '')
+                points.extend(p for p in (last_key[:n] + c for c in characters if c > last_key[n])
+                              if end is None or p < end)
+                if len(points) >= max_workers: break
+            return sorted(points[:max_workers])
+
+        def list_range(start_after, end):
+            # one page of keys in (start_after, end]; if there is more, split the remainder into sub-ranges
+            kwargs = dict(Bucket=bucket.name, Prefix=prefix, MaxKeys=page_size)
+            if start_after is not None: kwargs['StartAfter'] = start_after
+            response = client.list_objects_v2(**kwargs)
+            keys = [obj['Key'] for obj in response.get('Contents', [])]
+            if end is not None and keys and keys[-1] > end:
+                return [key for key in keys if key <= end], []
+            if not response.get('IsTruncated') or not keys:
+                return keys, []
+
+            last_key = keys[-1]
+            split_points = folder_split_points(keys, end) or character_split_points(keys, last_key, end)
+            bounds = [last_key] + split_points + [end]
+            subranges = [executor.submit(list_range, lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:])]
+            return keys, subranges
+
+        def ordered_keys(future):
+            keys, subranges = future.result()
+            for key in keys:
+                yield key
+            for subrange in subranges:
+                for key in ordered_keys(subrange):
+                    yield key
+
+        keys = ordered_keys(executor.submit(list_range, None, None))
+        for key in filter_keys(keys, prefix=prefix, depth=depth, directory_filter=directory_filter):
+            yield key
+
+@metrics.timed()
+def list_objects(bucket, prefix='', depth=None, directory_filter=True, verbose=True, max_workers=None):
         """
         List objects in an S3 bucket with optional depth and directory exclusion.
 
@@ -180,48 +614,20 @@ def list_objects(bucket, prefix='', depth=None, directory_filter=True, verbose=T
         - depth: The maximum depth of subfolders to include.
         - directory_filter: Filter to include everything (None), directories only (True), or files only (False).
         - verbose: Whether to print the object keys.
+        - max_workers: If given, list partitions of the key space concurrently (see iter_objects_parallel).
         """
         objects = []
-        directories = set()
-        
-        # make sure prefix ends with /
-        prefix = prefix.strip("/") + "/"
-        
-        # iterate over objects with this prefix
-        for obj in bucket.objects.filter(Prefix=prefix):
-            # Calculate the depth of the object's key relative to the prefix
-            relative_key = obj.key[len(prefix):]
-            key_depth = relative_key.count('/')
-            
-            # Track implicit directories 
-            implicit_folders = relative_key.split("/")[0:key_depth]
-            for d in range(0, key_depth):
-                folder = prefix + "/".join(implicit_folders[0:d+1]) + "/"
-                if folder not in obj.key: continue
-                if depth is None or d==depth:
-                    directories.add(folder)
-
-            # Check if the key is directly within the specified depth
-            if depth is None or key_depth == depth:
-                # Directory filter logic
-                if directory_filter is None:
-                    pass  # Include everything
-                elif directory_filter and not obj.key.endswith('/'):
-                    continue  # Skip files if directory_filter is True
-                elif not directory_filter and obj.key.endswith('/'):
-                    continue  # Skip directories if directory_filter is False
-
-                if verbose: 
-                    print(obj.key)
-                objects.append(obj.key)
+        for key in iter_objects(bucket, prefix=prefix, depth=depth, directory_filter=directory_filter, max_workers=max_workers):
+            if verbose:
+                print(key)
+            objects.append(key)
         
-        if directory_filter:
-            return sorted(list(directories))
         return objects  
     
+@metrics.timed()
 def file_exists(s3_client, bucket_name, key):
     try:
-        s3_client.head_object(Bucket=bucket_name, Key=key)
+        retry.call(s3_client.head_object, Bucket=bucket_name, Key=key)
         return True
     except ClientError as e:
         if e.response['Error']['Code'] == '404':
@@ -230,4 +636,14 @@ def file_exists(s3_client, bucket_name, key):
             # Something else has gone wrong.
             print(f"An error occurred: {e}")
             raise
-            
\ No newline at end of file
+
+def get_object_version(s3_client, bucket_name, key, hash_length=None):
+    '''An identifier of the content of bucket_name/key: 'sha256:<hash id>' for hash-suffixed keys (no request needed,
+      their content never changes), otherwise the ETag from a HEAD request.
+
+      hash_length: Only treat suffixes of exactly this many hex digits as hash ids (see utils.strip_hash_id).
+    '''
+    _, hash_id = strip_hash_id(os.path.basename(key), hash_length=hash_length)
+    if hash_id is not None:
+        return 'sha256:' + hash_id
+    return retry.call(s3_client.head_object, Bucket=bucket_name, Key=key)['ETag']
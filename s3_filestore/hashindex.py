@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import sqlite3
+import threading
+
+HASH_INDEX_PATH = os.environ.get('S3_FILESTORE_HASH_INDEX',
+                                 os.path.join(os.path.expanduser(os.getenv('XDG_CACHE_HOME', '~/.cache')),
+                                              's3_filestore', 'hash_index.sqlite'))
+
+class HashIndex(object):
+    """
+    Persistent index of local file hashes keyed by (path, size, mtime, inode).
+
+    A lookup only hits if the file has not changed since it was hashed, so
+    re-uploading an unchanged results directory never re-reads the files.
+    """
+    def __init__(self, path=HASH_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS hashes ("
+                               "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, "
+                               "sha256 TEXT, updated REAL)")
+
+    def get(self, filename, stat=None):
+        """Return the full sha256 of filename if it is indexed and unchanged, else None."""
+        path = os.path.realpath(filename)
+        if stat is None: stat = os.stat(path)
+        with self._lock:
+            row = self._conn.execute("SELECT size, mtime_ns, inode, sha256 FROM hashes WHERE path=?", (path,)).fetchone()
+        if row is None:
+            return None
+        size, mtime_ns, inode, sha256 = row
+        if (size, mtime_ns, inode) != (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            return None
+        return sha256
+
+    def put(self, filename, sha256, stat=None):
+        """Record the full sha256 of filename; pass the stat taken before hashing started."""
+        path = os.path.realpath(filename)
+        if stat is None: stat = os.stat(path)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)",
+                               (path, stat.st_size, stat.st_mtime_ns, stat.st_ino, sha256, time.time()))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM hashes")
+
+_HASH_INDEX = None
+_HASH_INDEX_LOCK = threading.Lock()
+
+def get_hash_index():
+    """Return the process-wide HashIndex, or None if the index cannot be opened (e.g., read-only home)."""
+    global _HASH_INDEX
+    with _HASH_INDEX_LOCK:
+        if _HASH_INDEX is None:
+            try:
+                _HASH_INDEX = HashIndex()
+            except (OSError, sqlite3.Error) as e:
+                sys.stderr.write(f"Hash index unavailable ({e}), file hashes will not be cached.\n")
+                _HASH_INDEX = False
+        return _HASH_INDEX or None
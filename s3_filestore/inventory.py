@@ -0,0 +1,162 @@
+import os
+import time
+import sqlite3
+import threading
+
+INVENTORY_PATH = os.environ.get('S3_FILESTORE_INVENTORY',
+                                os.path.join(os.path.expanduser(os.getenv('XDG_CACHE_HOME', '~/.cache')),
+                                             's3_filestore', 'inventory.sqlite'))
+INVENTORY_MAX_AGE = 300
+FULL_REFRESH_INTERVAL = 24 * 3600
+LIST_PAGE_SIZE = 1000
+
+def prefix_range(prefix):
+    """SQL condition and parameters selecting the keys that start with prefix (a range scan on the primary key)."""
+    if not prefix:
+        return "", ()
+    # sqlite compares TEXT byte-wise (like S3), every key starting with prefix sorts in [prefix, upper)
+    stripped = prefix.rstrip('\U0010ffff')
+    if not stripped:
+        return " AND key>=?", (prefix,)
+    upper = stripped[:-1] + chr(ord(stripped[-1]) + 1)
+    return " AND key>=? AND key<?", (prefix, upper)
+
+class Inventory(object):
+    """
+    Local sqlite inventory of object keys, sizes, ETags, last-modified times and sha256 hashes.
+
+    Each refreshed (bucket, prefix) records when it was last listed and the last key seen.
+    Refreshes are incremental: only keys after the last seen key are listed (StartAfter), which
+    picks up everything appended to mostly append-only prefixes (new runs, new hash-suffixed files).
+    Keys inserted before the last seen key, overwrites and deletions by other writers are picked up
+    by a full refresh every full_refresh_interval seconds; uploads made through S3FileStore update
+    the inventory immediately.
+    """
+    def __init__(self, path=INVENTORY_PATH, full_refresh_interval=FULL_REFRESH_INTERVAL):
+        self.path = path
+        self.full_refresh_interval = full_refresh_interval
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS objects ("
+                               "bucket TEXT, key TEXT, size INTEGER, etag TEXT, last_modified REAL, sha256 TEXT, "
+                               "listed_at REAL, PRIMARY KEY (bucket, key))")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS prefixes ("
+                               "bucket TEXT, prefix TEXT, refreshed_at REAL, full_refreshed_at REAL, last_key TEXT, "
+                               "PRIMARY KEY (bucket, prefix))")
+
+    def refreshed_at(self, bucket_name, prefix):
+        """When the freshest refreshed prefix covering prefix was listed (None if it never was)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT prefix, refreshed_at FROM prefixes WHERE bucket=?", (bucket_name,)).fetchall()
+        times = [refreshed_at for covering, refreshed_at in rows if prefix.startswith(covering)]
+        return max(times) if times else None
+
+    def is_fresh(self, bucket_name, prefix, max_age=INVENTORY_MAX_AGE):
+        """Whether prefix (or a key) is covered by a refresh made within the last max_age seconds."""
+        refreshed_at = self.refreshed_at(bucket_name, prefix)
+        return refreshed_at is not None and time.time() - refreshed_at <= max_age
+
+    def refresh(self, s3_client, bucket_name, prefix='', full=None, page_size=LIST_PAGE_SIZE):
+        """
+        List bucket_name/prefix into the inventory.
+
+        Parameters:
+        - s3_client: The S3 client.
+        - bucket_name: The bucket name.
+        - prefix: The prefix to refresh ('' for the whole bucket).
+        - full: Relist everything (dropping deleted keys) instead of only the keys after the last seen key;
+                defaults to a full refresh when the last one is older than full_refresh_interval.
+
+        Returns:
+        - The number of keys listed.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT full_refreshed_at, last_key FROM prefixes WHERE bucket=? AND prefix=?",
+                                     (bucket_name, prefix)).fetchone()
+        full_refreshed_at, last_key = row if row is not None else (None, None)
+        started = time.time()
+        if full is None:
+            full = full_refreshed_at is None or started - full_refreshed_at > self.full_refresh_interval
+
+        kwargs = dict(Bucket=bucket_name, Prefix=prefix, PaginationConfig={'PageSize': page_size})
+        if not full and last_key is not None: kwargs['StartAfter'] = last_key
+        paginator = s3_client.get_paginator('list_objects_v2')
+        listed = 0
+        for page in paginator.paginate(**kwargs):
+            rows = [(bucket_name, obj['Key'], obj['Size'], obj.get('ETag'), obj['LastModified'].timestamp(), started)
+                    for obj in page.get('Contents', [])]
+            if not rows: continue
+            with self._lock, self._conn:
+                # a known sha256 is kept only while the object is unchanged
+                self._conn.executemany("INSERT INTO objects (bucket, key, size, etag, last_modified, listed_at) "
+                                       "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (bucket, key) DO UPDATE SET "
+                                       "sha256=CASE WHEN objects.etag=excluded.etag THEN objects.sha256 END, "
+                                       "size=excluded.size, etag=excluded.etag, last_modified=excluded.last_modified, "
+                                       "listed_at=excluded.listed_at", rows)
+            listed += len(rows)
+            last_key = rows[-1][1] if last_key is None else max(last_key, rows[-1][1])
+
+        with self._lock, self._conn:
+            if full:
+                # keys under prefix that were neither listed nor uploaded since the listing started are gone
+                condition, params = prefix_range(prefix)
+                self._conn.execute("DELETE FROM objects WHERE bucket=? AND listed_at<?" + condition,
+                                   (bucket_name, started) + params)
+                full_refreshed_at = started
+            self._conn.execute("INSERT OR REPLACE INTO prefixes VALUES (?, ?, ?, ?, ?)",
+                               (bucket_name, prefix, started, full_refreshed_at, last_key))
+        return listed
+
+    def keys(self, bucket_name, prefix=''):
+        """The keys under prefix, in S3 listing order."""
+        condition, params = prefix_range(prefix)
+        with self._lock:
+            rows = self._conn.execute("SELECT key FROM objects WHERE bucket=?" + condition + " ORDER BY key",
+                                      (bucket_name,) + params).fetchall()
+        return [key for key, in rows]
+
+    def get(self, bucket_name, object_key):
+        """The inventory entry (size, etag, last_modified, sha256) of an object, or None if it is not listed."""
+        with self._lock:
+            cursor = self._conn.execute("SELECT key, size, etag, last_modified, sha256 FROM objects WHERE bucket=? AND key=?",
+                                        (bucket_name, object_key))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([c[0] for c in cursor.description], row))
+
+    def put(self, bucket_name, object_key, size, etag=None, sha256=None, last_modified=None):
+        """Record an object that was just written."""
+        now = time.time()
+        if last_modified is None: last_modified = now
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (bucket_name, object_key, size, etag, last_modified, sha256, now))
+
+    def remove(self, bucket_name, object_key):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM objects WHERE bucket=? AND key=?", (bucket_name, object_key))
+
+    def clear(self, bucket_name=None):
+        with self._lock, self._conn:
+            if bucket_name is None:
+                self._conn.execute("DELETE FROM objects")
+                self._conn.execute("DELETE FROM prefixes")
+            else:
+                self._conn.execute("DELETE FROM objects WHERE bucket=?", (bucket_name,))
+                self._conn.execute("DELETE FROM prefixes WHERE bucket=?", (bucket_name,))
+
+_INVENTORIES = {}
+_INVENTORIES_LOCK = threading.Lock()
+
+def get_inventory(path=INVENTORY_PATH):
+    """Return the process-wide Inventory stored at path."""
+    key = os.path.realpath(os.path.expanduser(path))
+    with _INVENTORIES_LOCK:
+        inventory = _INVENTORIES.get(key)
+        if inventory is None:
+            inventory = _INVENTORIES[key] = Inventory(path)
+        return inventory
@@ -0,0 +1,253 @@
+"""
+Per-operation metrics and tracing hooks.
+
+A process-wide collector (clients and caches are shared by every store, so are their metrics) records:
+
+- operations: latency, bytes and error counts of the store's functional helpers (download_object,
+  generate_url, download, load_file, upload_file, list_objects, file_exists, hash, ...), timed with
+  the timer context manager;
+- api_calls: latency, request / response bytes and error counts per S3 API call (GetObject,
+  HeadObject, GetObjectAcl, UploadPart, ...), from botocore events installed by instrument_client,
+  plus the presigned-url GETs made by the downloader ('HTTP GET');
+- caches: hits and misses of the download cache, ACL cache, bucket region cache, hash index and inventory;
+- retries: the counts of the retry module (see retry.snapshot).
+
+Operations nest: every event carries the trace of the operations it runs in (e.g.
+'load_object/download_object/generate_url'), so api calls can be attributed to the operation that
+made them. Exporters registered with add_exporter receive every event as a dict, e.g. to forward it
+to a metrics backend or to log slow operations (see print_exporter).
+"""
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from . import retry
+
+class Event(dict):
+    """
+    One timed operation or api call, passed to exporters.
+
+    Keys: kind ('operation' or 'api_call'), name, trace, seconds, bytes_in, bytes_out, error (None or the
+    exception / error code) and the tags given to timer.
+    """
+    __getattr__ = dict.get
+
+class _Timing(object):
+    # mutable record yielded by timer, so the timed block can report the bytes it moved
+    __slots__ = ('bytes_in', 'bytes_out', 'tags')
+
+    def __init__(self, tags):
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.tags = tags
+
+def _empty_timing():
+    return dict(count=0, errors=0, seconds=0.0, max_seconds=0.0, bytes_in=0, bytes_out=0)
+
+class MetricsCollector(object):
+    """Thread-safe aggregation of operation / api call timings and cache hits, with pluggable exporters."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._exporters = []
+        self.enabled = True
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._timings = {'operation': {}, 'api_call': {}}
+            self._caches = {}
+
+    def add_exporter(self, exporter):
+        """Call exporter(event) for every recorded operation and api call (see Event)."""
+        with self._lock:
+            self._exporters = self._exporters + [exporter]
+        return exporter
+
+    def remove_exporter(self, exporter):
+        with self._lock:
+            self._exporters = [e for e in self._exporters if e is not exporter]
+
+    def trace(self):
+        """The names of the operations running in this thread, outermost first."""
+        return tuple(getattr(self._local, 'stack', ()))
+
+    def record(self, kind, name, seconds, bytes_in=0, bytes_out=0, error=None, trace=None, **tags):
+        if not self.enabled: return
+        with self._lock:
+            timing = self._timings[kind].get(name)
+            if timing is None:
+                timing = self._timings[kind][name] = _empty_timing()
+            timing['count'] += 1
+            timing['errors'] += error is not None
+            timing['seconds'] += seconds
+            timing['max_seconds'] = max(timing['max_seconds'], seconds)
+            timing['bytes_in'] += bytes_in or 0
+            timing['bytes_out'] += bytes_out or 0
+            exporters = self._exporters
+        if exporters:
+            if trace is None: trace = self.trace()
+            event = Event(kind=kind, name=name, trace='/'.join(trace), seconds=seconds, bytes_in=bytes_in,
+                          bytes_out=bytes_out, error=error, **tags)
+            for exporter in exporters:
+                try:
+                    exporter(event)
+                except Exception as e:
+                    print(f"Metrics exporter {exporter!r} failed: {e}")
+
+    def cache_hit(self, cache_name, hit=True):
+        if not self.enabled: return
+        with self._lock:
+            counts = self._caches.get(cache_name)
+            if counts is None:
+                counts = self._caches[cache_name] = dict(hits=0, misses=0)
+            counts['hits' if hit else 'misses'] += 1
+
+    def cache_miss(self, cache_name):
+        self.cache_hit(cache_name, hit=False)
+
+    @contextmanager
+    def timer(self, name, **tags):
+        """
+        Time the enclosed block as operation name.
+
+        Yields a record whose bytes_in / bytes_out attributes can be set to the bytes the block
+        downloaded / uploaded. Exceptions are recorded as errors and re-raised.
+        """
+        timing = _Timing(tags)
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(name)
+        trace = tuple(stack)
+        error = None
+        start = time.perf_counter()
+        try:
+            yield timing
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            self.record('operation', name, seconds, bytes_in=timing.bytes_in, bytes_out=timing.bytes_out,
+                        error=error, trace=trace, **timing.tags)
+
+    def snapshot(self):
+        """
+        Aggregated metrics: dict with operations and api_calls ({name: count, errors, seconds,
+        mean_seconds, max_seconds, bytes_in, bytes_out}), caches ({name: hits, misses, hit_rate})
+        and retries (retry.snapshot()).
+        """
+        with self._lock:
+            timings = {kind: {name: dict(t) for name, t in by_name.items()} for kind, by_name in self._timings.items()}
+            caches = {name: dict(c) for name, c in self._caches.items()}
+        for by_name in timings.values():
+            for t in by_name.values():
+                t['mean_seconds'] = t['seconds'] / t['count'] if t['count'] else 0.0
+        for c in caches.values():
+            total = c['hits'] + c['misses']
+            c['hit_rate'] = c['hits'] / total if total else None
+        return dict(operations=timings['operation'], api_calls=timings['api_call'], caches=caches,
+                    retries=retry.snapshot())
+
+# process-wide collector used by the store's clients, caches and functional helpers
+collector = MetricsCollector()
+
+def timer(name, **tags):
+    return collector.timer(name, **tags)
+
+def timed(name=None):
+    """Decorator timing every call of the decorated function as operation name (defaults to its __name__)."""
+    def decorator(fn):
+        operation = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with collector.timer(operation):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_api_call(name, seconds, bytes_in=0, bytes_out=0, error=None):
+    collector.record('api_call', name, seconds, bytes_in=bytes_in, bytes_out=bytes_out, error=error)
+
+def cache_hit(cache_name, hit=True):
+    collector.cache_hit(cache_name, hit=hit)
+
+def cache_miss(cache_name):
+    collector.cache_miss(cache_name)
+
+def add_exporter(exporter):
+    return collector.add_exporter(exporter)
+
+def remove_exporter(exporter):
+    collector.remove_exporter(exporter)
+
+def snapshot():
+    return collector.snapshot()
+
+def reset():
+    """Reset the metrics (retry counts included)."""
+    collector.reset()
+    retry.stats.reset()
+
+def print_exporter(min_seconds=1.0, kinds=('operation',)):
+    """An exporter printing the events of the given kinds that took at least min_seconds."""
+    def exporter(event):
+        if event['kind'] not in kinds or event['seconds'] < min_seconds: return
+        status = "" if event['error'] is None else f" failed ({event['error']})"
+        size = event['bytes_in'] + event['bytes_out']
+        print(f"[s3_filestore] {event['trace'] or event['name']}: {event['seconds']:.3f}s"
+              + (f", {size} bytes" if size else "") + status)
+    return exporter
+
+def _body_size(body):
+    if body is None: return 0
+    if isinstance(body, (bytes, bytearray, memoryview)): return len(body)
+    try:
+        position = body.tell()
+        body.seek(0, 2)
+        size = body.tell() - position
+        body.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+def instrument_client(s3_client, metrics=None):
+    """Record the latency, request / response bytes and errors of every API call made through s3_client."""
+    if metrics is None: metrics = collector
+
+    def on_before_call(params=None, context=None, **kwargs):
+        if context is None: return None
+        context['s3_filestore_metrics'] = (time.perf_counter(), metrics.trace(), _body_size((params or {}).get('body')))
+        return None
+
+    def on_after_call(http_response=None, parsed=None, model=None, context=None, **kwargs):
+        started = (context or {}).pop('s3_filestore_metrics', None)
+        if started is None or model is None: return
+        start, trace, bytes_out = started
+        bytes_in = 0
+        status = getattr(http_response, 'status_code', None)
+        if http_response is not None:
+            try:
+                bytes_in = int(http_response.headers.get('content-length') or 0)
+            except (TypeError, ValueError):
+                pass
+        error = None
+        if status is not None and status >= 300:
+            error = (parsed or {}).get('Error', {}).get('Code') or status
+        metrics.record('api_call', model.name, time.perf_counter() - start, bytes_in=bytes_in,
+                       bytes_out=bytes_out if error is None else 0, error=error, trace=trace)
+
+    def on_after_call_error(exception=None, context=None, event_name='', **kwargs):
+        started = (context or {}).pop('s3_filestore_metrics', None)
+        if started is None: return
+        start, trace, _ = started
+        metrics.record('api_call', event_name.rsplit('.', 1)[-1], time.perf_counter() - start, error=exception, trace=trace)
+
+    s3_client.meta.events.register('before-call.s3', on_before_call, unique_id='s3_filestore-metrics-before-call')
+    s3_client.meta.events.register('after-call.s3', on_after_call, unique_id='s3_filestore-metrics-after-call')
+    s3_client.meta.events.register('after-call-error.s3', on_after_call_error, unique_id='s3_filestore-metrics-after-call-error')
+    return s3_client
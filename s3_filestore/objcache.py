@@ -0,0 +1,159 @@
+"""
+In-process LRU cache of deserialized objects.
+
+Loading the same result repeatedly (notebooks, a results API) otherwise re-parses the downloaded
+file every time. ObjectCache keeps the loaded values keyed by (bucket, key, version), where the
+version identifies the object's content: the hash suffix for keys named <name>-<sha256 prefix>.<ext>
+(immutable, so no request is needed) and the ETag from a HEAD request otherwise. A changed object
+gets a new version, so stale values are never returned; they are evicted by the LRU instead.
+
+By default cached values are shared by every caller and must be treated as read-only. Copying on
+every hit (copy=True) would read memory-mapped arrays into memory, so file-backed values
+(numpy memmaps, LazySafetensors) are always shared, read-only.
+"""
+import sys
+import copy
+import threading
+
+from collections import OrderedDict, namedtuple
+
+from . import metrics
+from .serializers import LazySafetensors
+
+MAX_ENTRIES = 128
+MAX_BYTES = 1024 * 1024 * 1024
+
+ObjectCacheInfo = namedtuple('ObjectCacheInfo', ['hits', 'misses', 'entries', 'bytes', 'max_entries', 'max_bytes'])
+
+class ObjectCache(object):
+    """
+    A thread-safe LRU of deserialized objects, bounded by entry count and approximate size in bytes.
+
+    Parameters:
+    - max_entries: The maximum number of cached objects.
+    - max_bytes: The maximum total approximate size (see approximate_size); larger values are not cached.
+    - copy: Return a deep copy of the cached value on every hit (and insert), so callers can mutate
+      their result; file-backed values inside it are still shared. With copy=False (the default)
+      every caller shares the same object, which must be treated as read-only (numpy arrays are
+      marked read-only).
+    """
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, copy=False):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.copy = copy
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, bucket_name, key, version):
+        """(True, value) for a cached (bucket_name, key) at version, (False, None) otherwise."""
+        with self._lock:
+            entry = self._entries.get((bucket_name, key))
+            hit = entry is not None and entry[0] == version
+            if hit:
+                self._entries.move_to_end((bucket_name, key))
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.cache_hit('object_cache', hit)
+        if not hit:
+            return False, None
+        return True, self._hand_out(entry[1])
+
+    def put(self, bucket_name, key, version, value):
+        """Cache value as (bucket_name, key) at version, replacing older versions; returns the value to hand out."""
+        size = approximate_size(value)
+        _set_read_only(value, file_backed_only=self.copy)
+        with self._lock:
+            self._discard((bucket_name, key))
+            if size <= self.max_bytes and self.max_entries > 0:
+                self._entries[(bucket_name, key)] = (version, value, size)
+                self._bytes += size
+                while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                    self._discard(next(iter(self._entries)))
+        return self._hand_out(value)
+
+    def invalidate(self, bucket_name=None, key=None):
+        """Drop the entry of bucket_name/key, every entry of bucket_name (key=None), or everything."""
+        with self._lock:
+            for entry_key in list(self._entries):
+                if bucket_name is None or (entry_key[0] == bucket_name and (key is None or entry_key[1] == key)):
+                    self._discard(entry_key)
+
+    def clear(self):
+        self.invalidate()
+
+    def cache_info(self):
+        with self._lock:
+            return ObjectCacheInfo(self.hits, self.misses, len(self._entries), self._bytes, self.max_entries, self.max_bytes)
+
+    def _discard(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _hand_out(self, value):
+        if not self.copy:
+            return value
+        # pre-seeding the memo shares the file-backed values instead of reading them into memory
+        memo = {id(shared): shared for shared in _file_backed(value)}
+        return copy.deepcopy(value, memo)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.cache_info()})"
+
+def approximate_size(value, _seen=None):
+    """Approximate memory footprint of value in bytes: buffer sizes of arrays / tensors / DataFrames, recursing into containers."""
+    if _seen is None: _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    if hasattr(value, 'memory_usage') and hasattr(value, 'columns'):  # pandas.DataFrame
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if _is_file_backed(value):  # pages are read from the file on access
+        return sys.getsizeof(value)
+    if hasattr(value, 'nbytes') and not isinstance(value, (bytes, bytearray, memoryview)):  # numpy arrays
+        return int(value.nbytes)
+    if hasattr(value, 'element_size') and hasattr(value, 'nelement'):  # torch tensors
+        return int(value.element_size() * value.nelement())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approximate_size(k, _seen) + approximate_size(v, _seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(approximate_size(item, _seen) for item in value)
+    return sys.getsizeof(value)
+
+def _is_file_backed(value):
+    # numpy memmaps (and views of them) and lazily read safetensors files
+    if isinstance(value, LazySafetensors):
+        return True
+    while value is not None and hasattr(value, 'flags') and hasattr(value, 'base'):
+        if getattr(value, 'filename', None) is not None and hasattr(value, 'offset'):  # numpy.memmap
+            return True
+        value = value.base
+    return False
+
+def _file_backed(value):
+    """The file-backed values in value (recursing into dicts, lists and tuples)."""
+    if _is_file_backed(value):
+        return [value]
+    if isinstance(value, dict):
+        return [shared for item in value.values() for shared in _file_backed(item)]
+    if isinstance(value, (list, tuple)):
+        return [shared for item in value for shared in _file_backed(item)]
+    return []
+
+def _set_read_only(value, file_backed_only=False):
+    # shared values: make accidental in-place edits of numpy arrays fail instead of corrupting the cache
+    if hasattr(value, 'flags') and hasattr(value, 'setflags'):
+        if not file_backed_only or _is_file_backed(value):
+            value.setflags(write=False)
+    elif isinstance(value, dict):
+        for item in value.values(): _set_read_only(item, file_backed_only)
+    elif isinstance(value, (list, tuple)):
+        for item in value: _set_read_only(item, file_backed_only)
@@ -0,0 +1,327 @@
+"""
+Seekable read-only file objects backed by ranged GET requests.
+
+S3RangeFile reads an object in blocks of block_size bytes, keeps the most recently used blocks in
+an LRU cache and fetches ahead when it detects sequential reads, so readers that only touch part of
+an object (the header of a large CSV, one tensor of a checkpoint, the footer of a parquet file)
+transfer only the blocks they touch instead of downloading the whole object first.
+
+S3StreamFile is its sequential counterpart for readers that consume a whole object once (e.g. CSV
+parsers iterating over chunks): a single streaming GET that resumes where it stopped after a
+connection error, with the object's sha256 checked when the end is reached.
+"""
+import io
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+from . import retry
+from . import metrics
+from . import compression as C
+
+MB = 1024 * 1024
+BLOCK_SIZE = 1 * MB
+CACHE_BLOCKS = 64
+MAX_READAHEAD = 16 * MB
+
+class S3RangeFile(io.RawIOBase):
+    """
+    A seekable, read-only binary file over bucket_name/object_key.
+
+    The object is sized (and its ETag pinned) with one HEAD request; every ranged GET is sent with
+    If-Match, so a concurrent overwrite fails the read instead of mixing two versions. Missing blocks
+    of a read are fetched in one request; while reads are sequential, the fetch is extended by a
+    readahead window that doubles up to max_readahead bytes (and resets on a seek elsewhere).
+
+    Whole-object hashes are not verified (only part of the object may ever be read); use
+    load_object / download_object when the sha256 check matters. Like regular files, an S3RangeFile
+    should not be shared by concurrent readers.
+
+    Parameters:
+    - s3_client: The S3 client.
+    - bucket_name: The bucket name.
+    - object_key: The object key.
+    - block_size: The unit of fetching and caching, in bytes.
+    - cache_blocks: The number of blocks kept in the LRU cache.
+    - max_readahead: The maximum number of bytes fetched ahead of sequential reads (0 to disable).
+    """
+    def __init__(self, s3_client, bucket_name, object_key, block_size=BLOCK_SIZE, cache_blocks=CACHE_BLOCKS,
+                 max_readahead=MAX_READAHEAD):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key = object_key
+        self.name = object_key
+        self.block_size = block_size
+        self.cache_blocks = max(cache_blocks, 1)
+        self.max_readahead = max_readahead
+        head = retry.call(s3_client.head_object, Bucket=bucket_name, Key=object_key)
+        self.size = head['ContentLength']
+        self.etag = head.get('ETag')
+        self.metadata = head.get('Metadata', {})
+        self.content_encoding = head.get('ContentEncoding')
+        self.requests = 0
+        self.bytes_fetched = 0
+        self._position = 0
+        self._blocks = OrderedDict()
+        self._next_sequential_block = None
+        self._readahead_blocks = 0
+        self._lock = threading.Lock()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._check_closed()
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence})")
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self._position = position
+        return position
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def read(self, size=-1):
+        self._check_closed()
+        if size is None or size < 0:
+            size = self.size - self._position
+        end = min(self._position + size, self.size)
+        if end <= self._position:
+            return b''
+        data = self._read_range(self._position, end)
+        self._position = end
+        return data
+
+    def readall(self):
+        return self.read()
+
+    def _check_closed(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+
+    def _read_range(self, start, end):
+        first, last = start // self.block_size, (end - 1) // self.block_size
+        with self._lock:
+            blocks = {index: self._blocks[index] for index in range(first, last + 1) if index in self._blocks}
+            missing = [index for index in range(first, last + 1) if index not in blocks]
+            readahead = self._readahead(first, last)
+            if missing:
+                # one request from the first missing block through the readahead window (stopping at cached blocks)
+                fetch_last = missing[-1]
+                while fetch_last < last + readahead and fetch_last + 1 not in self._blocks:
+                    fetch_last += 1
+                fetched = self._fetch_blocks(missing[0], fetch_last)
+                blocks.update(fetched)
+                self._blocks.update(fetched)
+            for index in range(first, last + 1):
+                if index in self._blocks: self._blocks.move_to_end(index)
+            while len(self._blocks) > self.cache_blocks:
+                self._blocks.popitem(last=False)
+            self._next_sequential_block = last + 1
+        data = b''.join(blocks[index] for index in range(first, last + 1))
+        offset = first * self.block_size
+        return data[start - offset:end - offset]
+
+    def _readahead(self, first, last):
+        # extra blocks to fetch after last: grows while reads continue where the previous read stopped
+        if self.max_readahead <= 0:
+            return 0
+        if self._next_sequential_block is not None and first in (self._next_sequential_block - 1, self._next_sequential_block):
+            max_blocks = max(self.max_readahead // self.block_size, 1)
+            self._readahead_blocks = min(max(self._readahead_blocks * 2, 1), max_blocks)
+        else:
+            self._readahead_blocks = 0
+        # never read ahead past the end of the object, or more blocks than the cache can hold
+        last_block = (self.size - 1) // self.block_size
+        return max(0, min(self._readahead_blocks, last_block - last, self.cache_blocks - (last - first + 1)))
+
+    def _fetch_blocks(self, first, last):
+        # one ranged GET for blocks first..last, returned as {block index: bytes}
+        start = first * self.block_size
+        end = min((last + 1) * self.block_size, self.size) - 1
+
+        def get():
+            kwargs = dict(Bucket=self.bucket_name, Key=self.key, Range=f'bytes={start}-{end}')
+            if self.etag is not None: kwargs['IfMatch'] = self.etag
+            response = self.s3_client.get_object(**kwargs)
+            data = response['Body'].read()
+            if len(data) != end - start + 1:
+                raise retry.IncompleteReadError(f"Short read for bytes {start}-{end} of {self.key}: got {len(data)} bytes")
+            return data
+
+        with metrics.timer('range_read') as timing:
+            data = retry.call(get)
+            timing.bytes_in = len(data)
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        return {index: data[(index - first) * self.block_size:(index - first + 1) * self.block_size]
+                for index in range(first, last + 1)}
+
+    def close(self):
+        self._blocks.clear()
+        super().close()
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(bucket_name={self.bucket_name!r}, key={self.key!r}, size={self.size}, "
+                f"block_size={self.block_size}, requests={self.requests}, bytes_fetched={self.bytes_fetched})")
+
+class S3StreamFile(io.RawIOBase):
+    """
+    A sequential, read-only binary file streaming bucket_name/object_key with one GET request.
+
+    Bytes are handed to the reader as they arrive, so a parser can start working before the
+    download finishes and memory use does not depend on the object size. After a transient error
+    the stream is reopened at the current position with a ranged GET (sent with If-Match, so a
+    concurrent overwrite fails the read instead of mixing two versions).
+
+    If hash_prefix is given (or check_metadata_hash is set and the object has sha256 metadata), the
+    bytes are hashed as they are read and a mismatch raises RuntimeError when the end of the object
+    is reached; a reader that stops early is not checked. Bytes are returned as stored (open_stream
+    decompresses compressed objects, see content_encoding), so compressed objects are verified
+    against their stored-sha256 metadata: hash ids and sha256 metadata refer to the uncompressed data.
+
+    Parameters:
+    - s3_client: The S3 client.
+    - bucket_name: The bucket name.
+    - object_key: The object key.
+    - hash_prefix: If given, the sha256 of the object must start with hash_prefix.
+    - check_metadata_hash: If no hash_prefix is given, verify against the object's sha256 metadata instead.
+    """
+    def __init__(self, s3_client, bucket_name, object_key, hash_prefix=None, check_metadata_hash=False):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key = object_key
+        self.name = object_key
+        self.etag = None
+        self.size = None
+        self.metadata = {}
+        self.content_encoding = None
+        self.requests = 0
+        self._position = 0
+        self._body = None
+        retry.call(self._open)
+        if C.response_codec(self.content_encoding) is not None:
+            hash_prefix = self.metadata.get('stored-sha256') if hash_prefix is not None or check_metadata_hash else None
+        elif hash_prefix is None and check_metadata_hash:
+            hash_prefix = self.metadata.get('sha256')
+        self.hash_prefix = hash_prefix
+        self._sha256 = hashlib.sha256() if hash_prefix is not None else None
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def _open(self):
+        kwargs = dict(Bucket=self.bucket_name, Key=self.key)
+        if self._position: kwargs['Range'] = f'bytes={self._position}-'
+        if self.etag is not None: kwargs['IfMatch'] = self.etag
+        response = self.s3_client.get_object(**kwargs)
+        self.requests += 1
+        if self.etag is None:
+            self.etag = response.get('ETag')
+            self.size = response['ContentLength']
+            self.metadata = response.get('Metadata', {})
+            self.content_encoding = response.get('ContentEncoding')
+        self._body = response['Body']
+
+    def _read_chunk(self, size):
+        if self._body is None:
+            self._open()
+        try:
+            data = self._body.read(size)
+        except Exception:
+            self._body.close()
+            self._body = None
+            raise
+        if not data:
+            self._body.close()
+            self._body = None
+            raise retry.IncompleteReadError(f"Stream of {self.key} ended at byte {self._position} of {self.size}")
+        return data
+
+    def readinto(self, buffer):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        size = min(len(buffer), self.size - self._position)
+        if size <= 0:
+            self._check_hash()
+            return 0
+        with metrics.timer('stream_read') as timing:
+            data = retry.call(self._read_chunk, size)
+            timing.bytes_in = len(data)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        if self._sha256 is not None:
+            self._sha256.update(data)
+        if self._position == self.size:
+            self._check_hash()
+        return len(data)
+
+    def _check_hash(self):
+        # once, when the whole object has been read
+        if self._sha256 is None:
+            return
+        digest = self._sha256.hexdigest()
+        self._sha256 = None
+        if not digest.startswith(self.hash_prefix):
+            raise RuntimeError(f'invalid hash value (expected "{self.hash_prefix}", got "{digest}")')
+
+    def close(self):
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+        super().close()
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(bucket_name={self.bucket_name!r}, key={self.key!r}, size={self.size}, "
+                f"position={self._position}, requests={self.requests})")
+
+def open_stream(s3_client, bucket_name, object_key, hash_prefix=None, check_metadata_hash=False, buffer_size=BLOCK_SIZE):
+    """Open bucket_name/object_key as a buffered, sequential S3StreamFile (decompressed, for compressed objects)."""
+    f = S3StreamFile(s3_client, bucket_name, object_key, hash_prefix=hash_prefix, check_metadata_hash=check_metadata_hash)
+    codec = C.response_codec(f.content_encoding)
+    if codec is not None:
+        f = C.DecompressingReader(io.BufferedReader(f, buffer_size=buffer_size), codec, chunk_size=buffer_size)
+    return io.BufferedReader(f, buffer_size=buffer_size)
+
+def open_object(s3_client, bucket_name, object_key, mode='rb', block_size=BLOCK_SIZE, cache_blocks=CACHE_BLOCKS,
+                max_readahead=MAX_READAHEAD):
+    """
+    Open bucket_name/object_key read-only: mode 'rb' returns a seekable S3RangeFile, mode 'r'
+    an io.TextIOWrapper decoding it as utf-8.
+
+    Compressed objects cannot be read at arbitrary offsets: they are opened as a sequential,
+    decompressing stream instead (see open_stream), which does not support seek.
+    """
+    if mode not in ('rb', 'r'):
+        raise ValueError(f"Only modes 'rb' and 'r' (utf-8 text) are supported for remote objects, got {mode!r}")
+    f = S3RangeFile(s3_client, bucket_name, object_key, block_size=block_size, cache_blocks=cache_blocks,
+                    max_readahead=max_readahead)
+    if C.response_codec(f.content_encoding) is not None:
+        f.close()
+        f = open_stream(s3_client, bucket_name, object_key, buffer_size=block_size)
+    elif mode == 'r':
+        f = io.BufferedReader(f, buffer_size=block_size)
+    if mode == 'r':
+        return io.TextIOWrapper(f, encoding='utf-8')
+    return f
@@ -0,0 +1,293 @@
+"""
+Retries, backoff and adaptive concurrency for throttled endpoints.
+
+Every transfer and metadata call of the store goes through a RetryPolicy:
+
+- errors are classified as throttling (503 SlowDown, 429, ...), transient (5xx, connection resets,
+  timeouts, short reads) or permanent (everything else, e.g. 403/404), and only the first two are retried;
+- retries wait an exponentially growing, jittered delay (throttling starts from a longer base delay);
+- a RetryBudget caps retries at a fraction of successful calls, so a struggling endpoint is not hit
+  by a retry storm;
+- an AdaptiveLimiter bounds the number of requests in flight with AIMD: the limit grows by about one
+  per window of successful calls and is halved (at most once per cooldown) when a call is throttled,
+  so worker pools shrink while the endpoint pushes back and grow back afterwards.
+
+boto3 clients keep their own (standard mode) retries; clients.get_client installs observe_client so
+throttled responses seen inside botocore also shrink the limiter and are counted. Counts are available
+from stats.snapshot().
+"""
+import time
+import random
+import asyncio
+import threading
+import requests
+import botocore.exceptions
+
+THROTTLE_CODES = ('SlowDown', 'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestLimitExceeded',
+                  'TooManyRequests', 'TooManyRequestsException', 'RequestThrottled', 'ServiceUnavailable', 'Busy')
+TRANSIENT_CODES = ('InternalError', 'RequestTimeout', 'RequestTimeoutException', 'PriorRequestNotComplete',
+                   'BadDigest', 'IncompleteBody')
+THROTTLE_STATUS = (429, 503)
+TRANSIENT_STATUS = (500, 502, 504)
+
+MAX_ATTEMPTS = 5
+BASE_DELAY = 0.25
+THROTTLE_BASE_DELAY = 1.0
+MAX_DELAY = 20
+INITIAL_CONCURRENCY = 50
+MAX_CONCURRENCY = 256
+
+class IncompleteReadError(IOError):
+    """A response body ended before the expected number of bytes (retried as a transient error)."""
+
+def classify(exc):
+    """'throttle', 'transient' or None (not retryable) for an exception raised by a boto3 or requests call."""
+    if isinstance(exc, botocore.exceptions.ClientError):
+        error = exc.response.get('Error', {})
+        status = exc.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        if error.get('Code') in THROTTLE_CODES or status in THROTTLE_STATUS:
+            return 'throttle'
+        if error.get('Code') in TRANSIENT_CODES or status in TRANSIENT_STATUS:
+            return 'transient'
+        return None
+    if isinstance(exc, (botocore.exceptions.ConnectionError, botocore.exceptions.HTTPClientError,
+                        botocore.exceptions.IncompleteReadError)):
+        return 'transient'
+    if isinstance(exc, requests.HTTPError):
+        status = getattr(exc.response, 'status_code', None)
+        if status in THROTTLE_STATUS:
+            return 'throttle'
+        if status is not None and status >= 500:
+            return 'transient'
+        return None
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                        ConnectionError, TimeoutError, IncompleteReadError)):
+        return 'transient'
+    return None
+
+def is_retryable(exc):
+    return classify(exc) is not None
+
+class RetryStats(object):
+    """Thread-safe counters of retried, throttled and failed calls."""
+    FIELDS = ('calls', 'retries', 'sdk_retries', 'throttles', 'failures', 'budget_exhausted')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def add(self, field, n=1):
+        with self._lock:
+            self._counts[field] += n
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+class RetryBudget(object):
+    """
+    Token bucket limiting retries to a fraction of successful calls.
+
+    Each success deposits ratio tokens and each retry withdraws one; min_per_second tokens
+    are refilled over time so that retries are still possible after a burst of failures.
+    """
+    def __init__(self, ratio=0.2, min_per_second=5, max_tokens=100):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        """Take a token for one retry; False if the budget is exhausted."""
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+class AdaptiveLimiter(object):
+    """
+    AIMD limit on the number of calls in flight, shared by every worker of the process.
+
+    Each success raises the limit by 1/limit (about +1 per window of limit calls); a throttled call
+    multiplies it by decrease, at most once per cooldown seconds so that one burst of throttled
+    responses only halves the limit once.
+    """
+    def __init__(self, initial=INITIAL_CONCURRENCY, min_limit=1, max_limit=MAX_CONCURRENCY, decrease=0.5, cooldown=1.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def acquire(self):
+        with self._condition:
+            while self._in_flight >= max(self.min_limit, int(self._limit)):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, throttled=False):
+        with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self._on_throttle()
+            else:
+                self._limit = min(self.max_limit, self._limit + 1.0 / max(self._limit, 1.0))
+            self._condition.notify_all()
+
+    def on_throttle(self):
+        """Record a throttled response observed outside acquire/release (e.g., inside botocore's retries)."""
+        with self._condition:
+            self._on_throttle()
+
+    def _on_throttle(self):
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown:
+            self._limit = max(self.min_limit, self._limit * self.decrease)
+            self._last_decrease = now
+
+class RetryPolicy(object):
+    """
+    Call a function with retries of throttled / transient errors (see the module docstring).
+
+    Parameters:
+    - max_attempts: The maximum number of attempts per call.
+    - base_delay, throttle_base_delay: The first backoff delay for transient and throttling errors.
+    - max_delay: The maximum backoff delay.
+    - budget: A RetryBudget (None for unlimited retries).
+    - limiter: An AdaptiveLimiter bounding the calls in flight (None for no limit).
+    - stats: The RetryStats to count into.
+    """
+    def __init__(self, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY, throttle_base_delay=THROTTLE_BASE_DELAY,
+                 max_delay=MAX_DELAY, budget=None, limiter=None, stats=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.throttle_base_delay = throttle_base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.limiter = limiter
+        self.stats = stats if stats is not None else RetryStats()
+
+    def delay(self, attempt, kind='transient'):
+        """Exponential backoff with jitter before retry number attempt+1."""
+        base = self.throttle_base_delay if kind == 'throttle' else self.base_delay
+        return min(self.max_delay, base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def _should_retry(self, exc, attempt):
+        # returns the backoff delay, or None if exc has to be raised
+        kind = classify(exc)
+        # throttled boto3 responses are already counted by observe_client
+        if kind == 'throttle' and not isinstance(exc, botocore.exceptions.ClientError):
+            self.stats.add('throttles')
+        if kind is None:
+            return None
+        if attempt + 1 >= self.max_attempts:
+            self.stats.add('failures')
+            return None
+        if self.budget is not None and not self.budget.withdraw():
+            self.stats.add('budget_exhausted')
+            self.stats.add('failures')
+            return None
+        self.stats.add('retries')
+        return self.delay(attempt, kind)
+
+    def call(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs), retried on throttling and transient errors."""
+        self.stats.add('calls')
+        attempt = 0
+        while True:
+            if self.limiter is not None: self.limiter.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if self.limiter is not None: self.limiter.release(throttled=classify(e) == 'throttle')
+                delay = self._should_retry(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if self.limiter is not None: self.limiter.release()
+            if self.budget is not None: self.budget.deposit()
+            return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        """await fn(*args, **kwargs) with the same retries (the limiter is not used; bound coroutines with a semaphore)."""
+        self.stats.add('calls')
+        attempt = 0
+        while True:
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                if classify(e) == 'throttle' and self.limiter is not None: self.limiter.on_throttle()
+                delay = self._should_retry(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if self.budget is not None: self.budget.deposit()
+            return result
+
+# process-wide policy used by the store's transfer and metadata calls
+stats = RetryStats()
+limiter = AdaptiveLimiter()
+default_policy = RetryPolicy(budget=RetryBudget(), limiter=limiter, stats=stats)
+
+def call(fn, *args, **kwargs):
+    """fn(*args, **kwargs) under the default policy."""
+    return default_policy.call(fn, *args, **kwargs)
+
+def snapshot():
+    """Retry / throttle counts and the current concurrency limit of the default policy."""
+    return dict(stats.snapshot(), concurrency_limit=limiter.limit, in_flight=limiter.in_flight)
+
+def observe_client(s3_client, policy=None):
+    """Count botocore's own retries and throttled responses, and let throttled responses shrink the limiter."""
+    if policy is None: policy = default_policy
+
+    def on_needs_retry(response=None, caught_exception=None, **kwargs):
+        if response is None: return None
+        parsed = response[1] or {}
+        code = parsed.get('Error', {}).get('Code')
+        status = parsed.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        if code in THROTTLE_CODES or status in THROTTLE_STATUS:
+            policy.stats.add('throttles')
+            if policy.limiter is not None: policy.limiter.on_throttle()
+        return None
+
+    def on_after_call(parsed=None, **kwargs):
+        retries = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        if retries: policy.stats.add('sdk_retries', retries)
+
+    s3_client.meta.events.register('needs-retry.s3', on_needs_retry, unique_id='s3_filestore-needs-retry')
+    s3_client.meta.events.register('after-call.s3', on_after_call, unique_id='s3_filestore-after-call')
+    return s3_client
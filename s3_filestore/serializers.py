@@ -0,0 +1,306 @@
+"""
+Registry of file formats used by load_file (deserialize) and upload_data (serialize).
+
+Each format has a loader, a dumper and optionally an `accepts` test used to pick a format
+for upload_data when none is given. Loaders receive either a filename or a binary file
+object; given a filename, the fast formats avoid copies (.npy is memory mapped, .safetensors
+tensors are read lazily, .feather/.arrow tables are memory mapped through Arrow).
+Heavy libraries are only imported inside the loaders and dumpers that need them.
+
+Register your own format with:
+
+    register_format('.msgpack', load=my_load, dump=my_dump, accepts=lambda data: ...)
+"""
+import io
+import sys
+import json
+import importlib.util
+
+from collections import OrderedDict
+from collections.abc import Mapping
+
+_FORMATS = OrderedDict()
+
+class Format(object):
+    def __init__(self, extension, load=None, dump=None, accepts=None):
+        self.extension = extension
+        self.load = load
+        self.dump = dump
+        self.accepts = accepts
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(extension={self.extension!r})"
+
+def register_format(extensions, load=None, dump=None, accepts=None):
+    """
+    Register (or replace) a file format.
+
+    Parameters:
+    - extensions: An extension (e.g., '.npy') or a list of extensions sharing the same loader/dumper.
+    - load: load(source, **kwargs) -> data, where source is a filename or a binary file object.
+    - dump: dump(data, fileobj) writing the serialized data to a binary file object.
+    - accepts: accepts(data) -> bool; formats registered later are tried first when inferring a format.
+    """
+    if isinstance(extensions, str): extensions = [extensions]
+    for extension in extensions:
+        _FORMATS.pop(extension, None)
+    # register aliases first, so that inference (which checks the last registered formats first) picks extensions[0]
+    for i, extension in reversed(list(enumerate(extensions))):
+        _FORMATS[extension] = Format(extension, load=load, dump=dump, accepts=accepts if i == 0 else None)
+
+def get_format(filename):
+    """The registered format with the longest extension matching filename (so .pth.tar wins over .tar)."""
+    matches = [ext for ext in _FORMATS if filename.endswith(ext)]
+    if not matches:
+        raise ValueError(f"Filetype must be one of {', '.join(ext.lstrip('.') for ext in _FORMATS)}, got {filename}")
+    return _FORMATS[max(matches, key=len)]
+
+def list_formats():
+    return list(_FORMATS)
+
+def infer_format(data):
+    """The extension of the most recently registered format that accepts data."""
+    for fmt in reversed(list(_FORMATS.values())):
+        if fmt.accepts is not None and fmt.accepts(data):
+            return fmt.extension
+    raise ValueError(f"Unsupported data type: {type(data)}")
+
+def load(source, data_format=None, **kwargs):
+    """Deserialize source (a filename, or a binary file object together with data_format)."""
+    if data_format is None:
+        data_format = source if isinstance(source, str) else getattr(source, 'name', '')
+    fmt = get_format(data_format)
+    if fmt.load is None:
+        raise ValueError(f"No loader registered for {fmt.extension}")
+    return fmt.load(source, **kwargs)
+
+def dump(data, fileobj, data_format):
+    """Serialize data into the binary file object fileobj."""
+    fmt = _FORMATS.get(data_format)
+    if fmt is None or fmt.dump is None:
+        raise ValueError(f"Unsupported data format: {data_format} or data type: {type(data)}")
+    fmt.dump(data, fileobj)
+
+# ===== type checks (without importing numpy/torch/pandas) =====
+
+def loaded_type(module_name, type_name):
+    module = sys.modules.get(module_name)
+    return getattr(module, type_name) if module is not None else None
+
+def array_types():
+    return tuple(t for t in (loaded_type('numpy', 'ndarray'), loaded_type('torch', 'Tensor')) if t is not None)
+
+def is_dataframe(data):
+    DataFrame = loaded_type('pandas', 'DataFrame')
+    return DataFrame is not None and isinstance(data, DataFrame)
+
+def is_ndarray(data):
+    ndarray = loaded_type('numpy', 'ndarray')
+    return ndarray is not None and isinstance(data, ndarray)
+
+def contains_numpy_or_torch(data, types=None):
+    """Recursively check if a dictionary contains any numpy arrays or torch tensors."""
+    if types is None: types = array_types()
+    if not types: return False
+    if isinstance(data, dict):
+        for value in data.values():
+            if isinstance(value, types):
+                return True
+            if isinstance(value, dict):
+                if contains_numpy_or_torch(value, types):
+                    return True
+            if isinstance(value, list):
+                if any(isinstance(item, types) for item in value):
+                    return True
+                if any(isinstance(item, dict) and contains_numpy_or_torch(item, types) for item in value):
+                    return True
+    return False
+
+def _check_type(ok, data, extension):
+    if not ok:
+        raise ValueError(f"Unsupported data format: {extension} or data type: {type(data)}")
+
+# ===== built-in formats =====
+
+def _open_text(source):
+    if isinstance(source, str):
+        return open(source, 'r')
+    return io.TextIOWrapper(source, encoding='utf-8')
+
+def load_csv(source, **kwargs):
+    import pandas as pd
+    return pd.read_csv(source, **kwargs)
+
+CSV_CHUNKSIZE = 100_000
+CSV_BLOCK_SIZE = 16 * 1024 * 1024
+
+def iter_csv(source, columns=None, engine='c', chunksize=CSV_CHUNKSIZE, block_size=CSV_BLOCK_SIZE, as_arrow=False, **kwargs):
+    """
+    Read a CSV file in chunks, so it can be processed in constant memory.
+
+    Parameters:
+    - source: A filename or a binary file object.
+    - columns: Only read these columns (None for all).
+    - engine: 'c' or 'python' for pandas.read_csv chunks of chunksize rows, or 'pyarrow' for the
+      record batches of pyarrow.csv.open_csv (block_size bytes of CSV each, parsed with multiple threads).
+    - chunksize: The number of rows per chunk (pandas engines).
+    - block_size: The number of bytes per batch (pyarrow engine).
+    - as_arrow: Yield pyarrow.RecordBatch instead of DataFrame (pyarrow engine).
+    - kwargs: Passed to pandas.read_csv, or as pyarrow.csv.open_csv keyword arguments.
+
+    Yields:
+    - pandas.DataFrame (or pyarrow.RecordBatch) chunks.
+    """
+    if engine == 'pyarrow':
+        import pyarrow.csv as pv
+        read_options = kwargs.pop('read_options', None) or pv.ReadOptions()
+        read_options.block_size = block_size
+        convert_options = kwargs.pop('convert_options', None) or pv.ConvertOptions()
+        if columns is not None: convert_options.include_columns = list(columns)
+        reader = pv.open_csv(source, read_options=read_options, convert_options=convert_options, **kwargs)
+        for batch in reader:
+            yield batch if as_arrow else batch.to_pandas()
+        return
+
+    if as_arrow:
+        raise ValueError(f"as_arrow=True requires engine='pyarrow', got {engine!r}")
+    import pandas as pd
+    with pd.read_csv(source, usecols=columns, engine=engine, chunksize=chunksize, **kwargs) as reader:
+        yield from reader
+
+def dump_csv(data, fileobj):
+    _check_type(is_dataframe(data), data, '.csv')
+    data.to_csv(fileobj, index=False)
+
+def load_json(source):
+    with _open_text(source) as file:
+        return json.load(file)
+
+def dump_json(data, fileobj):
+    _check_type(isinstance(data, dict), data, '.json')
+    # encode incrementally (in ~1MB writes) instead of building the whole document as a str and then as bytes
+    pending, pending_size = [], 0
+    for chunk in json.JSONEncoder().iterencode(data):
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size >= 1024 * 1024:
+            fileobj.write("".join(pending).encode('utf-8'))
+            pending, pending_size = [], 0
+    fileobj.write("".join(pending).encode('utf-8'))
+
+def load_txt(source):
+    with _open_text(source) as file:
+        lines = file.readlines()
+
+    # echo the lines on stderr, so stdout only carries what the caller prints
+    for line in lines:
+        sys.stderr.write(line.strip() + "\n")  # .strip() removes leading/trailing whitespace including newlines
+    return lines
+
+def dump_txt(data, fileobj):
+    _check_type(isinstance(data, (str, list, tuple)), data, '.txt')
+    text = data if isinstance(data, str) else "\n".join(str(line).rstrip("\n") for line in data) + "\n"
+    fileobj.write(text.encode('utf-8'))
+
+def load_torch(source, map_location='cpu', **kwargs):
+    import torch
+    return torch.load(source, map_location=map_location, **kwargs)
+
+def dump_torch(data, fileobj):
+    _check_type(isinstance(data, dict), data, '.pth')
+    import torch
+    torch.save(data, fileobj)
+
+def load_npy(source, mmap_mode='r', **kwargs):
+    '''Memory map .npy files (read-only by default); file objects are read into memory.'''
+    import numpy as np
+    if isinstance(source, str):
+        return np.load(source, mmap_mode=mmap_mode, **kwargs)
+    return np.load(source, **kwargs)
+
+def dump_npy(data, fileobj):
+    _check_type(is_ndarray(data), data, '.npy')
+    import numpy as np
+    np.save(fileobj, data, allow_pickle=False)
+
+def _safetensors_framework():
+    return 'pt' if importlib.util.find_spec('torch') is not None else 'np'
+
+class LazySafetensors(Mapping):
+    """Read-only mapping over a .safetensors file; each tensor is only read when it is accessed."""
+    def __init__(self, filename, framework=None, device='cpu'):
+        from safetensors import safe_open
+        if framework is None: framework = _safetensors_framework()
+        self.filename = filename
+        self._handle = safe_open(filename, framework=framework, device=device)
+        self._keys = list(self._handle.keys())
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return self._handle.get_tensor(key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def metadata(self):
+        return self._handle.metadata()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.filename!r}, keys={self._keys!r})"
+
+def load_safetensors(source, framework=None, **kwargs):
+    if isinstance(source, str):
+        return LazySafetensors(source, framework=framework, **kwargs)
+    if framework is None: framework = _safetensors_framework()
+    if framework == 'pt':
+        from safetensors.torch import load
+    else:
+        from safetensors.numpy import load
+    return load(source.read())
+
+def dump_safetensors(data, fileobj):
+    _check_type(isinstance(data, dict), data, '.safetensors')
+    ndarray = loaded_type('numpy', 'ndarray')
+    if ndarray is not None and all(isinstance(v, ndarray) for v in data.values()):
+        from safetensors.numpy import save
+    else:
+        from safetensors.torch import save
+    fileobj.write(save(data))
+
+def load_parquet(source, columns=None, **kwargs):
+    import pyarrow.parquet as pq
+    table = pq.read_table(source, columns=columns, memory_map=isinstance(source, str), **kwargs)
+    return table.to_pandas()
+
+def dump_parquet(data, fileobj):
+    _check_type(is_dataframe(data), data, '.parquet')
+    data.to_parquet(fileobj, index=False)
+
+def load_feather(source, columns=None, **kwargs):
+    '''Arrow IPC files are memory mapped; uncompressed numeric columns are not copied.'''
+    import pyarrow.feather as feather
+    table = feather.read_table(source, columns=columns, memory_map=isinstance(source, str), **kwargs)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+def dump_feather(data, fileobj):
+    _check_type(is_dataframe(data), data, '.feather')
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    # uncompressed so that readers can memory map the columns
+    feather.write_feather(pa.Table.from_pandas(data, preserve_index=False), fileobj, compression='uncompressed')
+
+# inference tries the most recently registered formats first, so .pth (dicts with arrays)
+# is checked before .json (any dict)
+register_format('.txt', load=load_txt, dump=dump_txt)
+register_format('.json', load=load_json, dump=dump_json, accepts=lambda data: isinstance(data, dict))
+register_format(['.pth', '.pt', '.pth.tar'], load=load_torch, dump=dump_torch,
+                accepts=lambda data: isinstance(data, dict) and contains_numpy_or_torch(data))
+register_format('.csv', load=load_csv, dump=dump_csv, accepts=is_dataframe)
+register_format('.npy', load=load_npy, dump=dump_npy, accepts=is_ndarray)
+register_format('.safetensors', load=load_safetensors, dump=dump_safetensors)
+register_format('.parquet', load=load_parquet, dump=dump_parquet)
+register_format(['.feather', '.arrow'], load=load_feather, dump=dump_feather)
@@ -0,0 +1,251 @@
+"""
+Incremental directory sync between a local directory and a bucket subfolder.
+
+Remote objects follow the upload_file naming convention (name-<hash_id>.ext, see
+get_object_name_with_hash_id), so a local file is up to date when the object named after its
+current hash exists with the same size. Both directions are planned from one bulk listing of the
+subfolder and local stats; file hashes come from the persistent hash index, so only new or
+modified files are read. Transfers and deletions run on a bounded worker pool.
+"""
+import os
+import time
+import fnmatch
+import posixpath
+
+from . import functional as F
+from . import retry
+from . import transfer
+from . import compression as C
+from .utils import get_file_hash, get_object_name_with_hash_id, strip_hash_id
+
+DELETE_BATCH_SIZE = 1000
+
+def matches(relative_path, include=None, exclude=None):
+    """
+    Whether relative_path (posix style, relative to the synced directory) passes the glob filters.
+
+    Patterns are matched with fnmatch against the whole relative path ('*' also matches '/', so
+    '*.json' selects json files at any depth); exclude wins over include.
+    """
+    if isinstance(include, str): include = [include]
+    if isinstance(exclude, str): exclude = [exclude]
+    if include and not any(fnmatch.fnmatchcase(relative_path, pattern) for pattern in include):
+        return False
+    if exclude and any(fnmatch.fnmatchcase(relative_path, pattern) for pattern in exclude):
+        return False
+    return True
+
+def iter_local_files(local_dir, include=None, exclude=None):
+    """Yield the relative (posix) paths of the files under local_dir that pass the filters, in sorted order."""
+    for root, dirs, files in os.walk(local_dir):
+        dirs.sort()
+        relative_root = os.path.relpath(root, local_dir)
+        for name in sorted(files):
+            relative_path = name if relative_root == '.' else posixpath.join(*relative_root.split(os.sep), name)
+            if matches(relative_path, include, exclude):
+                yield relative_path
+
+def list_remote(s3_client, bucket_name, prefix):
+    """One bulk listing of prefix: {key: (size, last_modified timestamp)}."""
+    remote = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, PaginationConfig={'PageSize': F.LIST_PAGE_SIZE}):
+        for obj in page.get('Contents', []):
+            remote[obj['Key']] = (obj['Size'], obj['LastModified'].timestamp())
+    return remote
+
+def delete_objects(s3_client, bucket_name, object_keys, inventory=None):
+    """Delete object_keys in batches of DELETE_BATCH_SIZE, returning the (key, exception) pairs that failed."""
+    errors = []
+    for start in range(0, len(object_keys), DELETE_BATCH_SIZE):
+        batch = object_keys[start:start + DELETE_BATCH_SIZE]
+        response = s3_client.delete_objects(Bucket=bucket_name, Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True})
+        failed = {error['Key']: error for error in response.get('Errors', [])}
+        errors.extend((key, RuntimeError(f"{error.get('Code')}: {error.get('Message')}")) for key, error in failed.items())
+        for key in batch:
+            if key not in failed and inventory is not None:
+                inventory.remove(bucket_name, key)
+    return errors
+
+def sync_to_s3(s3_client, bucket, local_dir, bucket_subfolder, hash_length=None, acl=None, profile='wasabi', expires_in_seconds=3600,
+               include=None, exclude=None, delete=False, dry_run=False, max_workers=None, verbose=True,
+               multipart_threshold=transfer.MULTIPART_THRESHOLD, multipart_chunksize=transfer.MULTIPART_CHUNKSIZE, inventory=None,
+               compression=None, compression_level=None):
+    """
+    Upload the new or modified files of local_dir to bucket_subfolder.
+
+    Parameters:
+    - s3_client: The S3 client.
+    - bucket: The S3 bucket object.
+    - local_dir: The local directory to push.
+    - bucket_subfolder: The destination prefix; local_dir/a/b.txt is stored as bucket_subfolder/a/b-<hash_id>.txt.
+    - hash_length: The number of hash characters appended to object names.
+    - include, exclude: Glob patterns (or lists of patterns) over paths relative to local_dir.
+    - delete: Also delete the objects under bucket_subfolder that no local file maps to (including older
+              versions of modified files, once the new version is uploaded). Objects of files that failed
+              to hash or upload are kept.
+    - dry_run: Only compute and return the plan.
+    - max_workers: The number of concurrent hashing / upload workers.
+    - compression: 'gzip' or 'zstd' to upload compressed objects (see compression.py). Their listed size is
+                   the compressed one, so an existing object named after the file's hash counts as up to date.
+    - compression_level: The compression level (codec default if None).
+
+    Returns:
+    - dict with the uploaded, skipped and deleted object keys and the (item, exception) errors.
+    """
+    if max_workers is None: max_workers = transfer.DEFAULT_MAX_WORKERS
+    compression = C.check_codec(compression)
+    prefix = F.normalize_prefix(bucket_subfolder)
+    remote = list_remote(s3_client, bucket.name, prefix)
+    relative_paths = list(iter_local_files(local_dir, include, exclude))
+
+    def plan(relative_path):
+        local_filename = os.path.join(local_dir, *relative_path.split('/'))
+        relative_dir, name = posixpath.split(relative_path)
+        object_name = get_object_name_with_hash_id(local_filename, object_name=name, hash_length=hash_length)
+        object_key = prefix + posixpath.join(relative_dir, object_name)
+        remote_entry = remote.get(object_key)
+        up_to_date = remote_entry is not None and (compression is not None or remote_entry[0] == os.path.getsize(local_filename))
+        return local_filename, object_key, up_to_date
+
+    # hashing is mostly index lookups; new or modified files are hashed concurrently (hashlib releases the GIL)
+    plans, errors = transfer.run_batch(plan, relative_paths, max_workers=max_workers)
+    plans = [p for p in plans if p is not None]
+    to_upload = [(local_filename, object_key) for local_filename, object_key, up_to_date in plans if not up_to_date]
+    skipped = [object_key for _, object_key, up_to_date in plans if up_to_date]
+    expected = set(object_key for _, object_key, _ in plans)
+
+    def local_path(key):
+        # the relative path of the local file an object maps to (its key without prefix and hash id)
+        relative_dir, name = posixpath.split(key[len(prefix):])
+        return posixpath.join(relative_dir, strip_hash_id(name, hash_length)[0])
+
+    # objects of local files that could not be hashed are never deleted, the file still exists
+    failed_paths = set(relative_path for relative_path, _ in errors)
+    to_delete = []
+    if delete:
+        # only objects whose (hash-stripped) path passes the filters are candidates for deletion
+        for key in sorted(remote):
+            if key in expected or local_path(key) in failed_paths: continue
+            if matches(local_path(key), include, exclude):
+                to_delete.append(key)
+
+    if verbose:
+        print(f"sync {local_dir} -> s3://{bucket.name}/{prefix}: {len(to_upload)} to upload, "
+              f"{len(skipped)} up to date, {len(to_delete)} to delete" + (" (dry run)" if dry_run else ""))
+    if dry_run:
+        return dict(uploaded=[key for _, key in to_upload], skipped=skipped, deleted=to_delete, errors=errors)
+
+    def upload(item):
+        local_filename, object_key = item
+        F.upload_file(s3_client, bucket, local_filename, object_key, acl=acl, verbose=False, profile=profile,
+                      expires_in_seconds=expires_in_seconds, metadata={"sha256": get_file_hash(local_filename)},
+                      multipart_threshold=multipart_threshold, multipart_chunksize=multipart_chunksize,
+                      max_concurrency=max_workers, inventory=inventory, check_existing=False,
+                      compression=compression, compression_level=compression_level)
+        return object_key
+
+    uploaded, upload_errors = transfer.run_batch(upload, to_upload, max_workers=max_workers)
+    errors += upload_errors
+    # older versions of a file are only deleted once its new version has been uploaded
+    failed_paths.update(local_path(object_key) for (_, object_key), _ in upload_errors)
+    to_delete = [key for key in to_delete if local_path(key) not in failed_paths]
+    deleted = []
+    if to_delete:
+        delete_errors = delete_objects(s3_client, bucket.name, to_delete, inventory=inventory)
+        failed = set(key for key, _ in delete_errors)
+        deleted = [key for key in to_delete if key not in failed]
+        errors += delete_errors
+
+    return dict(uploaded=[key for key in uploaded if key is not None], skipped=skipped, deleted=deleted, errors=errors)
+
+def sync_from_s3(s3_client, bucket_name, bucket_subfolder, local_dir, hash_length=None, include=None, exclude=None,
+                 delete=False, dry_run=False, max_workers=None, verbose=True):
+    """
+    Download the new or modified objects under bucket_subfolder into local_dir.
+
+    Hash ids are stripped from the local filenames (bucket_subfolder/a/b-<hash_id>.txt is written to
+    local_dir/a/b.txt); if several versions of a file exist, the most recently modified one wins.
+    A local file is up to date if its (indexed) hash matches the object's hash id, or, for objects
+    without a hash id, if it is not older than the object and its size matches (for compressed
+    objects, its hash matches the object's sha256 metadata). Compressed objects are decompressed,
+    and every download is checked against the hash id or sha256 metadata.
+
+    Parameters:
+    - s3_client: The S3 client.
+    - bucket_name: The bucket name.
+    - bucket_subfolder: The prefix to pull.
+    - local_dir: The destination directory.
+    - hash_length: The length of the hash ids to strip (None for any run of hex digits).
+    - include, exclude: Glob patterns over local paths relative to local_dir.
+    - delete: Also delete the local files (passing the filters) that no object maps to.
+    - dry_run: Only compute and return the plan.
+    - max_workers: The number of concurrent downloads.
+
+    Returns:
+    - dict with the downloaded object keys, the skipped object keys, the deleted local files and the errors.
+    """
+    prefix = F.normalize_prefix(bucket_subfolder)
+    remote = list_remote(s3_client, bucket_name, prefix)
+
+    # local relative path -> (key, size, last_modified, hash_id) of its most recent version
+    targets = {}
+    for key, (size, last_modified) in remote.items():
+        if key.endswith('/'): continue
+        relative_dir, name = posixpath.split(key[len(prefix):])
+        name, hash_id = strip_hash_id(name, hash_length)
+        relative_path = posixpath.join(relative_dir, name)
+        if not matches(relative_path, include, exclude): continue
+        if relative_path not in targets or targets[relative_path][2] < last_modified:
+            targets[relative_path] = (key, size, last_modified, hash_id)
+
+    def up_to_date(relative_path):
+        # listed sizes are the stored sizes, which differ from the local ones for compressed objects
+        key, size, last_modified, hash_id = targets[relative_path]
+        local_filename = os.path.join(local_dir, *relative_path.split('/'))
+        if not os.path.isfile(local_filename): return False
+        stat = os.stat(local_filename)
+        if hash_id is not None:
+            return get_file_hash(local_filename, hash_length=len(hash_id)) == hash_id
+        if stat.st_mtime < last_modified: return False
+        if stat.st_size == size: return True
+        head = retry.call(s3_client.head_object, Bucket=bucket_name, Key=key)
+        sha256 = head.get('Metadata', {}).get('sha256')
+        return (C.response_codec(head.get('ContentEncoding')) is not None and sha256 is not None
+                and get_file_hash(local_filename) == sha256)
+
+    checks, errors = transfer.run_batch(up_to_date, sorted(targets), max_workers=max_workers)
+    to_download = [p for p, ok in zip(sorted(targets), checks) if not ok]
+    skipped = [targets[p][0] for p, ok in zip(sorted(targets), checks) if ok]
+    to_delete = []
+    if delete and os.path.isdir(local_dir):
+        to_delete = [p for p in iter_local_files(local_dir, include, exclude) if p not in targets]
+
+    if verbose:
+        print(f"sync s3://{bucket_name}/{prefix} -> {local_dir}: {len(to_download)} to download, "
+              f"{len(skipped)} up to date, {len(to_delete)} to delete" + (" (dry run)" if dry_run else ""))
+    if dry_run:
+        return dict(downloaded=[targets[p][0] for p in to_download], skipped=skipped, deleted=to_delete, errors=errors)
+
+    def download(relative_path):
+        key, _, last_modified, hash_id = targets[relative_path]
+        local_filename = os.path.join(local_dir, *relative_path.split('/'))
+        os.makedirs(os.path.dirname(local_filename), exist_ok=True)
+        # written next to the destination and moved into place once the (decompressed) content matches the
+        # hash id or sha256 metadata, so an interrupted sync never leaves partial files
+        transfer.download_object_to_file(s3_client, bucket_name, key, local_filename, hash_prefix=hash_id, progress=False,
+                                         check_metadata_hash=True)
+        os.utime(local_filename, (time.time(), last_modified))
+        return key
+
+    downloaded, download_errors = transfer.run_batch(download, to_download, max_workers=max_workers)
+    errors += download_errors
+    deleted = []
+    for relative_path in to_delete:
+        try:
+            os.remove(os.path.join(local_dir, *relative_path.split('/')))
+            deleted.append(relative_path)
+        except OSError as e:
+            errors.append((relative_path, e))
+
+    return dict(downloaded=[key for key in downloaded if key is not None], skipped=skipped, deleted=deleted, errors=errors)
@@ -0,0 +1,569 @@
+import os
+import sys
+import math
+import json
+import hashlib
+import tempfile
+import threading
+import time
+import requests
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+
+from . import retry
+from . import metrics
+from . import compression as C
+from .data import SPILL_THRESHOLD
+
+MB = 1024 * 1024
+DEFAULT_MAX_WORKERS = 8
+CHUNK_SIZE = 1 * MB
+
+# multipart uploads (S3 limits: parts >= 5MB except the last one, at most 10,000 parts)
+MULTIPART_THRESHOLD = 64 * MB
+MULTIPART_CHUNKSIZE = 16 * MB
+MIN_PART_SIZE = 5 * MB
+MAX_PARTS = 10000
+
+# ranged downloads
+RANGED_THRESHOLD = 64 * MB
+RANGE_SIZE = 16 * MB
+
+_http = threading.local()
+
+class ProgressBar(object):
+    """
+    A byte-level progress bar shared by all workers of a batch transfer.
+
+    The total grows as workers discover the size of each object, so a batch
+    can start before every object has been sized.
+    """
+    def __init__(self, total=0, desc=None, disable=False):
+        self._lock = threading.Lock()
+        self.bar = tqdm(total=total, desc=desc, unit='B', unit_scale=True,
+                        unit_divisor=1024, disable=disable)
+
+    def add_total(self, nbytes):
+        with self._lock:
+            self.bar.total = (self.bar.total or 0) + nbytes
+            self.bar.refresh()
+
+    def update(self, nbytes):
+        with self._lock:
+            self.bar.update(nbytes)
+
+    def close(self):
+        self.bar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def run_batch(fn, items, max_workers=None):
+    """
+    Apply fn to every item on a bounded thread pool.
+
+    Parameters:
+    - fn: Callable taking a single item.
+    - items: The items to process.
+    - max_workers: The maximum number of concurrent workers.
+
+    Returns:
+    - results: fn(item) for each item, in input order (None where fn raised).
+    - errors: List of (item, exception) tuples for the items that failed, in input order.
+    """
+    if max_workers is None: max_workers = DEFAULT_MAX_WORKERS
+    items = list(items)
+    results = [None] * len(items)
+    errors = []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items) or 1))) as executor:
+        futures = [executor.submit(fn, item) for item in items]
+        for idx, future in enumerate(futures):
+            try:
+                results[idx] = future.result()
+            except Exception as e:
+                errors.append((items[idx], e))
+
+    return results, errors
+
+def report_errors(errors, verbose=True):
+    if verbose and errors:
+        sys.stderr.write(f"{len(errors)} item(s) failed:\n")
+        for item, e in errors:
+            sys.stderr.write(f"  {item}: {e!r}\n")
+
+def http_session():
+    """A requests.Session per thread, so repeated requests from a worker reuse its connections."""
+    session = getattr(_http, 'session', None)
+    if session is None:
+        session = _http.session = requests.Session()
+    return session
+
+def get_part_size(size, part_size=MULTIPART_CHUNKSIZE):
+    """part_size, raised to S3's minimum part size and (for a known size) enough to stay within MAX_PARTS parts."""
+    part_size = max(part_size, MIN_PART_SIZE)
+    if size is not None:
+        part_size = max(part_size, int(math.ceil(size / MAX_PARTS)))
+    return part_size
+
+def download_url_to_file(url, dst, hash_prefix=None, progress=True, progress_bar=None, chunk_size=CHUNK_SIZE,
+                         check_metadata_hash=False, ranged_threshold=RANGED_THRESHOLD, range_size=RANGE_SIZE,
+                         max_concurrency=DEFAULT_MAX_WORKERS, if_none_match=None, if_modified_since=None):
+    """
+    Download the object at url to dst.
+
+    Objects of at least ranged_threshold bytes are fetched as parallel byte ranges into a
+    preallocated dst + '.partial' file. Completed ranges are recorded next to it in
+    dst + '.partial.json', so an interrupted download resumes where it stopped (as long as
+    the object's ETag has not changed). Smaller objects, compressed objects (decompressed
+    while streaming, see compression.py), or servers that do not support ranges, are
+    streamed in a single request. The file is renamed to dst only once it is
+    complete and its hash has been verified.
+
+    With if_none_match / if_modified_since (the ETag / Last-Modified of a copy already at dst), the
+    request is conditional: an unchanged object costs one empty 304 response and dst is left as is.
+
+    Parameters:
+    - url: The (public or presigned) url to download.
+    - dst: The destination filename.
+    - hash_prefix: If given, the sha256 of the downloaded file must start with hash_prefix.
+    - progress: Whether to display a progress bar for this download.
+    - progress_bar: A shared ProgressBar to report bytes to (overrides progress).
+    - chunk_size: The number of bytes read per iteration.
+    - check_metadata_hash: If no hash_prefix is given, verify against the object's sha256 metadata instead.
+    - ranged_threshold: Minimum object size for parallel ranged downloads (None to disable).
+    - range_size: The size of each byte range.
+    - max_concurrency: The maximum number of ranges downloaded at once.
+    - if_none_match: Only download if the object's ETag differs from this one.
+    - if_modified_since: Only download if the object was modified after this HTTP date.
+
+    Returns:
+    - dict with the object's etag, size, last_modified and sha256 metadata (from the response headers),
+      or None if the object was not modified.
+    """
+    dst = os.path.expanduser(dst)
+    headers = {}
+    if if_none_match is not None: headers['If-None-Match'] = if_none_match
+    if if_modified_since is not None: headers['If-Modified-Since'] = if_modified_since
+    bar = progress_bar
+
+    try:
+        with retry.call(_get, url, headers=headers or None) as response:
+            if response.status_code == 304:
+                return None
+            if bar is None: bar = ProgressBar(disable=not progress)
+            if hash_prefix is None and check_metadata_hash:
+                hash_prefix = response.headers.get('x-amz-meta-sha256')
+            file_size = response.headers.get('Content-Length')
+            file_size = int(file_size) if file_size is not None else None
+            etag = response.headers.get('ETag')
+            info = dict(etag=etag, size=file_size, last_modified=response.headers.get('Last-Modified'),
+                        sha256=response.headers.get('x-amz-meta-sha256'))
+            codec = C.response_codec(response.headers.get('Content-Encoding'))
+            ranged = (ranged_threshold is not None and file_size is not None and file_size >= ranged_threshold
+                      and response.headers.get('Accept-Ranges') == 'bytes' and codec is None)
+            if not ranged:
+                bar.add_total(file_size or 0)
+                _stream_to_file(_response_chunks(response, chunk_size, codec), dst, hash_prefix, bar, codec=codec)
+                return info
+
+        # the first response only served as a probe; its connection is released before the ranged requests
+        bar.add_total(file_size)
+        _download_ranges(url, dst, file_size, etag, hash_prefix, bar, chunk_size, range_size, max_concurrency)
+        return info
+    finally:
+        if progress_bar is None and bar is not None:
+            bar.close()
+
+def _get(url, headers=None):
+    # recorded as an api call up to the response headers; the body is streamed by the caller
+    start = time.perf_counter()
+    try:
+        response = http_session().get(url, headers=headers, stream=True)
+    except Exception as e:
+        metrics.record_api_call('HTTP GET', time.perf_counter() - start, error=e)
+        raise
+    try:
+        response.raise_for_status()
+    except requests.HTTPError:
+        metrics.record_api_call('HTTP GET', time.perf_counter() - start, error=response.status_code)
+        response.close()
+        raise
+    metrics.record_api_call('HTTP GET', time.perf_counter() - start, bytes_in=int(response.headers.get('Content-Length') or 0))
+    return response
+
+def _response_chunks(response, chunk_size, codec):
+    # compressed bodies are read as stored (requests would decode gzip itself) and decompressed by the caller
+    if codec is not None:
+        return response.raw.stream(chunk_size, decode_content=False)
+    return response.iter_content(chunk_size=chunk_size)
+
+def _stream_to_file(chunks, dst, hash_prefix, bar, codec=None):
+    dst_dir = os.path.dirname(os.path.abspath(dst))
+    f = tempfile.NamedTemporaryFile(delete=False, dir=dst_dir, suffix='.partial')
+    sha256 = hashlib.sha256() if hash_prefix is not None else None
+    decompressor = C.Decompressor(codec) if codec is not None else None
+
+    try:
+        for chunk in chunks:
+            if not chunk: continue
+            bar.update(len(chunk))
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            f.write(chunk)
+            if sha256 is not None:
+                sha256.update(chunk)
+        if decompressor is not None:
+            chunk = decompressor.finish()
+            f.write(chunk)
+            if sha256 is not None:
+                sha256.update(chunk)
+
+        f.close()
+        if sha256 is not None:
+            _check_digest(sha256.hexdigest(), hash_prefix)
+        os.replace(f.name, dst)
+    finally:
+        f.close()
+        if os.path.exists(f.name):
+            os.remove(f.name)
+
+def download_object_to_file(s3_client, bucket_name, object_key, dst, hash_prefix=None, progress=True, progress_bar=None,
+                            chunk_size=CHUNK_SIZE, check_metadata_hash=False):
+    """
+    Download bucket_name/object_key to dst with get_object (for callers holding a client rather than a url).
+
+    Compressed objects are decompressed while streaming, and the sha256 of the (decompressed) body is
+    checked before dst is replaced; a failed or short download is retried from the start.
+
+    Parameters:
+    - s3_client: The S3 client.
+    - bucket_name: The bucket name.
+    - object_key: The object key.
+    - dst: The destination filename.
+    - hash_prefix: If given, the sha256 of the object must start with hash_prefix.
+    - progress: Whether to display a progress bar for this download.
+    - progress_bar: A shared ProgressBar to report bytes to (overrides progress).
+    - chunk_size: The number of bytes read per iteration.
+    - check_metadata_hash: If no hash_prefix is given, verify against the object's sha256 metadata instead.
+
+    Returns:
+    - dict with the object's etag, size (as stored), last_modified and sha256 metadata.
+    """
+    def fetch(bar):
+        response = s3_client.get_object(Bucket=bucket_name, Key=object_key)
+        metadata = response.get('Metadata', {})
+        info = dict(etag=response.get('ETag'), size=response.get('ContentLength'),
+                    last_modified=response.get('LastModified'), sha256=metadata.get('sha256'))
+        expected_hash = hash_prefix if hash_prefix is not None or not check_metadata_hash else info['sha256']
+        bar.add_total(info['size'] or 0)
+        received = []
+        def chunks():
+            for chunk in response['Body'].iter_chunks(chunk_size):
+                received.append(len(chunk))
+                yield chunk
+        try:
+            _stream_to_file(chunks(), dst, expected_hash, bar, codec=C.response_codec(response.get('ContentEncoding')))
+        except BaseException:
+            # a retry streams the whole object again
+            bar.add_total(-(info['size'] or 0))
+            bar.update(-sum(received))
+            raise
+        return info
+
+    return _retry_fetch(fetch, progress, progress_bar)
+
+def download_object_to_buffer(s3_client, bucket_name, object_key, hash_prefix=None, progress=True, progress_bar=None,
+                              chunk_size=CHUNK_SIZE, check_metadata_hash=False, spill_threshold=SPILL_THRESHOLD):
+    """
+    Download bucket_name/object_key into memory, without going through the download cache.
+
+    The body is streamed with get_object into a SpooledTemporaryFile that stays in memory up to
+    spill_threshold bytes and spills to an anonymous temporary file beyond that, and is hashed
+    while the chunks arrive (after decompression, for compressed objects). A body shorter than
+    its Content-Length is retried from the start, after discarding the partial buffer.
+
+    Parameters:
+    - s3_client: The S3 client.
+    - bucket_name: The bucket name.
+    - object_key: The object key.
+    - hash_prefix: If given, the sha256 of the object must start with hash_prefix.
+    - progress: Whether to display a progress bar for this download.
+    - progress_bar: A shared ProgressBar to report bytes to (overrides progress).
+    - chunk_size: The number of bytes read per iteration.
+    - check_metadata_hash: If no hash_prefix is given, verify against the object's sha256 metadata instead.
+    - spill_threshold: The number of bytes kept in memory before spilling to a temporary file.
+
+    Returns:
+    - (buffer, info): the binary buffer positioned at 0 (close it when done), and a dict with the
+      object's etag, size, last_modified and sha256 metadata.
+    """
+    def fetch(bar):
+        response = s3_client.get_object(Bucket=bucket_name, Key=object_key)
+        metadata = response.get('Metadata', {})
+        info = dict(etag=response.get('ETag'), size=response.get('ContentLength'),
+                    last_modified=response.get('LastModified'), sha256=metadata.get('sha256'))
+        expected_hash = hash_prefix if hash_prefix is not None or not check_metadata_hash else info['sha256']
+        codec = C.response_codec(response.get('ContentEncoding'))
+        buffer = _stream_to_buffer(response['Body'].iter_chunks(chunk_size), info['size'], expected_hash, bar, spill_threshold,
+                                   codec=codec)
+        return buffer, info
+
+    return _retry_fetch(fetch, progress, progress_bar)
+
+def download_url_to_buffer(url, hash_prefix=None, progress=True, progress_bar=None, chunk_size=CHUNK_SIZE,
+                           check_metadata_hash=False, spill_threshold=SPILL_THRESHOLD):
+    """
+    Download the object at url into memory, without going through the download cache.
+
+    Same as download_object_to_buffer, for a (public or presigned) url.
+
+    Returns:
+    - (buffer, info): the binary buffer positioned at 0 (close it when done), and a dict with the
+      object's etag, size, last_modified and sha256 metadata (from the response headers).
+    """
+    def fetch(bar):
+        with _get(url) as response:
+            file_size = response.headers.get('Content-Length')
+            info = dict(etag=response.headers.get('ETag'), size=int(file_size) if file_size is not None else None,
+                        last_modified=response.headers.get('Last-Modified'), sha256=response.headers.get('x-amz-meta-sha256'))
+            expected_hash = hash_prefix if hash_prefix is not None or not check_metadata_hash else info['sha256']
+            codec = C.response_codec(response.headers.get('Content-Encoding'))
+            buffer = _stream_to_buffer(_response_chunks(response, chunk_size, codec), info['size'], expected_hash, bar,
+                                       spill_threshold, codec=codec)
+            return buffer, info
+
+    return _retry_fetch(fetch, progress, progress_bar)
+
+def _retry_fetch(fetch, progress, progress_bar):
+    bar = progress_bar if progress_bar is not None else ProgressBar(disable=not progress)
+    try:
+        return retry.call(fetch, bar)
+    finally:
+        if progress_bar is None:
+            bar.close()
+
+def _stream_to_buffer(chunks, size, hash_prefix, bar, spill_threshold, codec=None):
+    buffer = tempfile.SpooledTemporaryFile(max_size=spill_threshold)
+    sha256 = hashlib.sha256() if hash_prefix is not None else None
+    decompressor = C.Decompressor(codec) if codec is not None else None
+    received = 0
+    bar.add_total(size or 0)
+
+    try:
+        for chunk in chunks:
+            if not chunk: continue
+            received += len(chunk)
+            bar.update(len(chunk))
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            buffer.write(chunk)
+            if sha256 is not None:
+                sha256.update(chunk)
+
+        if size is not None and received != size:
+            raise retry.IncompleteReadError(f"Short read: got {received} of {size} bytes")
+        if decompressor is not None:
+            chunk = decompressor.finish()
+            buffer.write(chunk)
+            if sha256 is not None:
+                sha256.update(chunk)
+        if sha256 is not None:
+            _check_digest(sha256.hexdigest(), hash_prefix)
+    except BaseException:
+        buffer.close()
+        # a retry streams the whole object again
+        bar.add_total(-(size or 0))
+        bar.update(-received)
+        raise
+
+    buffer.seek(0)
+    return buffer
+
+def _download_ranges(url, dst, file_size, etag, hash_prefix, bar, chunk_size, range_size, max_concurrency):
+    partial_filename = dst + '.partial'
+    state_filename = dst + '.partial.json'
+    ranges = [(start, min(start + range_size, file_size) - 1) for start in range(0, file_size, range_size)]
+
+    # resume only if the partial file belongs to the same version of the object
+    state = _load_range_state(state_filename)
+    if (state is None or not os.path.exists(partial_filename) or state.get('etag') != etag
+            or state.get('size') != file_size or state.get('range_size') != range_size):
+        with open(partial_filename, 'wb') as f:
+            f.truncate(file_size)
+        state = dict(etag=etag, size=file_size, range_size=range_size, done=[])
+        _save_range_state(state_filename, state)
+
+    done = set(state['done'])
+    lock = threading.Lock()
+    bar.update(sum(end - start + 1 for idx, (start, end) in enumerate(ranges) if idx in done))
+
+    def fetch_range(start, end, headers):
+        written = 0
+        try:
+            with _get(url, headers=headers) as response:
+                if response.status_code != 206:
+                    raise RuntimeError(f"Server ignored the Range request for {url}")
+                with open(partial_filename, 'r+b') as f:
+                    f.seek(start)
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        written += len(chunk)
+                        bar.update(len(chunk))
+            if written != end - start + 1:
+                raise retry.IncompleteReadError(f"Short read for bytes {start}-{end} of {url}: got {written} bytes")
+        except BaseException:
+            bar.update(-written)
+            raise
+
+    def fetch(idx):
+        start, end = ranges[idx]
+        headers = {'Range': f'bytes={start}-{end}'}
+        if etag is not None: headers['If-Match'] = etag
+        # throttled / transient failures are retried by the retry policy (a 412 from If-Match is not)
+        retry.call(fetch_range, start, end, headers)
+
+        with lock:
+            done.add(idx)
+            state['done'] = sorted(done)
+            _save_range_state(state_filename, state)
+
+    # verify the hash while downloading: ranges are hashed in order as soon as they are contiguous
+    sha256 = hashlib.sha256() if hash_prefix is not None else None
+    hashed = 0
+
+    def hash_completed_ranges(reader, hashed):
+        while sha256 is not None and hashed < len(ranges):
+            with lock:
+                if hashed not in done: break
+            start, end = ranges[hashed]
+            reader.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = reader.read(min(chunk_size, remaining))
+                sha256.update(data)
+                remaining -= len(data)
+            hashed += 1
+        return hashed
+
+    with open(partial_filename, 'rb') as reader:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            futures = [executor.submit(fetch, idx) for idx in range(len(ranges)) if idx not in done]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    hashed = hash_completed_ranges(reader, hashed)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        hashed = hash_completed_ranges(reader, hashed)
+
+    if sha256 is not None:
+        try:
+            _check_digest(sha256.hexdigest(), hash_prefix)
+        except RuntimeError:
+            os.remove(partial_filename)
+            os.remove(state_filename)
+            raise
+
+    os.replace(partial_filename, dst)
+    os.remove(state_filename)
+
+def _check_digest(digest, hash_prefix):
+    if not digest.startswith(hash_prefix):
+        raise RuntimeError(f'invalid hash value (expected "{hash_prefix}", got "{digest}")')
+
+def _load_range_state(state_filename):
+    try:
+        with open(state_filename, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_range_state(state_filename, state):
+    tmp_filename = state_filename + '.tmp'
+    with open(tmp_filename, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_filename, state_filename)
+
+def multipart_upload(s3_client, bucket_name, object_key, fileobj, size=None, acl=None, metadata=None,
+                     part_size=MULTIPART_CHUNKSIZE, max_concurrency=DEFAULT_MAX_WORKERS, max_attempts=None,
+                     content_encoding=None):
+    """
+    Upload a file-like object to S3 as a multipart upload with parts sent in parallel.
+
+    Parts are read sequentially from fileobj and handed to a thread pool; at most
+    max_concurrency parts are held in memory at any time. Each part is retried
+    independently (see retry.py), and the upload is aborted if any part ultimately fails.
+
+    Parameters:
+    - s3_client: The S3 client.
+    - bucket_name: The name of the bucket.
+    - object_key: The key for the S3 object.
+    - fileobj: A binary file-like object positioned at the start of the data.
+    - size: The total number of bytes, if known (used to keep under the part limit).
+    - acl: The ACL for the uploaded object.
+    - metadata: Metadata for the uploaded object (e.g., {"sha256": ...}).
+    - part_size: The size of each part in bytes.
+    - max_concurrency: The maximum number of parts uploaded (and held in memory) at once.
+    - max_attempts: The number of attempts per part before giving up (defaults to the retry policy's).
+    - content_encoding: The Content-Encoding of the object (e.g., 'gzip' for compressed data).
+
+    Returns:
+    - The complete_multipart_upload response.
+    """
+    part_size = get_part_size(size, part_size)
+
+    extra_args = {}
+    if acl is not None: extra_args['ACL'] = acl
+    if metadata is not None: extra_args['Metadata'] = metadata
+    if content_encoding is not None: extra_args['ContentEncoding'] = content_encoding
+    upload_id = retry.call(s3_client.create_multipart_upload, Bucket=bucket_name, Key=object_key, **extra_args)['UploadId']
+
+    policy = retry.default_policy if max_attempts is None else retry.RetryPolicy(
+        max_attempts=max_attempts, budget=retry.default_policy.budget, limiter=retry.limiter, stats=retry.stats)
+
+    def upload_part(part_number, data):
+        response = policy.call(s3_client.upload_part, Bucket=bucket_name, Key=object_key, UploadId=upload_id,
+                               PartNumber=part_number, Body=data)
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    try:
+        slots = threading.BoundedSemaphore(max_concurrency)
+        failed = threading.Event()
+        futures = []
+
+        def release(future):
+            if future.exception() is not None:
+                failed.set()
+            slots.release()
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            part_number = 1
+            while not failed.is_set():
+                slots.acquire()
+                data = fileobj.read(part_size)
+                if not data and part_number > 1:
+                    slots.release()
+                    break
+                future = executor.submit(upload_part, part_number, data)
+                future.add_done_callback(release)
+                futures.append(future)
+                if len(data) < part_size:
+                    break
+                part_number += 1
+
+        parts = [future.result() for future in futures]
+        return retry.call(s3_client.complete_multipart_upload, Bucket=bucket_name, Key=object_key, UploadId=upload_id,
+                          MultipartUpload={'Parts': parts})
+    except BaseException:
+        try:
+            s3_client.abort_multipart_upload(Bucket=bucket_name, Key=object_key, UploadId=upload_id)
+        except Exception as e:
+            sys.stderr.write(f"Could not abort the multipart upload of {object_key} ({e!r})\n")
+        raise
@@ -3,11 +3,17 @@ import boto3
 import hashlib
 import requests
 import re
+import time
+import threading
 
+from collections import OrderedDict
 from pathlib import Path
-from urllib.parse import urlparse
+from urllib.parse import urlparse, unquote
 
-from pdb import set_trace
+from .hashindex import get_hash_index
+from . import metrics
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
 
 def is_url_public_readable(url):
     try:
@@ -47,29 +53,31 @@ def parse_s3_url(url):
     hostname = parsed_url.hostname
     path = parsed_url.path
 
-    if hostname.endswith('amazonaws.com'):
+    if hostname is None:
+        raise ValueError("URL is neither an AWS nor a Wasabi S3 URL")
+    elif hostname.endswith('amazonaws.com'):
         domain = 'amazonaws.com'
     elif hostname.endswith('wasabisys.com'):
         domain = 'wasabisys.com'
     else:
-        set_trace()
         raise ValueError("URL is neither an AWS nor a Wasabi S3 URL")
 
-    # Virtual-hosted-style URL
-    match = re.match(r'^(?P<bucket_name>[^.]+)\.s3\.(?P<region>[^.]+)\.' + re.escape(domain), hostname)
+    # Virtual-hosted-style URL: <bucket>.s3[.<region>].<domain>/<key> (bucket names may contain dots,
+    # older AWS endpoints use s3-<region>)
+    match = re.match(r'^(?P<bucket_name>.+)\.s3(?:[.-](?P<region>[^.]+))?\.' + re.escape(domain) + '$', hostname)
     if match:
         bucket_name = match.group('bucket_name')
-        region = match.group('region')
-        object_key = path.lstrip('/')
+        region = match.group('region') or default_region
+        object_key = unquote(path.lstrip('/'))
     else:
-        # Path-style URL
-        match = re.match(r'^s3\.(?P<region>[^.]+)\.' + re.escape(domain), hostname)
+        # Path-style URL: s3[.<region>].<domain>/<bucket>/<key>
+        match = re.match(r'^s3(?:[.-](?P<region>[^.]+))?\.' + re.escape(domain) + '$', hostname)
         if match:
-            region = match.group('region')
+            region = match.group('region') or default_region
             # The path is of the form /bucket_name/object_key
             path_parts = path.lstrip('/').split('/', 1)
             if len(path_parts) == 2:
-                bucket_name, object_key = path_parts
+                bucket_name, object_key = path_parts[0], unquote(path_parts[1])
             elif len(path_parts) == 1:
                 bucket_name = path_parts[0]
                 object_key = ''
@@ -92,16 +100,85 @@ def get_object_name_with_hash_id(local_filename, object_name=None, hash_length=N
 def has_hash(filename):
     return len(Path(filename).stem.split("-")) == 2
 
-def get_file_hash(filename, hash_length=None):
-    with open(filename,"rb") as f:
-        bytes = f.read() # read entire file as bytes
-        readable_hash = hashlib.sha256(bytes).hexdigest();
+HASH_ID_REGEX = re.compile(r'^(?P<stem>.+)-(?P<hash_id>[0-9a-f]+)$')
+# without a hash_length, shorter hex suffixes are taken for part of the name (report-2024.csv, log-20240115.txt)
+MIN_HASH_ID_LENGTH = 10
+
+def strip_hash_id(object_name, hash_length=None):
+    '''Undo get_object_name_with_hash_id: ("a-1b2c3d4e5f.txt", 10) -> ("a.txt", "1b2c3d4e5f").
+
+      Returns (object_name, None) when the name has no hash id: of exactly hash_length hex digits if
+      given, else of at least MIN_HASH_ID_LENGTH.
+    '''
+    path = Path(object_name)
+    match = HASH_ID_REGEX.match(path.stem)
+    if match is None:
+        return object_name, None
+    hash_id = match.group('hash_id')
+    if isinstance(hash_length, int) and len(hash_id) != hash_length:
+        return object_name, None
+    if not isinstance(hash_length, int) and len(hash_id) < MIN_HASH_ID_LENGTH:
+        return object_name, None
+    return match.group('stem') + path.suffix, hash_id
+
+def compute_file_hash(filename, chunk_size=HASH_CHUNK_SIZE):
+    '''sha256 of a file, read in fixed-size chunks so memory use does not grow with the file.'''
+    sha256 = hashlib.sha256()
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(filename, "rb", buffering=0) as f:
+        for n in iter(lambda: f.readinto(buf), 0):
+            sha256.update(view[:n])
+    return sha256.hexdigest()
+
+def get_file_hash(filename, hash_length=None, use_index=True):
+    index = get_hash_index() if use_index else None
+    stat = os.stat(filename)
+    readable_hash = index.get(filename, stat=stat) if index is not None else None
+    if index is not None: metrics.cache_hit('hash_index', readable_hash is not None)
+    if readable_hash is None:
+        with metrics.timer('hash') as timing:
+            readable_hash = compute_file_hash(filename)
+            timing.bytes_in = stat.st_size
+        if index is not None: index.put(filename, readable_hash, stat=stat)
     
     if isinstance(hash_length, (int)):
         readable_hash = readable_hash[0:hash_length]  
 
     return readable_hash
 
+class HashingReader(object):
+    '''Wrap a binary file object so the sha256 of everything read through it is computed on the fly.
+
+      Seeking is passed through (clients rewind bodies to retry or to compute checksums): the hash
+      covers the bytes read contiguously from the start, each byte once, so hexdigest() is the file's
+      sha256 once bytes_hashed reaches its size.
+    '''
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.bytes_hashed = 0
+        self._position = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        start = self.bytes_hashed - self._position
+        if 0 <= start < len(data):
+            self.sha256.update(data[start:])
+            self.bytes_hashed += len(data) - start
+        self._position += len(data)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self._position = self.fileobj.seek(offset, whence)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
 def check_hashid(hashid, weights_path):
     weights_hash = get_file_hash(weights_path)
     assert weights_hash.startswith(hashid), f"Oops, expected weights_hash to start with {hashid}, got {weights_hash}"
@@ -112,5 +189,43 @@ def get_subfolder(weight_file, split_from="logs"):
     subfolder = f"{os.path.sep}".join(parts[parts.index(split_from):-1])
     
     return subfolder
-    
-  
\ No newline at end of file
+
+class TTLCache(object):
+    '''A small thread-safe mapping whose entries expire ttl seconds after they were set.'''
+    def __init__(self, ttl, maxsize=100000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None: ttl = self.ttl
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.monotonic() + ttl, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+_MISSING = object()
@@ -15,8 +15,15 @@ setup(
     packages=find_packages(),
     install_requires=[
         "boto3>=1.34.0",
-        "pandas"
+        "pandas",
+        "requests",
+        "tqdm"
     ],
+    extras_require={
+        "async": ["aiobotocore"],
+        "zstd": ["zstandard"],
+        "test": ["pytest"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,372 @@
+"""
+In-memory stand-ins for the S3 client, bucket resource and presigned-url GETs used by the tests.
+
+FakeS3Client implements the subset of the boto3 S3 client the package calls (objects, listings with
+Delimiter / StartAfter / pagination, conditional and ranged GETs, multipart uploads), records every
+call in .calls and lets a test inject failures with .fail[operation] = fn(**kwargs) -> exception or None.
+The http fixture serves the client's objects to transfer._get the way S3 serves presigned urls.
+"""
+import io
+import os
+import asyncio
+import hashlib
+import tempfile
+import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from types import SimpleNamespace
+from urllib.parse import urlparse, unquote
+
+# the hash index is a process-wide sqlite file, created on first use
+os.environ.setdefault('S3_FILESTORE_HASH_INDEX', os.path.join(tempfile.mkdtemp(), 'hash_index.sqlite'))
+
+import pytest
+import urllib3
+import requests
+import botocore.exceptions
+
+from s3_filestore import auth, retry, transfer
+
+URL_ROOT = 'https://fake-s3.test'
+
+def client_error(code, status, operation='Operation'):
+    return botocore.exceptions.ClientError({'Error': {'Code': code, 'Message': code},
+                                            'ResponseMetadata': {'HTTPStatusCode': status}}, operation)
+
+class StreamingBody(object):
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._data.read(size)
+
+    def iter_chunks(self, chunk_size=1024):
+        for chunk in iter(lambda: self._data.read(chunk_size), b''):
+            yield chunk
+
+    def close(self):
+        pass
+
+class FakePaginator(object):
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, PaginationConfig=None, **kwargs):
+        kwargs['MaxKeys'] = (PaginationConfig or {}).get('PageSize', 1000)
+        while True:
+            page = self.client.list_objects_v2(**kwargs)
+            yield page
+            if not page['IsTruncated']:
+                return
+            kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+class FakeS3Client(object):
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+        self.fail = {}
+        self.uploads = {}
+        self.meta = SimpleNamespace(endpoint_url=URL_ROOT)
+        self._clock = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+    def _call(self, operation, kwargs):
+        self.calls.append((operation, kwargs))
+        fail = self.fail.get(operation)
+        error = fail(**kwargs) if fail is not None else None
+        if error is not None:
+            raise error
+
+    def count(self, operation):
+        return sum(1 for op, _ in self.calls if op == operation)
+
+    def _store(self, key, body, metadata=None, content_encoding=None):
+        # one second per write, so conditional requests on Last-Modified can tell versions apart
+        self._clock += datetime.timedelta(seconds=1)
+        self.objects[key] = dict(body=body, metadata=dict(metadata or {}), etag='"%s"' % hashlib.md5(body).hexdigest(),
+                                 last_modified=self._clock, content_encoding=content_encoding)
+        return self.objects[key]
+
+    def _get(self, key, operation):
+        obj = self.objects.get(key)
+        if obj is None:
+            raise client_error('404' if operation == 'HeadObject' else 'NoSuchKey', 404, operation)
+        return obj
+
+    def put_object(self, Bucket, Key, Body=b'', ACL=None, Metadata=None, ContentEncoding=None):
+        self._call('put_object', dict(Bucket=Bucket, Key=Key, ACL=ACL, Metadata=Metadata, ContentEncoding=ContentEncoding))
+        body = Body if isinstance(Body, bytes) else Body.read()
+        return dict(ETag=self._store(Key, body, Metadata, ContentEncoding)['etag'])
+
+    def _response(self, obj, body):
+        response = dict(ETag=obj['etag'], ContentLength=len(body), LastModified=obj['last_modified'], Metadata=obj['metadata'])
+        if obj['content_encoding'] is not None: response['ContentEncoding'] = obj['content_encoding']
+        return response
+
+    def head_object(self, Bucket, Key, IfNoneMatch=None):
+        self._call('head_object', dict(Bucket=Bucket, Key=Key))
+        obj = self._get(Key, 'HeadObject')
+        return self._response(obj, obj['body'])
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, IfNoneMatch=None):
+        self._call('get_object', dict(Bucket=Bucket, Key=Key, Range=Range, IfMatch=IfMatch, IfNoneMatch=IfNoneMatch))
+        obj = self._get(Key, 'GetObject')
+        if IfMatch is not None and IfMatch != obj['etag']:
+            raise client_error('PreconditionFailed', 412, 'GetObject')
+        if IfNoneMatch is not None and IfNoneMatch == obj['etag']:
+            raise client_error('304', 304, 'GetObject')
+        body = obj['body']
+        if Range is not None:
+            start, end = parse_range(Range, len(body))
+            body = body[start:end + 1]
+        response = self._response(obj, body)
+        response['Body'] = StreamingBody(body)
+        return response
+
+    def list_objects_v2(self, Bucket, Prefix='', Delimiter=None, StartAfter=None, MaxKeys=1000, ContinuationToken=None):
+        self._call('list_objects_v2', dict(Bucket=Bucket, Prefix=Prefix, Delimiter=Delimiter, StartAfter=StartAfter,
+                                           MaxKeys=MaxKeys, ContinuationToken=ContinuationToken))
+        after = ContinuationToken if ContinuationToken is not None else StartAfter
+        entries = []  # (key, key or CommonPrefix, kind); CommonPrefixes count against MaxKeys like keys
+        for key in sorted(k for k in self.objects if k.startswith(Prefix) and (after is None or k > after)):
+            if Delimiter is not None and Delimiter in key[len(Prefix):]:
+                common_prefix = key[:len(Prefix) + key[len(Prefix):].index(Delimiter) + len(Delimiter)]
+                if not entries or entries[-1][1] != common_prefix:
+                    entries.append((key, common_prefix, 'prefix'))
+            else:
+                entries.append((key, key, 'key'))
+        page, rest = entries[:MaxKeys], entries[MaxKeys:]
+        response = dict(IsTruncated=bool(rest), KeyCount=len(page),
+                        Contents=[dict(Key=key, Size=len(self.objects[key]['body']), ETag=self.objects[key]['etag'],
+                                       LastModified=self.objects[key]['last_modified'])
+                                  for key, _, kind in page if kind == 'key'],
+                        CommonPrefixes=[dict(Prefix=value) for _, value, kind in page if kind == 'prefix'])
+        if rest:
+            last = page[-1]
+            response['NextContinuationToken'] = last[0] if last[2] == 'key' else last[1] + '￿'
+        return response
+
+    def get_paginator(self, operation):
+        assert operation == 'list_objects_v2'
+        return FakePaginator(self)
+
+    def delete_objects(self, Bucket, Delete):
+        keys = [o['Key'] for o in Delete['Objects']]
+        self._call('delete_objects', dict(Bucket=Bucket, Keys=keys))
+        for key in keys:
+            self.objects.pop(key, None)
+        return {}
+
+    def get_object_acl(self, Bucket, Key):
+        self._call('get_object_acl', dict(Bucket=Bucket, Key=Key))
+        obj = self._get(Key, 'GetObjectAcl')
+        if obj.get('acl') in ('public-read', 'public-read-write'):
+            return dict(Grants=[{'Grantee': {'URI': 'http://acs.amazonaws.com/groups/global/AllUsers'}, 'Permission': 'READ'}])
+        return dict(Grants=[])
+
+    def put_object_acl(self, Bucket, Key, ACL):
+        self._call('put_object_acl', dict(Bucket=Bucket, Key=Key, ACL=ACL))
+        self._get(Key, 'PutObjectAcl')['acl'] = ACL
+        return {}
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn=3600, HttpMethod='GET'):
+        return f"{URL_ROOT}/{Params['Bucket']}/{Params['Key']}?X-Amz-Signature=fake"
+
+    def create_multipart_upload(self, Bucket, Key, ACL=None, Metadata=None, ContentEncoding=None):
+        self._call('create_multipart_upload', dict(Bucket=Bucket, Key=Key))
+        upload_id = str(len(self.uploads) + 1)
+        self.uploads[upload_id] = dict(parts={}, metadata=Metadata, content_encoding=ContentEncoding)
+        return dict(UploadId=upload_id)
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self._call('upload_part', dict(Bucket=Bucket, Key=Key, UploadId=UploadId, PartNumber=PartNumber))
+        self.uploads[UploadId]['parts'][PartNumber] = bytes(Body)
+        return dict(ETag='"part%d"' % PartNumber)
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._call('complete_multipart_upload', dict(Bucket=Bucket, Key=Key, UploadId=UploadId))
+        upload = self.uploads.pop(UploadId)
+        body = b''.join(upload['parts'][part['PartNumber']] for part in MultipartUpload['Parts'])
+        return dict(ETag=self._store(Key, body, upload['metadata'], upload['content_encoding'])['etag'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._call('abort_multipart_upload', dict(Bucket=Bucket, Key=Key, UploadId=UploadId))
+        self.uploads.pop(UploadId, None)
+
+class FakeObject(object):
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+
+    def put(self, Body, **kwargs):
+        return self.bucket.meta.client.put_object(Bucket=self.bucket.name, Key=self.key, Body=Body, **kwargs)
+
+class FakeBucket(object):
+    def __init__(self, client, name='bucket', region='us-east-1'):
+        self.name = name
+        self.region = region
+        self.meta = SimpleNamespace(client=client)
+
+    def Object(self, key):
+        return FakeObject(self, key)
+
+def parse_range(header, size):
+    start, end = header[len('bytes='):].split('-')
+    return int(start), min(int(end), size - 1) if end else size - 1
+
+class FakeRaw(object):
+    def __init__(self, body, length=None):
+        self._body = body
+        self._length = len(body) if length is None else length
+
+    def stream(self, chunk_size, decode_content=True):
+        for start in range(0, len(self._body), chunk_size):
+            yield self._body[start:start + chunk_size]
+        # like urllib3 (enforce_content_length), a body shorter than its Content-Length fails the read
+        if len(self._body) < self._length:
+            raise urllib3.exceptions.ProtocolError('Connection broken: IncompleteRead')
+
+class FakeResponse(object):
+    """The parts of requests.Response used by transfer.py, over a body that may be cut short."""
+    def __init__(self, status_code, headers, body=b''):
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.raw = FakeRaw(body, length=int(self.headers.get('Content-Length', len(body))))
+        self._body = body
+
+    def iter_content(self, chunk_size=1):
+        try:
+            yield from self.raw.stream(chunk_size)
+        except urllib3.exceptions.ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+
+    def raise_for_status(self):
+        # error statuses are raised by FakeHttp itself, like transfer._get does
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class FakeHttp(object):
+    """Serves FakeS3Client objects at their presigned urls; .truncate[key] = n cuts the next n bodies short."""
+    def __init__(self, client):
+        self.client = client
+        self.requests = []
+        self.truncate = {}
+        self.fail = None
+
+    def get(self, url, headers=None):
+        headers = dict(headers or {})
+        self.requests.append((url, headers))
+        if self.fail is not None:
+            error = self.fail(url, headers)
+            if error is not None: raise error
+        path = unquote(urlparse(url).path).lstrip('/')
+        _, key = path.split('/', 1)
+        obj = self.client.objects.get(key)
+        if obj is None:
+            raise self._error(404)
+        if 'If-Match' in headers and headers['If-Match'] != obj['etag']:
+            raise self._error(412)
+        if 'If-None-Match' in headers and headers['If-None-Match'] == obj['etag']:
+            return FakeResponse(304, {})
+        if ('If-Modified-Since' in headers and 'If-None-Match' not in headers
+                and obj['last_modified'] <= parsedate_to_datetime(headers['If-Modified-Since'])):
+            return FakeResponse(304, {})
+
+        body, status = obj['body'], 200
+        response_headers = {'ETag': obj['etag'], 'Accept-Ranges': 'bytes',
+                            'Last-Modified': formatdate(obj['last_modified'].timestamp(), usegmt=True)}
+        response_headers.update({'x-amz-meta-' + k: v for k, v in obj['metadata'].items()})
+        if obj['content_encoding'] is not None: response_headers['Content-Encoding'] = obj['content_encoding']
+        if 'Range' in headers:
+            start, end = parse_range(headers['Range'], len(body))
+            body, status = body[start:end + 1], 206
+        response_headers['Content-Length'] = str(len(body))
+        if self.truncate.get(key):
+            self.truncate[key] -= 1
+            body = body[:len(body) // 2]
+        return FakeResponse(status, response_headers, body)
+
+    def head(self, url, headers=None):
+        response = self.get(url, headers=headers)
+        return FakeResponse(response.status_code, response.headers)
+
+    def _error(self, status):
+        return requests.HTTPError(f"{status} error", response=SimpleNamespace(status_code=status))
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(retry.default_policy, 'base_delay', 0)
+    monkeypatch.setattr(retry.default_policy, 'throttle_base_delay', 0)
+    auth._object_public.clear()
+
+@pytest.fixture
+def s3_client():
+    return FakeS3Client()
+
+@pytest.fixture
+def bucket(s3_client):
+    return FakeBucket(s3_client)
+
+@pytest.fixture
+def http(s3_client, monkeypatch):
+    server = FakeHttp(s3_client)
+    monkeypatch.setattr(transfer, '_get', server.get)
+    return server
+
+class AsyncStreamingBody(object):
+    def __init__(self, body):
+        self._body = body
+
+    async def read(self, size=-1):
+        await asyncio.sleep(0)
+        return self._body.read(size)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._body.close()
+
+class AsyncFakePaginator(object):
+    def __init__(self, client):
+        self.client = client
+
+    async def paginate(self, **kwargs):
+        for page in FakePaginator(self.client).paginate(**kwargs):
+            await asyncio.sleep(0)
+            yield page
+
+class AsyncFakeS3Client(object):
+    """Coroutine versions of FakeS3Client's methods, standing in for an aiobotocore client."""
+    def __init__(self, client):
+        self.client = client
+
+    def get_paginator(self, operation):
+        assert operation == 'list_objects_v2'
+        return AsyncFakePaginator(self.client)
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        async def call(*args, **kwargs):
+            await asyncio.sleep(0)
+            response = method(*args, **kwargs)
+            if isinstance(response, dict) and 'Body' in response:
+                response['Body'] = AsyncStreamingBody(response['Body'])
+            return response
+        return call
+
+@pytest.fixture
+def store(s3_client, bucket, tmp_path, monkeypatch):
+    from s3_filestore.filestore import S3FileStore
+
+    def set_session_bucket(self):
+        self.bucket_region, self.s3_client, self.bucket = bucket.region, s3_client, bucket
+    monkeypatch.setattr(S3FileStore, 'set_session_bucket', set_session_bucket)
+    return lambda **kwargs: S3FileStore('bucket', profile=None, endpoint_url=URL_ROOT, acl='private',
+                                        cache_dir=str(tmp_path / 'cache'), **kwargs)
@@ -0,0 +1,98 @@
+import json
+import asyncio
+import hashlib
+
+import pytest
+
+from s3_filestore import functional as F
+from s3_filestore.aio import AsyncS3FileStore
+
+from conftest import AsyncFakeS3Client, URL_ROOT
+
+def make_store(s3_client, tmp_path, **kwargs):
+    s3 = AsyncS3FileStore('bucket', profile=None, endpoint_url=URL_ROOT, acl='private', cache_dir=str(tmp_path / 'cache'), **kwargs)
+    s3.s3_client, s3._semaphore = AsyncFakeS3Client(s3_client), asyncio.Semaphore(4)
+    return s3
+
+def test_multipart_upload(s3_client, tmp_path):
+    data = bytes(range(256)) * 64 * 1024
+    s3 = make_store(s3_client, tmp_path, multipart_threshold=1, multipart_chunksize=5 * 1024 * 1024, max_concurrency=2)
+    filename = tmp_path / 'weights.bin'
+    filename.write_bytes(data)
+
+    asyncio.run(s3.upload_file(str(filename), 'models', verbose=False))
+    key = next(iter(s3_client.objects))
+    assert s3_client.objects[key]['body'] == data
+    assert s3_client.count('upload_part') == 4
+
+def test_multipart_upload_failure_keeps_the_original_error(s3_client, tmp_path, capsys):
+    s3 = make_store(s3_client, tmp_path, multipart_threshold=1, multipart_chunksize=5 * 1024 * 1024, max_concurrency=2)
+    filename = tmp_path / 'weights.bin'
+    filename.write_bytes(b'x' * 16 * 1024 * 1024)
+    s3_client.fail['upload_part'] = lambda PartNumber, **kwargs: ValueError('part failed') if PartNumber == 1 else None
+    s3_client.fail['abort_multipart_upload'] = lambda **kwargs: RuntimeError('abort failed')
+
+    with pytest.raises(ValueError, match='part failed'):
+        asyncio.run(s3.upload_file(str(filename), 'models', verbose=False))
+    assert s3_client.count('abort_multipart_upload') == 1
+    assert 'abort failed' in capsys.readouterr().err
+    assert s3_client.objects == {}
+
+def test_multipart_upload_fails_fast(s3_client, tmp_path):
+    s3 = make_store(s3_client, tmp_path, multipart_threshold=1, multipart_chunksize=5 * 1024 * 1024, max_concurrency=1)
+    filename = tmp_path / 'weights.bin'
+    filename.write_bytes(b'x' * 16 * 1024 * 1024)
+    s3_client.fail['upload_part'] = lambda PartNumber, **kwargs: ValueError('part failed') if PartNumber == 1 else None
+
+    with pytest.raises(ValueError, match='part failed'):
+        asyncio.run(s3.upload_file(str(filename), 'models', verbose=False))
+    # the remaining 3 parts are neither read nor uploaded once the first one has failed
+    assert s3_client.count('upload_part') == 1
+    assert s3_client.count('abort_multipart_upload') == 1
+
+def test_upload_files_checks_the_subfolders(s3_client, tmp_path):
+    s3 = make_store(s3_client, tmp_path)
+    with pytest.raises(ValueError, match='Got 1 bucket_subfolders for 2 files'):
+        asyncio.run(s3.upload_files(['a.txt', 'b.txt'], ['data'], verbose=False))
+    with pytest.raises(TypeError):
+        asyncio.run(s3.upload_files(['a.txt'], None, verbose=False))
+
+def test_concurrent_downloads_share_one_request(s3_client, tmp_path):
+    s3_client.put_object(Bucket='bucket', Key='data/results.json', Body=b'{"a": 1}')
+    s3 = make_store(s3_client, tmp_path)
+
+    async def download_twice():
+        return await asyncio.gather(s3.download_object('data/results.json', progress=False),
+                                    s3.download_object('data/results.json', progress=False))
+    first, second = asyncio.run(download_twice())
+    assert first == second
+    assert open(first, 'rb').read() == b'{"a": 1}'
+    assert s3_client.count('get_object') == 1
+
+def test_upload_data_and_get_metadata(s3_client, tmp_path):
+    s3 = make_store(s3_client, tmp_path)
+    bucket_key, url = asyncio.run(s3.upload_data({'a': 1}, 'data/results.json', verbose=False))
+    assert bucket_key == 'data/results.json'
+    assert url.startswith(f'{URL_ROOT}/bucket/data/results.json?')
+    body = s3_client.objects[bucket_key]['body']
+    assert json.loads(body) == {'a': 1}
+    assert asyncio.run(s3.get_metadata(bucket_key, key='sha256')) == hashlib.sha256(body).hexdigest()
+    assert asyncio.run(s3.get_metadata(bucket_key)) == s3_client.objects[bucket_key]['metadata']
+
+@pytest.mark.parametrize('depth,directory_filter', [(None, None), (None, True), (0, False), (1, False), (1, True), (2, None)])
+def test_list_objects_matches_filter_keys(s3_client, tmp_path, depth, directory_filter):
+    keys = ['data/a.txt', 'data/x/b.txt', 'data/x/y/c.txt', 'data/z/d.txt', 'other/e.txt']
+    for key in keys:
+        s3_client.put_object(Bucket='bucket', Key=key, Body=b'.')
+    s3 = make_store(s3_client, tmp_path)
+    s3_client.calls.clear()
+
+    objects = asyncio.run(s3.list_objects('data', depth=depth, directory_filter=directory_filter))
+    expected = list(F.filter_keys([key for key in keys if key.startswith('data/')], prefix='data/', depth=depth,
+                                  directory_filter=directory_filter))
+    assert sorted(objects) == sorted(expected)
+    listed = [kwargs for op, kwargs in s3_client.calls if op == 'list_objects_v2']
+    if depth is not None:
+        # the listing walks the levels with a delimiter and never lists below depth
+        assert all(kwargs['Delimiter'] == '/' for kwargs in listed)
+        assert all(kwargs['Prefix'].count('/') <= depth + 1 for kwargs in listed)
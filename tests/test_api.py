@@ -0,0 +1,41 @@
+import pytest
+import requests
+
+from s3_filestore import api, auth
+
+from conftest import URL_ROOT, client_error
+
+def test_get_s3_url_metadata_retries_throttling_and_only_maps_404_to_none(s3_client, http, monkeypatch):
+    monkeypatch.setattr(api.requests, 'head', http.head)
+    s3_client.put_object(Bucket='bucket', Key='results.json', Body=b'{}', Metadata={'sha256': 'abc'})
+    url = f'{URL_ROOT}/bucket/results.json'
+
+    responses = iter([503, None])
+    http.fail = lambda url, headers: (lambda status: status and http._error(status))(next(responses, None))
+    assert api.get_s3_url_metadata(url, key='sha256') == 'abc'
+    assert len(http.requests) == 2
+
+    http.fail = None
+    assert api.get_s3_url_metadata(f'{URL_ROOT}/bucket/missing.json') is None
+
+    http.fail = lambda url, headers: http._error(503)
+    with pytest.raises(requests.HTTPError):
+        api.get_s3_url_metadata(url)
+
+    http.fail = lambda url, headers: http._error(403)
+    with pytest.raises(requests.HTTPError):
+        api.get_s3_url_metadata(url)
+
+def test_update_object_acl_retries_and_raises(s3_client):
+    s3_client.put_object(Bucket='bucket', Key='a', Body=b'data')
+    failures = iter([client_error('SlowDown', 503)])
+    s3_client.fail['put_object_acl'] = lambda **kwargs: next(failures, None)
+    api.update_object_acl(s3_client, 'bucket', 'a', 'public-read', verbose=False)
+    assert s3_client.count('put_object_acl') == 2
+    assert s3_client.objects['a']['acl'] == 'public-read'
+    assert auth.cached_object_public(s3_client, 'bucket', 'a') is True
+
+    s3_client.fail['put_object_acl'] = lambda **kwargs: client_error('AccessDenied', 403)
+    with pytest.raises(Exception, match='AccessDenied'):
+        api.update_object_acl(s3_client, 'bucket', 'a', 'private', verbose=False)
+    assert auth.cached_object_public(s3_client, 'bucket', 'a') is True
@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+
+import pytest
+
+from s3_filestore import auth
+
+from conftest import FakeS3Client, client_error
+
+def test_generate_urls_looks_up_each_acl_once(s3_client):
+    for key in ('a', 'denied'):
+        s3_client.put_object(Bucket='bucket', Key=key, Body=b'data')
+    s3_client.fail['get_object_acl'] = lambda Key, **kwargs: client_error('AccessDenied', 403) if Key == 'denied' else None
+    urls = auth.generate_urls(s3_client, 'bucket', ['a', 'denied', 'a'])
+    assert all('X-Amz-Signature' in url for url in urls)
+    assert s3_client.count('get_object_acl') == 2
+
+    # the answer for the object whose ACL could not be read is not cached
+    auth.generate_urls(s3_client, 'bucket', ['a', 'denied'])
+    assert s3_client.count('get_object_acl') == 3
+
+def test_generate_urls_raises_lookups_that_keep_failing(s3_client):
+    s3_client.fail['get_object_acl'] = lambda Key, **kwargs: client_error('SlowDown', 503) if Key == 'busy' else None
+    with pytest.raises(Exception, match='SlowDown'):
+        auth.generate_urls(s3_client, 'bucket', ['a', 'busy'])
+
+def test_acl_cache_is_keyed_by_endpoint(s3_client):
+    other = FakeS3Client()
+    other.meta = SimpleNamespace(endpoint_url='https://other-s3.test')
+    auth.remember_object_acl(s3_client, 'bucket', 'key', 'public-read')
+    assert auth.cached_object_public(s3_client, 'bucket', 'key') is True
+    assert auth.cached_object_public(other, 'bucket', 'key') is None
+    assert auth.is_object_private(other, 'bucket', 'key')
@@ -0,0 +1,101 @@
+import os
+import time
+
+from s3_filestore import cache as cache_module
+from s3_filestore import functional as F
+from s3_filestore.cache import CacheManager
+
+from conftest import URL_ROOT
+
+def put(cache, key, size):
+    filename = cache.cache_path('bucket', key)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'wb') as f:
+        f.write(b'x' * size)
+    return cache.add('bucket', key)
+
+def test_running_total_tracks_inserts_replacements_and_removals(tmp_path):
+    cache = CacheManager(str(tmp_path))
+    put(cache, 'a', 100)
+    put(cache, 'b', 50)
+    put(cache, 'a', 30)
+    assert cache.cache_info()['bytes'] == 80 and cache.cache_info()['entries'] == 2
+    cache.remove('bucket', 'b')
+    assert cache.cache_info()['bytes'] == 30
+
+    # an index reopened later (or by another process) starts from the stored total
+    assert CacheManager(str(tmp_path)).cache_info()['bytes'] == 30
+
+def test_add_prunes_only_over_budget_down_to_the_target(tmp_path, monkeypatch):
+    cache = CacheManager(str(tmp_path), max_bytes=1000)
+    prunes = []
+    prune = cache.prune
+    monkeypatch.setattr(cache, 'prune', lambda **kwargs: prunes.append(kwargs) or prune(**kwargs))
+
+    for i in range(10):
+        put(cache, f'k{i}', 100)
+        time.sleep(0.001)
+    assert prunes == [] and cache.cache_info()['bytes'] == 1000
+
+    last = put(cache, 'k10', 100)
+    assert len(prunes) == 1
+    assert cache.cache_info()['bytes'] <= 1000 * cache_module.PRUNE_TARGET
+    assert os.path.exists(last) and cache.lookup('bucket', 'k0') is None
+
+    # back under the target, the next download does not prune again
+    put(cache, 'k11', 100)
+    assert len(prunes) == 1
+
+def test_files_added_in_a_batch_survive_until_it_ends(tmp_path):
+    cache = CacheManager(str(tmp_path), max_bytes=250)
+    put(cache, 'old', 100)
+    with cache.batch():
+        filenames = [put(cache, f'k{i}', 100) for i in range(3)]
+        assert all(os.path.exists(filename) for filename in filenames)
+    assert all(os.path.exists(filename) for filename in filenames)
+    assert cache.lookup('bucket', 'old') is None
+
+    put(cache, 'new', 100)
+    assert cache.cache_info()['bytes'] <= 250
+
+def test_prune_older_than(tmp_path):
+    cache = CacheManager(str(tmp_path))
+    put(cache, 'a', 10)
+    time.sleep(0.05)
+    put(cache, 'b', 10)
+    assert cache.prune(older_than=0.03) == dict(removed=1, freed_bytes=10)
+    assert cache.lookup('bucket', 'a') is None and cache.lookup('bucket', 'b') is not None
+
+def test_download_if_needed_revalidates_mutable_keys(s3_client, http, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    url = f'{URL_ROOT}/bucket/latest.txt'
+    s3_client.put_object(Bucket='bucket', Key='latest.txt', Body=b'v1')
+
+    filename = F.download_if_needed(url, cache_dir=cache_dir, progress=False)
+    assert F.download_if_needed(url, cache_dir=cache_dir, progress=False) == filename
+    assert http.requests[-1][1]['If-None-Match'] == s3_client.objects['latest.txt']['etag']
+    with open(filename, 'rb') as f:
+        assert f.read() == b'v1'
+
+    s3_client.put_object(Bucket='bucket', Key='latest.txt', Body=b'v2')
+    F.download_if_needed(url, cache_dir=cache_dir, progress=False)
+    with open(filename, 'rb') as f:
+        assert f.read() == b'v2'
+
+    # within max_age the cached file is used without a request
+    requests = len(http.requests)
+    F.download_if_needed(url, cache_dir=cache_dir, progress=False, max_age=60)
+    assert len(http.requests) == requests
+
+def test_cache_key_for_url_ignores_the_url_style_and_query():
+    expected = ('my.bucket', 'data/results 1.json')
+    urls = ['s3://my.bucket/data/results%201.json',
+            'https://s3.amazonaws.com/my.bucket/data/results%201.json',
+            'https://s3.eu-west-1.amazonaws.com/my.bucket/data/results%201.json',
+            'https://my.bucket.s3.amazonaws.com/data/results%201.json?X-Amz-Signature=abc&X-Amz-Expires=3600',
+            'https://my.bucket.s3.eu-west-1.amazonaws.com/data/results%201.json?X-Amz-Signature=def',
+            'https://my.bucket.s3-eu-west-1.amazonaws.com/data/results%201.json',
+            'https://s3.eu-central-1.wasabisys.com/my.bucket/data/results%201.json?X-Amz-Signature=ghi']
+    for url in urls:
+        assert cache_module.cache_key_for_url(url) == expected, url
+    assert cache_module.cache_key_for_url(f'{URL_ROOT}/bucket/a.json?token=1') == ('fake-s3.test', 'bucket/a.json')
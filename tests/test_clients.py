@@ -0,0 +1,14 @@
+from s3_filestore import clients
+
+def test_pool_size_is_part_of_the_client_and_resource_keys(monkeypatch):
+    monkeypatch.setitem(clients._userdata, 'test-profile', dict(S3_ACCESS_KEY_ID='key', S3_SECRET_ACCESS_KEY='secret',
+                                                                 S3_ENDPOINT_URL='https://s3.test'))
+    try:
+        for get in (clients.get_client, clients.get_resource):
+            small = get('test-profile', region_name='us-east-1', max_pool_connections=7)
+            large = get('test-profile', region_name='us-east-1', max_pool_connections=64)
+            assert small is get('test-profile', region_name='us-east-1', max_pool_connections=7) and small is not large
+            client = small if get is clients.get_client else small.meta.client
+            assert client.meta.config.max_pool_connections == 7
+    finally:
+        clients.clear()
@@ -0,0 +1,88 @@
+import io
+import os
+import gzip
+import asyncio
+import hashlib
+import importlib.util
+
+import pytest
+
+from s3_filestore import functional as F
+from s3_filestore import compression as C
+from s3_filestore.aio import AsyncS3FileStore
+
+from conftest import AsyncFakeS3Client
+
+CODECS = ['gzip'] + (['zstd'] if importlib.util.find_spec('zstandard') is not None else [])
+DATA = b'step,loss\n' + b''.join(b'%d,%f\n' % (i, 1 / (i + 1)) for i in range(5000))
+
+def write(path, data=DATA):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_compressed_upload_round_trip(s3_client, bucket, http, tmp_path, codec):
+    filename = write(tmp_path / 'results.csv')
+    F.upload_file(s3_client, bucket, filename, 'results.csv', acl='private', verbose=False, compression=codec)
+
+    obj = s3_client.objects['results.csv']
+    assert obj['content_encoding'] == codec and len(obj['body']) < len(DATA)
+    assert obj['metadata']['sha256'] == hashlib.sha256(DATA).hexdigest()
+    assert obj['metadata']['stored-sha256'] == hashlib.sha256(obj['body']).hexdigest()
+    assert obj['metadata']['compression'] == codec
+
+    url = s3_client.generate_presigned_url('get_object', Params={'Bucket': 'bucket', 'Key': 'results.csv'})
+    local_filename = F.download_if_needed(url, cache_dir=str(tmp_path / 'cache'), progress=False)
+    with open(local_filename, 'rb') as f:
+        assert f.read() == DATA
+    buffer = F.download_object_to_buffer(s3_client, 'bucket', 'results.csv', progress=False)
+    assert buffer.read() == DATA
+
+def test_truncated_compressed_stream_is_rejected():
+    compressed = gzip.compress(DATA)
+    decompressor = C.Decompressor('gzip')
+    decompressor.decompress(compressed[:len(compressed) // 2])
+    with pytest.raises(IOError):
+        decompressor.finish()
+    with pytest.raises(ValueError):
+        C.check_codec('brotli')
+
+def test_store_compression_applies_to_batch_uploads_and_sync(store, s3_client, tmp_path):
+    s3 = store(compression='gzip')
+    local_dir = tmp_path / 'local'
+    os.makedirs(local_dir)
+    filenames = [write(local_dir / 'a.csv'), write(local_dir / 'b.csv', DATA * 2)]
+
+    results = s3.upload_files(filenames, 'batch', verbose=False)
+    assert [r.status for r in results] == ['uploaded', 'uploaded']
+    assert all(s3_client.objects[r.key]['content_encoding'] == 'gzip' for r in results)
+    # the listing reports the compressed size, the hash in the key decides
+    assert [r.status for r in s3.upload_files(filenames, 'batch', verbose=False)] == ['skipped', 'skipped']
+
+    result = s3.sync(str(local_dir), 'synced', verbose=False)
+    assert len(result['uploaded']) == 2
+    assert all(s3_client.objects[key]['content_encoding'] == 'gzip' for key in result['uploaded'])
+    assert s3.sync(str(local_dir), 'synced', verbose=False)['uploaded'] == []
+
+    assert s3.upload_files(filenames[:1], 'plain', verbose=False, compression=False)[0].status == 'uploaded'
+    assert s3_client.objects[results[0].key.replace('batch/', 'plain/')]['content_encoding'] is None
+
+def test_async_store_compression(s3_client, tmp_path):
+    filename = write(tmp_path / 'results.csv')
+
+    async def upload():
+        s3 = AsyncS3FileStore('bucket', profile=None, endpoint_url='https://fake-s3.test', acl='private',
+                              cache_dir=str(tmp_path / 'cache'), compression='gzip')
+        s3.s3_client, s3._semaphore = AsyncFakeS3Client(s3_client), asyncio.Semaphore(4)
+        await s3.upload_file(filename, 'files', verbose=False)
+        key, _ = await s3.upload_data({'loss': [1, 2]}, 'data/results.json', verbose=False)
+        return key
+    key = asyncio.run(upload())
+
+    file_key = next(k for k in s3_client.objects if k.startswith('files/'))
+    for k, data in ((file_key, DATA), (key, b'{"loss": [1, 2]}')):
+        obj = s3_client.objects[k]
+        assert obj['content_encoding'] == 'gzip' and gzip.decompress(obj['body']) == data
+        assert obj['metadata']['sha256'] == hashlib.sha256(data).hexdigest()
+        assert obj['metadata']['stored-sha256'] == hashlib.sha256(obj['body']).hexdigest()
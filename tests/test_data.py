@@ -0,0 +1,60 @@
+import io
+import json
+import hashlib
+import tempfile
+
+from s3_filestore import functional as F
+from s3_filestore.data import hash_buffer, buffer_reader, prepare_data_for_upload
+
+class PlainFile(object):
+    """A binary file object with only read / seek / tell, like SpooledTemporaryFile before Python 3.11."""
+    def __init__(self, data):
+        self._f = io.BytesIO(data)
+        self.closed = False
+
+    def read(self, size=-1):
+        return self._f.read(size)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._f.seek(offset, whence)
+
+    def tell(self):
+        return self._f.tell()
+
+    def close(self):
+        self.closed = True
+
+def test_hash_buffer_in_memory_and_spilled():
+    data = b'x' * 1000
+    for spill_threshold in (10 ** 6, 10):
+        buffer = tempfile.SpooledTemporaryFile(max_size=spill_threshold)
+        buffer.write(data)
+        assert hash_buffer(buffer, chunk_size=64) == (hashlib.sha256(data).hexdigest(), len(data))
+        assert buffer.tell() == 0
+    assert hash_buffer(PlainFile(data)) == (hashlib.sha256(data).hexdigest(), len(data))
+
+def test_buffer_reader_supports_text_wrappers():
+    buffer = PlainFile('héllo\nworld\n'.encode('utf-8'))
+    with io.TextIOWrapper(buffer_reader(buffer), encoding='utf-8') as f:
+        assert f.readlines() == ['héllo\n', 'world\n']
+    reader = buffer_reader(buffer)
+    reader.seek(1)
+    assert reader.read(2) == 'é'.encode('utf-8')
+
+def test_load_buffer_of_prepared_upload():
+    buffer, full_hash, hash_id, data_format = prepare_data_for_upload({'a': [1, 2]}, 10)
+    assert data_format == '.json' and full_hash == hashlib.sha256(json.dumps({'a': [1, 2]}).encode()).hexdigest()
+    assert hash_id == full_hash[:10]
+    assert F.load_buffer(buffer, 'results.json') == {'a': [1, 2]}
+    assert buffer.closed
+
+    buffer = PlainFile(b'{"b": 3}')
+    assert F.load_buffer(buffer, 'results.json') == {'b': 3}
+    assert buffer.closed
+
+def test_load_txt_keeps_stdout_clean(tmp_path, capsys):
+    filename = tmp_path / 'notes.txt'
+    filename.write_text('first\nsecond\n')
+    assert F.load_file(str(filename)) == ['first\n', 'second\n']
+    out, err = capsys.readouterr()
+    assert out == '' and err == 'first\nsecond\n'
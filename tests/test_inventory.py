@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import pytest
+
+from s3_filestore import inventory as inventory_module
+from s3_filestore import functional as F
+from s3_filestore.inventory import Inventory
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(inventory_module, 'time', SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+@pytest.fixture
+def inventory(tmp_path):
+    return Inventory(str(tmp_path / 'inventory.sqlite'))
+
+def listed(s3_client):
+    return [kwargs for op, kwargs in s3_client.calls if op == 'list_objects_v2']
+
+def test_incremental_refresh_lists_only_keys_after_the_last_seen_key(s3_client, inventory, clock):
+    for key in ('runs/a.json', 'runs/b.json'):
+        s3_client.put_object(Bucket='bucket', Key=key, Body=b'{}')
+    assert inventory.refresh(s3_client, 'bucket', 'runs/') == 2
+    assert listed(s3_client)[-1]['StartAfter'] is None
+
+    s3_client.put_object(Bucket='bucket', Key='runs/c.json', Body=b'{"c": 1}')
+    clock.now += 10
+    assert inventory.refresh(s3_client, 'bucket', 'runs/') == 1
+    assert listed(s3_client)[-1]['StartAfter'] == 'runs/b.json'
+    assert inventory.keys('bucket', 'runs/') == ['runs/a.json', 'runs/b.json', 'runs/c.json']
+    assert inventory.get('bucket', 'runs/c.json')['size'] == 8
+
+def test_full_refresh_drops_deleted_keys(s3_client, inventory, clock):
+    for key in ('runs/a.json', 'runs/b.json', 'other/c.json'):
+        s3_client.put_object(Bucket='bucket', Key=key, Body=b'{}')
+    inventory.refresh(s3_client, 'bucket', 'runs/')
+    inventory.refresh(s3_client, 'bucket', 'other/')
+    del s3_client.objects['runs/a.json']
+
+    # an incremental refresh cannot see the deletion
+    clock.now += 10
+    inventory.refresh(s3_client, 'bucket', 'runs/')
+    assert inventory.keys('bucket', 'runs/') == ['runs/a.json', 'runs/b.json']
+
+    clock.now += 10
+    assert inventory.refresh(s3_client, 'bucket', 'runs/', full=True) == 1
+    assert listed(s3_client)[-1]['StartAfter'] is None
+    assert inventory.keys('bucket', 'runs/') == ['runs/b.json']
+    # keys outside the refreshed prefix are kept
+    assert inventory.keys('bucket') == ['other/c.json', 'runs/b.json']
+
+def test_full_refresh_after_the_interval(s3_client, tmp_path, clock):
+    inventory = Inventory(str(tmp_path / 'inventory.sqlite'), full_refresh_interval=100)
+    s3_client.put_object(Bucket='bucket', Key='runs/a.json', Body=b'{}')
+    inventory.refresh(s3_client, 'bucket', 'runs/')
+    clock.now += 50
+    inventory.refresh(s3_client, 'bucket', 'runs/')
+    assert listed(s3_client)[-1]['StartAfter'] == 'runs/a.json'
+    clock.now += 100
+    inventory.refresh(s3_client, 'bucket', 'runs/')
+    assert listed(s3_client)[-1]['StartAfter'] is None
+
+def test_is_fresh_expires(s3_client, inventory, clock):
+    assert not inventory.is_fresh('bucket', 'runs/a.json')
+    inventory.refresh(s3_client, 'bucket', 'runs/')
+    assert inventory.is_fresh('bucket', 'runs/a.json', max_age=60)
+    assert not inventory.is_fresh('bucket', 'models/a.bin', max_age=60)
+    clock.now += 61
+    assert not inventory.is_fresh('bucket', 'runs/a.json', max_age=60)
+
+def test_store_answers_from_a_fresh_inventory(store, s3_client, bucket, tmp_path, clock):
+    inventory = Inventory(str(tmp_path / 'inventory.sqlite'))
+    s3 = store(inventory=inventory, inventory_max_age=60)
+    s3_client.put_object(Bucket='bucket', Key='runs/a.json', Body=b'{"a": 1}')
+    s3.refresh_inventory('runs')
+    s3_client.calls.clear()
+
+    assert s3.file_exists('runs/a.json') and not s3.file_exists('runs/missing.json')
+    assert F.get_remote_size(bucket, 'runs/a.json', inventory=inventory, inventory_max_age=60) == 8
+    assert F.get_remote_size(bucket, 'runs/missing.json', inventory=inventory, inventory_max_age=60) is None
+    assert s3_client.calls == []
+
+    # stale (or uncovered) keys are looked up
+    clock.now += 61
+    assert s3.file_exists('runs/a.json')
+    assert F.get_remote_size(bucket, 'models/b.bin', inventory=inventory, inventory_max_age=60) is None
+    assert s3_client.count('head_object') == 2
@@ -0,0 +1,39 @@
+import pytest
+
+from s3_filestore import functional as F
+
+KEYS = (['readme.txt', 'runs/', 'runs/summary.csv'] +
+        [f'runs/{run}/epoch-{epoch:02d}/weights-{i}.pth' for run in ('a', 'b', 'c') for epoch in range(4) for i in range(2)] +
+        [f'runs/{run}/log.txt' for run in ('a', 'c')] +
+        [f'runs/flat/{i:03d}.json' for i in range(40)] +
+        ['runs/z/'])
+
+@pytest.fixture
+def tree(s3_client, bucket):
+    for key in KEYS:
+        s3_client.put_object(Bucket='bucket', Key=key, Body=b'')
+    return bucket
+
+@pytest.mark.parametrize('prefix', ['', 'runs', 'runs/a/'])
+@pytest.mark.parametrize('depth', [None, 0, 1, 2])
+@pytest.mark.parametrize('directory_filter', [True, False, None])
+@pytest.mark.parametrize('max_workers', [None, 4])
+def test_iter_objects_matches_filter_keys(tree, prefix, depth, directory_filter, max_workers):
+    normalized = F.normalize_prefix(prefix)
+    expected = list(F.filter_keys(sorted(key for key in KEYS if key.startswith(normalized)), prefix=prefix, depth=depth,
+                                  directory_filter=directory_filter))
+    listed = list(F.iter_objects(tree, prefix=prefix, depth=depth, directory_filter=directory_filter, page_size=3,
+                                 max_workers=max_workers))
+    assert listed == expected
+
+def test_delimiter_listing_skips_deeper_keys(tree, s3_client):
+    assert F.list_objects(tree, prefix='runs', depth=0, directory_filter=None, verbose=False) == ['runs/', 'runs/summary.csv']
+    listed = [call for op, call in s3_client.calls if op == 'list_objects_v2']
+    assert listed and all(call['Delimiter'] == '/' and call['Prefix'] == 'runs/' for call in listed)
+
+def test_parallel_listing_splits_large_ranges(tree, s3_client):
+    keys = list(F.iter_objects(tree, prefix='runs', directory_filter=False, page_size=5, max_workers=4))
+    assert keys == sorted(key for key in KEYS if key.startswith('runs/') and not key.endswith('/'))
+    # split ranges start after keys of earlier pages instead of paging through the whole prefix sequentially
+    starts = [call.get('StartAfter') for op, call in s3_client.calls if op == 'list_objects_v2' and call.get('Delimiter') is None]
+    assert len(starts) > 1 and len(set(starts)) == len(starts)
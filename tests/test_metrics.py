@@ -0,0 +1,121 @@
+import boto3
+import pytest
+import botocore.exceptions
+from botocore.awsrequest import AWSResponse
+
+from s3_filestore import metrics
+from s3_filestore.metrics import MetricsCollector
+
+class FakeRaw(object):
+    def __init__(self, body=b''):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+def stubbed_client(responses):
+    """A real botocore client whose HTTP requests are answered by responses(request) -> (status, headers)."""
+    client = boto3.session.Session(aws_access_key_id='key', aws_secret_access_key='secret',
+                                   region_name='us-east-1').client('s3', endpoint_url='https://fake-s3.test')
+    def send(request, **kwargs):
+        status, headers = responses(request)
+        return AWSResponse(request.url, status, headers, FakeRaw())
+    client.meta.events.register('before-send.s3', send)
+    return client
+
+@pytest.fixture
+def collector():
+    return MetricsCollector()
+
+def test_timer_records_operations_errors_and_traces(collector):
+    events = []
+    collector.add_exporter(events.append)
+    with collector.timer('load_object', key='a') as timing:
+        with collector.timer('download'):
+            timing.bytes_in = 100
+    with pytest.raises(ValueError):
+        with collector.timer('download'):
+            raise ValueError('boom')
+
+    operations = collector.snapshot()['operations']
+    assert operations['download']['count'] == 2 and operations['download']['errors'] == 1
+    assert operations['load_object']['bytes_in'] == 100 and operations['load_object']['count'] == 1
+    assert operations['download']['mean_seconds'] == operations['download']['seconds'] / 2
+    assert [(e.name, e.trace) for e in events] == [('download', 'load_object/download'), ('load_object', 'load_object'),
+                                                  ('download', 'download')]
+    assert events[1].key == 'a' and isinstance(events[2].error, ValueError)
+
+def test_cache_hits_and_reset(collector):
+    collector.cache_hit('acl')
+    collector.cache_hit('acl')
+    collector.cache_miss('acl')
+    assert collector.snapshot()['caches']['acl'] == dict(hits=2, misses=1, hit_rate=2 / 3)
+    collector.enabled = False
+    collector.cache_miss('acl')
+    collector.enabled = True
+    collector.reset()
+    assert collector.snapshot()['caches'] == {} and collector.snapshot()['operations'] == {}
+
+def test_failing_exporters_do_not_break_the_operation(collector, capsys):
+    def exporter(event):
+        raise RuntimeError('backend down')
+    collector.add_exporter(exporter)
+    with collector.timer('upload_file'):
+        pass
+    assert collector.snapshot()['operations']['upload_file']['count'] == 1
+    collector.remove_exporter(exporter)
+    with collector.timer('upload_file'):
+        pass
+    assert capsys.readouterr().out.count('backend down') == 1
+
+def test_print_exporter(capsys):
+    exporter = metrics.print_exporter(min_seconds=0.5)
+    exporter(metrics.Event(kind='operation', name='download', trace='load_object/download', seconds=0.1, bytes_in=10,
+                           bytes_out=0, error=None))
+    exporter(metrics.Event(kind='api_call', name='GetObject', trace='', seconds=2.0, bytes_in=10, bytes_out=0, error=None))
+    exporter(metrics.Event(kind='operation', name='download', trace='load_object/download', seconds=1.5, bytes_in=10,
+                           bytes_out=0, error='timeout'))
+    assert capsys.readouterr().out == '[s3_filestore] load_object/download: 1.500s, 10 bytes failed (timeout)\n'
+
+def test_timed_decorator(monkeypatch, collector):
+    monkeypatch.setattr(metrics, 'collector', collector)
+    @metrics.timed()
+    def list_objects():
+        return ['a']
+    assert list_objects() == ['a'] and list_objects.__name__ == 'list_objects'
+    assert collector.snapshot()['operations']['list_objects']['count'] == 1
+
+def test_instrumented_client_counts_and_exports_api_calls(collector):
+    def responses(request):
+        if request.url.endswith('/bucket/missing.json'):
+            return 404, {}
+        return 200, {'Content-Length': '42', 'ETag': '"abc"'}
+    client = metrics.instrument_client(stubbed_client(responses), metrics=collector)
+    events = []
+    collector.add_exporter(events.append)
+
+    with collector.timer('get_metadata'):
+        assert client.head_object(Bucket='bucket', Key='results.json')['ETag'] == '"abc"'
+    client.put_object(Bucket='bucket', Key='results.json', Body=b'x' * 10)
+    with pytest.raises(botocore.exceptions.ClientError):
+        client.head_object(Bucket='bucket', Key='missing.json')
+
+    api_calls = collector.snapshot()['api_calls']
+    assert api_calls['HeadObject']['count'] == 2 and api_calls['HeadObject']['errors'] == 1
+    assert api_calls['HeadObject']['bytes_in'] == 42
+    assert api_calls['PutObject']['count'] == 1 and api_calls['PutObject']['bytes_out'] == 10
+    api_events = [e for e in events if e.kind == 'api_call']
+    assert [(e.name, e.trace) for e in api_events] == [('HeadObject', 'get_metadata'), ('PutObject', ''), ('HeadObject', '')]
+    assert api_events[0].bytes_in == 42 and api_events[2].error == '404'
+
+def test_store_stats(store, s3_client, tmp_path):
+    s3 = store()
+    metrics.reset()
+    filename = tmp_path / 'results.csv'
+    filename.write_bytes(b'a,b\n1,2\n')
+    s3.upload_file(str(filename), 'data', verbose=False)
+    stats = s3.stats(reset=True)
+    assert stats['operations']['upload_file']['count'] >= 1
+    assert stats['operations']['upload']['bytes_out'] == 8
+    assert set(stats) == {'operations', 'api_calls', 'caches', 'retries'}
+    assert s3.stats()['operations'] == {}
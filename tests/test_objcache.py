@@ -0,0 +1,104 @@
+import hashlib
+import json
+
+import pytest
+
+from s3_filestore.objcache import ObjectCache, approximate_size
+
+def test_entry_bound_evicts_least_recently_used():
+    cache = ObjectCache(max_entries=2)
+    cache.put('bucket', 'a', 'v1', 'A')
+    cache.put('bucket', 'b', 'v1', 'B')
+    assert cache.get('bucket', 'a', 'v1') == (True, 'A')
+    cache.put('bucket', 'c', 'v1', 'C')
+    assert cache.get('bucket', 'b', 'v1') == (False, None)
+    assert cache.get('bucket', 'a', 'v1') == (True, 'A')
+    assert cache.get('bucket', 'c', 'v1') == (True, 'C')
+    info = cache.cache_info()
+    assert (info.hits, info.misses, info.entries) == (3, 1, 2)
+
+def test_byte_bound():
+    value = 'x' * 1000
+    size = approximate_size(value)
+    cache = ObjectCache(max_bytes=2 * size)
+    cache.put('bucket', 'a', 'v1', value)
+    cache.put('bucket', 'b', 'v1', value)
+    assert cache.cache_info().bytes == 2 * size
+    cache.put('bucket', 'c', 'v1', value)
+    assert len(cache) == 2 and cache.get('bucket', 'a', 'v1') == (False, None)
+    # values larger than max_bytes are handed back but not cached
+    assert cache.put('bucket', 'big', 'v1', value * 3) == value * 3
+    assert cache.get('bucket', 'big', 'v1') == (False, None)
+    assert cache.cache_info().bytes <= 2 * size
+
+def test_new_version_replaces_the_entry_and_invalidate():
+    cache = ObjectCache()
+    cache.put('bucket', 'a', 'etag-1', 'old')
+    assert cache.get('bucket', 'a', 'etag-2') == (False, None)
+    cache.put('bucket', 'a', 'etag-2', 'new')
+    assert len(cache) == 1 and cache.get('bucket', 'a', 'etag-2') == (True, 'new')
+    cache.put('other', 'a', 'etag-1', 'other')
+    cache.invalidate('bucket')
+    assert cache.get('bucket', 'a', 'etag-2') == (False, None)
+    assert cache.get('other', 'a', 'etag-1') == (True, 'other')
+    cache.clear()
+    assert len(cache) == 0 and cache.cache_info().bytes == 0
+
+def test_values_are_shared_read_only_by_default():
+    np = pytest.importorskip('numpy')
+    cache = ObjectCache()
+    value = {'weights': np.zeros(4), 'names': ['a']}
+    assert cache.put('bucket', 'a', 'v1', value) is value
+    hit, cached = cache.get('bucket', 'a', 'v1')
+    assert hit and cached is value
+    with pytest.raises(ValueError):
+        cached['weights'][0] = 1
+
+def test_copy_returns_independent_values_but_shares_memmaps(tmp_path):
+    np = pytest.importorskip('numpy')
+    filename = str(tmp_path / 'weights.npy')
+    np.save(filename, np.arange(1000.0))
+    weights = np.load(filename, mmap_mode='r')
+    cache = ObjectCache(copy=True)
+    cache.put('bucket', 'a', 'v1', {'array': np.zeros(2), 'weights': weights})
+
+    _, first = cache.get('bucket', 'a', 'v1')
+    _, second = cache.get('bucket', 'a', 'v1')
+    first['array'][0] = 1
+    assert second['array'][0] == 0
+    # the memmap is not read into memory: every hit gets the same read-only mapping
+    assert first['weights'] is weights and second['weights'] is weights
+    assert not weights.flags.writeable
+    assert approximate_size(weights) < weights.nbytes
+
+def test_load_object_revalidates_with_the_etag(store, s3_client, http):
+    s3 = store(object_cache=True)
+    s3_client.put_object(Bucket='bucket', Key='data/results.json', Body=b'{"a": 1}')
+    assert s3.load_object('data/results.json', progress=False) == {'a': 1}
+    assert s3.load_object('data/results.json', progress=False) == {'a': 1}
+    assert len(http.requests) == 1 and s3_client.count('head_object') >= 2
+
+    s3_client.put_object(Bucket='bucket', Key='data/results.json', Body=b'{"a": 2}')
+    assert s3.load_object('data/results.json', progress=False) == {'a': 2}
+    assert len(http.requests) == 2
+
+def test_load_object_hash_suffixed_keys_need_no_request(store, s3_client, http):
+    s3 = store(object_cache=True)
+    body = json.dumps({'a': 1}).encode()
+    key = f'data/results-{hashlib.sha256(body).hexdigest()[:10]}.json'
+    s3_client.put_object(Bucket='bucket', Key=key, Body=body)
+    assert s3.load_object(key, progress=False) == {'a': 1}
+    s3_client.calls.clear()
+    assert s3.load_object(key, progress=False) == {'a': 1}
+    assert s3_client.calls == [] and len(http.requests) == 1
+
+def test_copy_shares_lazy_safetensors(tmp_path):
+    np = pytest.importorskip('numpy')
+    safetensors_numpy = pytest.importorskip('safetensors.numpy')
+    from s3_filestore.serializers import LazySafetensors
+    filename = str(tmp_path / 'weights.safetensors')
+    safetensors_numpy.save_file({'w': np.ones(3, dtype=np.float32)}, filename)
+    tensors = LazySafetensors(filename, framework='np')
+    cache = ObjectCache(copy=True)
+    cache.put('bucket', 'a', 'v1', tensors)
+    assert cache.get('bucket', 'a', 'v1') == (True, tensors)
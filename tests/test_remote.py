@@ -0,0 +1,135 @@
+import os
+import gzip
+import json
+import hashlib
+
+import pytest
+import requests
+
+from s3_filestore import functional as F
+from s3_filestore import retry
+from s3_filestore import transfer
+from s3_filestore.remote import open_object
+
+from conftest import URL_ROOT
+
+def test_open_object_reads_ranges(s3_client):
+    data = bytes(range(256)) * 64
+    s3_client.put_object(Bucket='bucket', Key='data.bin', Body=data)
+
+    with open_object(s3_client, 'bucket', 'data.bin', block_size=1024, max_readahead=0) as f:
+        f.seek(5000)
+        assert f.read(100) == data[5000:5100]
+        assert f.requests == 1 and f.bytes_fetched == 1024
+        f.seek(-10, 2)
+        assert f.read() == data[-10:]
+        f.seek(5050)
+        assert f.read(10) == data[5050:5060] and f.requests == 2
+
+    ranges = [call['Range'] for op, call in s3_client.calls if op == 'get_object']
+    assert ranges == ['bytes=4096-5119', 'bytes=15360-16383']
+
+def test_open_object_modes(s3_client):
+    s3_client.put_object(Bucket='bucket', Key='notes.txt', Body='héllo\nworld\n'.encode('utf-8'))
+    with open_object(s3_client, 'bucket', 'notes.txt', mode='r') as f:
+        assert f.readlines() == ['héllo\n', 'world\n']
+
+    s3_client.put_object(Bucket='bucket', Key='notes.txt.gz', Body=gzip.compress(b'a\nb\n'), ContentEncoding='gzip')
+    with open_object(s3_client, 'bucket', 'notes.txt.gz', mode='r') as f:
+        assert f.read() == 'a\nb\n'
+
+    with pytest.raises(ValueError, match="'rb' and 'r'"):
+        open_object(s3_client, 'bucket', 'notes.txt', mode='w')
+
+def test_streamed_download_fails_on_a_short_body(s3_client, http, tmp_path):
+    s3_client.put_object(Bucket='bucket', Key='data.bin', Body=b'x' * 1000)
+    http.truncate['data.bin'] = 1
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        transfer.download_url_to_file(f'{URL_ROOT}/bucket/data.bin', str(tmp_path / 'data.bin'), progress=False)
+    assert os.listdir(tmp_path) == []
+
+def test_ranged_download_retries_short_ranges_and_resumes(s3_client, http, tmp_path):
+    data = os.urandom(10000)
+    key = 'data-' + hashlib.sha256(data).hexdigest()[:8] + '.bin'
+    s3_client.put_object(Bucket='bucket', Key=key, Body=data)
+    url, dst = f'{URL_ROOT}/bucket/{key}', str(tmp_path / key)
+    download = lambda: transfer.download_url_to_file(url, dst, hash_prefix=key[5:13], progress=False, ranged_threshold=1000,
+                                                     range_size=1000, max_concurrency=2)
+
+    # a short range is retried; a range that keeps failing stops the download, completed ranges are recorded
+    http.truncate[key] = 2
+    http.fail = lambda url, headers: ConnectionError('reset') if headers.get('Range', '').startswith('bytes=7000-') else None
+    with pytest.raises(ConnectionError):
+        download()
+    with open(dst + '.partial.json') as f:
+        assert json.load(f)['done'] == [0, 1, 2, 3, 4, 5, 6, 8, 9]
+    assert not os.path.exists(dst)
+
+    # the next attempt only fetches the missing range, pinned to the ETag of the first response
+    http.fail, http.requests = None, []
+    download()
+    with open(dst, 'rb') as f:
+        assert f.read() == data
+    assert [headers.get('Range') for _, headers in http.requests] == [None, 'bytes=7000-7999']
+    assert http.requests[-1][1]['If-Match'] == s3_client.objects[key]['etag']
+    assert not os.path.exists(dst + '.partial') and not os.path.exists(dst + '.partial.json')
+
+def cached_files(s3):
+    return [name for _, _, names in os.walk(s3.cache_dir) for name in names if not name.startswith('.cache_index')]
+
+def test_iter_csv_yields_chunks_and_checks_the_hash_at_the_end(store, s3_client):
+    pd = pytest.importorskip('pandas')
+    s3 = store()
+    body = b'a,b,c\n' + b''.join(f'{i},{2 * i},x\n'.encode() for i in range(10))
+    key = 'results-' + hashlib.sha256(body).hexdigest()[:10] + '.csv'
+    s3_client.put_object(Bucket='bucket', Key=key, Body=body)
+
+    chunks = list(s3.iter_csv(key, chunksize=3, columns=['a', 'b']))
+    assert [len(chunk) for chunk in chunks] == [3, 3, 3, 1]
+    assert list(chunks[0].columns) == ['a', 'b']
+    assert pd.concat(chunks)['b'].sum() == 90
+    # the body is streamed with one request, not downloaded into the cache
+    assert s3_client.count('get_object') == 1 and cached_files(s3) == []
+
+    s3_client.put_object(Bucket='bucket', Key='corrupt-0123456789.csv', Body=body)
+    with pytest.raises(RuntimeError, match='invalid hash value'):
+        list(s3.iter_csv('corrupt-0123456789.csv', chunksize=3))
+    assert len(list(s3.iter_csv('corrupt-0123456789.csv', chunksize=3, check_hash=False))) == 4
+
+def test_load_object_without_the_download_cache(store, s3_client):
+    s3 = store()
+    data = {'values': list(range(1000))}
+    s3_client.put_object(Bucket='bucket', Key='results.json', Body=json.dumps(data).encode(),
+                         Metadata={'sha256': hashlib.sha256(json.dumps(data).encode()).hexdigest()})
+    assert s3.load_object('results.json', progress=False, cache=False) == data
+    # spilled to a temporary file beyond spill_threshold
+    assert s3.load_object('results.json', progress=False, cache=False, spill_threshold=100) == data
+    assert cached_files(s3) == []
+
+def test_download_object_to_buffer_retries_short_reads(s3_client, monkeypatch):
+    data = os.urandom(5000)
+    s3_client.put_object(Bucket='bucket', Key='data.bin', Body=data)
+    get_object = s3_client.get_object
+    short_reads = [1]
+    def flaky_get_object(**kwargs):
+        response = get_object(**kwargs)
+        if short_reads:
+            short_reads.pop()
+            response['ContentLength'] += 100
+        return response
+    monkeypatch.setattr(s3_client, 'get_object', flaky_get_object)
+
+    buffer = F.download_object_to_buffer(s3_client, 'bucket', 'data.bin', progress=False)
+    assert buffer.read() == data and s3_client.count('get_object') == 2
+
+    short_reads.extend([1] * 10)
+    with pytest.raises(retry.IncompleteReadError, match='Short read: got 5000 of 5100 bytes'):
+        transfer.download_object_to_buffer(s3_client, 'bucket', 'data.bin', progress=False)
+
+def test_download_object_to_buffer_checks_the_hash(s3_client):
+    s3_client.put_object(Bucket='bucket', Key='data.bin', Body=b'data', Metadata={'sha256': 'f' * 64})
+    with pytest.raises(RuntimeError, match='invalid hash value'):
+        F.download_object_to_buffer(s3_client, 'bucket', 'data.bin', progress=False)
+    # a mismatch is not retried
+    assert s3_client.count('get_object') == 1
+    assert F.download_object_to_buffer(s3_client, 'bucket', 'data.bin', progress=False, check_hash=False).read() == b'data'
@@ -0,0 +1,142 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+import requests
+import botocore.exceptions
+
+from s3_filestore import retry
+
+from conftest import client_error
+
+class FakeClock(object):
+    """Stands in for the time module: sleep advances monotonic() and is recorded."""
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(retry, 'time', clock)
+    monkeypatch.setattr(retry.random, 'uniform', lambda a, b: b)
+    return clock
+
+def http_error(status):
+    return requests.HTTPError(f'{status} error', response=SimpleNamespace(status_code=status))
+
+def failing(*errors, result='ok'):
+    errors = list(errors)
+    calls = []
+    def fn():
+        calls.append(1)
+        if errors: raise errors.pop(0)
+        return result
+    fn.calls = calls
+    return fn
+
+def test_classify():
+    assert retry.classify(client_error('SlowDown', 503)) == 'throttle'
+    assert retry.classify(client_error('Whatever', 429)) == 'throttle'
+    assert retry.classify(client_error('InternalError', 500)) == 'transient'
+    assert retry.classify(client_error('AccessDenied', 403)) is None
+    assert retry.classify(client_error('NoSuchKey', 404)) is None
+    assert retry.classify(http_error(503)) == 'throttle'
+    assert retry.classify(http_error(502)) == 'transient'
+    assert retry.classify(http_error(404)) is None
+    assert retry.classify(botocore.exceptions.EndpointConnectionError(endpoint_url='https://s3.test')) == 'transient'
+    assert retry.classify(requests.exceptions.ChunkedEncodingError()) == 'transient'
+    assert retry.classify(retry.IncompleteReadError('short')) == 'transient'
+    assert retry.classify(ValueError('bad')) is None
+
+def test_policy_retries_with_exponential_backoff(clock):
+    policy = retry.RetryPolicy(base_delay=1, throttle_base_delay=4, max_delay=10)
+    fn = failing(http_error(500), http_error(500), http_error(503))
+    assert policy.call(fn) == 'ok'
+    assert clock.sleeps == [1, 2, 10]
+    assert policy.stats.snapshot()['retries'] == 3 and policy.stats.snapshot()['throttles'] == 1
+
+def test_policy_raises_permanent_errors_and_gives_up_after_max_attempts(clock):
+    policy = retry.RetryPolicy(max_attempts=3, base_delay=1)
+    fn = failing(client_error('AccessDenied', 403))
+    with pytest.raises(botocore.exceptions.ClientError):
+        policy.call(fn)
+    assert len(fn.calls) == 1 and clock.sleeps == []
+
+    fn = failing(*[http_error(500)] * 5)
+    with pytest.raises(requests.HTTPError):
+        policy.call(fn)
+    assert len(fn.calls) == 3 and policy.stats.snapshot()['failures'] == 1
+
+def test_exhausted_budget_raises_without_sleeping(clock):
+    budget = retry.RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+    policy = retry.RetryPolicy(base_delay=1, budget=budget)
+    assert policy.call(failing(http_error(500))) == 'ok'
+    assert len(clock.sleeps) == 1
+
+    fn = failing(http_error(500), http_error(500))
+    with pytest.raises(requests.HTTPError):
+        policy.call(fn)
+    assert len(fn.calls) == 1 and len(clock.sleeps) == 1
+    assert policy.stats.snapshot()['budget_exhausted'] == 1
+
+    # successes deposit tokens again, and so does time passing
+    policy.call(failing())
+    policy.call(failing())
+    assert budget.withdraw() and not budget.withdraw()
+    budget.min_per_second = 1
+    clock.now += 1
+    assert budget.withdraw()
+
+def test_limiter_halves_on_throttling_and_grows_back(clock):
+    limiter = retry.AdaptiveLimiter(initial=8, cooldown=1.0)
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.limit == 4
+    # a burst of throttled responses within the cooldown only halves the limit once
+    limiter.on_throttle()
+    assert limiter.limit == 4
+    clock.now += 1
+    limiter.on_throttle()
+    assert limiter.limit == 2
+
+    # each success adds 1/limit: about one window of limit successes per step back up
+    successes = 0
+    while limiter.limit < 4:
+        limiter.acquire()
+        limiter.release()
+        successes += 1
+    assert 2 + 3 <= successes <= 2 + 3 + 2 and limiter.in_flight == 0
+
+def test_policy_feeds_the_limiter(clock):
+    limiter = retry.AdaptiveLimiter(initial=10)
+    policy = retry.RetryPolicy(base_delay=0, throttle_base_delay=0, limiter=limiter)
+    policy.call(failing(client_error('SlowDown', 503)))
+    assert limiter.limit == 5 and limiter.in_flight == 0
+
+def test_call_async_retries(clock, monkeypatch):
+    sleeps = []
+    async def sleep(seconds):
+        sleeps.append(seconds)
+    monkeypatch.setattr(retry.asyncio, 'sleep', sleep)
+    limiter = retry.AdaptiveLimiter(initial=10)
+    policy = retry.RetryPolicy(base_delay=1, throttle_base_delay=2, limiter=limiter)
+    errors = [client_error('SlowDown', 503), http_error(500)]
+    async def fn():
+        if errors: raise errors.pop(0)
+        return 'ok'
+    assert asyncio.run(policy.call_async(fn)) == 'ok'
+    assert sleeps == [2, 2] and limiter.limit == 5
+
+    async def denied():
+        raise client_error('AccessDenied', 403)
+    with pytest.raises(botocore.exceptions.ClientError):
+        asyncio.run(policy.call_async(denied))
+    assert len(sleeps) == 2
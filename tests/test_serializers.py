@@ -0,0 +1,100 @@
+import io
+from collections import OrderedDict
+
+import pytest
+
+from s3_filestore import serializers
+
+def round_trip(data, tmp_path, extension, **kwargs):
+    filename = str(tmp_path / f'data{extension}')
+    with open(filename, 'wb') as f:
+        serializers.dump(data, f, extension)
+    return serializers.load(filename, **kwargs)
+
+def test_json_and_txt_round_trips(tmp_path):
+    data = {'a': [1, 2.5, None], 'b': {'c': 'd'}}
+    assert round_trip(data, tmp_path, '.json') == data
+    assert round_trip(['first', 'second\n'], tmp_path, '.txt') == ['first\n', 'second\n']
+    assert round_trip('one\ntwo\n', tmp_path, '.txt') == ['one\n', 'two\n']
+    with pytest.raises(ValueError):
+        round_trip([1, 2], tmp_path, '.json')
+
+def test_load_from_a_file_object_needs_the_format():
+    buf = io.BytesIO(b'{"a": 1}')
+    assert serializers.load(buf, data_format='.json') == {'a': 1}
+    with pytest.raises(ValueError, match='Filetype must be one of'):
+        serializers.load(io.BytesIO(b''))
+
+def test_csv_round_trip(tmp_path):
+    pd = pytest.importorskip('pandas')
+    df = pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']})
+    pd.testing.assert_frame_equal(round_trip(df, tmp_path, '.csv'), df)
+
+def test_npy_files_are_memory_mapped_read_only(tmp_path):
+    np = pytest.importorskip('numpy')
+    array = np.arange(12.0).reshape(3, 4)
+    loaded = round_trip(array, tmp_path, '.npy')
+    assert isinstance(loaded, np.memmap) and not loaded.flags.writeable
+    np.testing.assert_array_equal(loaded, array)
+    # file objects are read into memory
+    buf = io.BytesIO()
+    serializers.dump(array, buf, '.npy')
+    buf.seek(0)
+    assert not isinstance(serializers.load(buf, data_format='.npy'), np.memmap)
+
+def test_safetensors_are_read_lazily(tmp_path):
+    np = pytest.importorskip('numpy')
+    pytest.importorskip('safetensors')
+    data = {'w': np.ones((2, 2), dtype=np.float32), 'b': np.zeros(2, dtype=np.float32)}
+    loaded = round_trip(data, tmp_path, '.safetensors', framework='np')
+    assert isinstance(loaded, serializers.LazySafetensors) and sorted(loaded) == ['b', 'w']
+    np.testing.assert_array_equal(loaded['w'], data['w'])
+
+def test_parquet_and_feather_round_trips(tmp_path):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('pyarrow')
+    df = pd.DataFrame({'a': [1, 2, 3], 'b': [0.5, 1.5, 2.5]})
+    pd.testing.assert_frame_equal(round_trip(df, tmp_path, '.parquet'), df)
+    pd.testing.assert_frame_equal(round_trip(df, tmp_path, '.feather'), df)
+    assert serializers.get_format('data.arrow').load is serializers.load_feather
+
+def test_infer_format():
+    assert serializers.infer_format({'a': 1}) == '.json'
+    with pytest.raises(ValueError, match='Unsupported data type'):
+        serializers.infer_format(object())
+    np = pytest.importorskip('numpy')
+    assert serializers.infer_format(np.zeros(2)) == '.npy'
+    # dicts of arrays go to torch's format rather than json
+    assert serializers.infer_format({'w': np.zeros(2)}) == '.pth'
+    pd = pytest.importorskip('pandas')
+    assert serializers.infer_format(pd.DataFrame({'a': [1]})) == '.csv'
+
+def test_get_format_prefers_the_longest_extension():
+    assert serializers.get_format('model.pth.tar').extension == '.pth.tar'
+    assert serializers.get_format('model.pt').load is serializers.load_torch
+
+def test_register_a_custom_format(tmp_path, monkeypatch):
+    monkeypatch.setattr(serializers, '_FORMATS', OrderedDict(serializers._FORMATS))
+    class Point(object):
+        def __init__(self, x, y):
+            self.x, self.y = x, y
+
+    def dump_point(data, fileobj):
+        fileobj.write(f'{data.x},{data.y}'.encode())
+    def load_point(source):
+        with open(source, 'rb') if isinstance(source, str) else source as f:
+            return Point(*map(int, f.read().split(b',')))
+    serializers.register_format(['.point', '.pt2'], load=load_point, dump=dump_point,
+                                accepts=lambda data: isinstance(data, Point))
+
+    assert serializers.infer_format(Point(1, 2)) == '.point'
+    point = round_trip(Point(1, 2), tmp_path, '.point')
+    assert (point.x, point.y) == (1, 2)
+    assert serializers.get_format('p.pt2').load is load_point
+    assert '.point' in serializers.list_formats()
+
+    # registering an extension again replaces its format
+    serializers.register_format('.point', load=lambda source: 'replaced')
+    assert serializers.load(str(tmp_path / 'data.point')) == 'replaced'
+    with pytest.raises(ValueError, match='Unsupported data type'):
+        serializers.infer_format(Point(1, 2))
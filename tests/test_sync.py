@@ -0,0 +1,100 @@
+import os
+
+from s3_filestore import sync
+from s3_filestore import functional as F
+from s3_filestore.utils import get_object_name_with_hash_id, strip_hash_id
+
+def write(local_dir, relative_path, data):
+    filename = os.path.join(local_dir, *relative_path.split('/'))
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'wb') as f:
+        f.write(data)
+    return filename
+
+def object_key(filename, name):
+    return 'sub/' + get_object_name_with_hash_id(filename, object_name=name)
+
+def test_sync_to_s3_uploads_changes_and_deletes_superseded(s3_client, bucket, tmp_path):
+    local_dir = str(tmp_path)
+    same = write(local_dir, 'same.txt', b'unchanged')
+    s3_client.put_object(Bucket='bucket', Key=object_key(same, 'same.txt'), Body=b'unchanged')
+    s3_client.put_object(Bucket='bucket', Key='sub/changed-0123abcd45.txt', Body=b'old version')
+    s3_client.put_object(Bucket='bucket', Key='sub/removed-89abcdef01.txt', Body=b'no local file')
+    changed = write(local_dir, 'changed.txt', b'new version')
+
+    result = sync.sync_to_s3(s3_client, bucket, local_dir, 'sub', acl='private', delete=True, verbose=False)
+
+    assert result['errors'] == []
+    assert result['uploaded'] == [object_key(changed, 'changed.txt')]
+    assert result['skipped'] == [object_key(same, 'same.txt')]
+    assert sorted(result['deleted']) == ['sub/changed-0123abcd45.txt', 'sub/removed-89abcdef01.txt']
+    assert sorted(s3_client.objects) == sorted([object_key(changed, 'changed.txt'), object_key(same, 'same.txt')])
+
+def test_sync_to_s3_keeps_old_version_when_upload_fails(s3_client, bucket, tmp_path):
+    local_dir = str(tmp_path)
+    s3_client.put_object(Bucket='bucket', Key='sub/changed-0123abcd45.txt', Body=b'old version')
+    write(local_dir, 'changed.txt', b'new version')
+    s3_client.fail['put_object'] = lambda Key, **kwargs: RuntimeError('upload failed') if Key.startswith('sub/changed-') else None
+
+    result = sync.sync_to_s3(s3_client, bucket, local_dir, 'sub', acl='private', delete=True, verbose=False)
+
+    assert len(result['errors']) == 1 and result['uploaded'] == []
+    assert result['deleted'] == []
+    assert s3_client.count('delete_objects') == 0
+    assert 'sub/changed-0123abcd45.txt' in s3_client.objects
+
+def test_sync_to_s3_keeps_objects_of_files_that_fail_to_hash(s3_client, bucket, tmp_path, monkeypatch):
+    local_dir = str(tmp_path)
+    s3_client.put_object(Bucket='bucket', Key='sub/unreadable-0123abcd45.txt', Body=b'old version')
+    write(local_dir, 'unreadable.txt', b'cannot be hashed')
+
+    def get_object_name_with_hash_id(local_filename, **kwargs):
+        raise PermissionError(local_filename)
+    monkeypatch.setattr(sync, 'get_object_name_with_hash_id', get_object_name_with_hash_id)
+
+    plan = sync.sync_to_s3(s3_client, bucket, local_dir, 'sub', delete=True, dry_run=True, verbose=False)
+    assert plan['deleted'] == [] and len(plan['errors']) == 1
+
+    result = sync.sync_to_s3(s3_client, bucket, local_dir, 'sub', delete=True, verbose=False)
+    assert result['deleted'] == []
+    assert 'sub/unreadable-0123abcd45.txt' in s3_client.objects
+
+def test_sync_from_s3_decompresses_and_then_skips_compressed_objects(s3_client, bucket, tmp_path):
+    source = write(str(tmp_path / 'src'), 'results.csv', b'a,b\n' + b'1,2\n' * 1000)
+    F.upload_file(s3_client, bucket, source, object_key(source, 'results.csv'), acl='private', verbose=False, compression='gzip')
+    F.upload_file(s3_client, bucket, source, 'sub/plain.csv', acl='private', verbose=False, compression='gzip')
+    local_dir = str(tmp_path / 'dst')
+
+    result = sync.sync_from_s3(s3_client, 'bucket', 'sub', local_dir, verbose=False)
+    assert result['errors'] == [] and len(result['downloaded']) == 2
+    for name in ('results.csv', 'plain.csv'):
+        with open(os.path.join(local_dir, name), 'rb') as f, open(source, 'rb') as g:
+            assert f.read() == g.read()
+
+    result = sync.sync_from_s3(s3_client, 'bucket', 'sub', local_dir, verbose=False)
+    assert result['downloaded'] == [] and len(result['skipped']) == 2
+
+def test_sync_from_s3_rejects_corrupt_objects(s3_client, bucket, tmp_path):
+    s3_client.put_object(Bucket='bucket', Key='sub/data-0123abcd45.txt', Body=b'does not match its hash id')
+    local_dir = str(tmp_path)
+
+    result = sync.sync_from_s3(s3_client, 'bucket', 'sub', local_dir, verbose=False)
+    assert result['downloaded'] == [] and len(result['errors']) == 1
+    assert os.listdir(local_dir) == []
+
+def test_dated_names_are_not_hash_ids(s3_client, bucket, tmp_path):
+    assert strip_hash_id('report-2024.csv') == ('report-2024.csv', None)
+    assert strip_hash_id('log-20240115.txt') == ('log-20240115.txt', None)
+    assert strip_hash_id('report-0123abcd45.csv') == ('report.csv', '0123abcd45')
+    assert strip_hash_id('report-2024.csv', hash_length=4) == ('report.csv', '2024')
+
+    s3_client.put_object(Bucket='bucket', Key='sub/report-2024.csv', Body=b'2024')
+    s3_client.put_object(Bucket='bucket', Key='sub/report-2025.csv', Body=b'2025')
+    local_dir = str(tmp_path / 'dst')
+    result = sync.sync_from_s3(s3_client, 'bucket', 'sub', local_dir, verbose=False)
+    assert result['errors'] == [] and len(result['downloaded']) == 2
+    assert sorted(os.listdir(local_dir)) == ['report-2024.csv', 'report-2025.csv']
+
+    # the local files are up to date: neither is taken for a version of report.csv
+    result = sync.sync_from_s3(s3_client, 'bucket', 'sub', local_dir, verbose=False)
+    assert result['downloaded'] == [] and len(result['skipped']) == 2
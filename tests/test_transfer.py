@@ -0,0 +1,104 @@
+import io
+import time
+import threading
+
+import pytest
+
+from s3_filestore import transfer
+
+from conftest import client_error
+
+PART_SIZE = 100
+
+@pytest.fixture(autouse=True)
+def small_parts(monkeypatch):
+    monkeypatch.setattr(transfer, 'MIN_PART_SIZE', 1)
+
+class CountingReader(object):
+    """Counts the parts read (and so held in memory) that have not finished uploading yet."""
+    def __init__(self, data):
+        self.fileobj = io.BytesIO(data)
+        self.reads = 0
+        self.outstanding = 0
+        self.max_outstanding = 0
+        self.lock = threading.Lock()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        with self.lock:
+            if data: self.reads += 1
+            self.outstanding += bool(data)
+            self.max_outstanding = max(self.max_outstanding, self.outstanding)
+        return data
+
+    def done(self):
+        with self.lock:
+            self.outstanding -= 1
+
+def test_parts_are_completed_in_order(s3_client, monkeypatch):
+    data = bytes(range(256)) * 4
+    upload_part = s3_client.upload_part
+    def slow_first_parts(PartNumber, **kwargs):
+        # earlier parts finish last
+        time.sleep(0.01 * (5 - PartNumber))
+        return upload_part(PartNumber=PartNumber, **kwargs)
+    monkeypatch.setattr(s3_client, 'upload_part', slow_first_parts)
+    completed = []
+    complete = s3_client.complete_multipart_upload
+    def record_parts(MultipartUpload, **kwargs):
+        completed.extend(part['PartNumber'] for part in MultipartUpload['Parts'])
+        return complete(MultipartUpload=MultipartUpload, **kwargs)
+    monkeypatch.setattr(s3_client, 'complete_multipart_upload', record_parts)
+
+    transfer.multipart_upload(s3_client, 'bucket', 'data.bin', io.BytesIO(data), size=len(data), part_size=300,
+                              max_concurrency=4, metadata={'sha256': 'abc'})
+    assert completed == [1, 2, 3, 4]
+    assert s3_client.objects['data.bin']['body'] == data
+    assert s3_client.objects['data.bin']['metadata'] == {'sha256': 'abc'}
+
+def test_parts_in_memory_are_bounded_by_max_concurrency(s3_client, monkeypatch):
+    reader = CountingReader(b'x' * PART_SIZE * 20)
+    in_flight, max_in_flight = [0], [0]
+    lock = threading.Lock()
+    upload_part = s3_client.upload_part
+    def tracked_upload_part(**kwargs):
+        with lock:
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+        time.sleep(0.005)
+        try:
+            return upload_part(**kwargs)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+            reader.done()
+    monkeypatch.setattr(s3_client, 'upload_part', tracked_upload_part)
+
+    transfer.multipart_upload(s3_client, 'bucket', 'data.bin', reader, part_size=PART_SIZE, max_concurrency=3)
+    assert s3_client.count('upload_part') == 20 and reader.reads == 20
+    assert max_in_flight[0] <= 3 and reader.max_outstanding <= 3
+    assert len(s3_client.objects['data.bin']['body']) == PART_SIZE * 20
+
+def test_a_failed_part_aborts_the_upload(s3_client, monkeypatch):
+    reader = CountingReader(b'x' * PART_SIZE * 50)
+    s3_client.fail['upload_part'] = lambda PartNumber, **kwargs: client_error('AccessDenied', 403) if PartNumber == 2 else None
+    upload_part = s3_client.upload_part
+    def slow_upload_part(**kwargs):
+        time.sleep(0.005)
+        return upload_part(**kwargs)
+    monkeypatch.setattr(s3_client, 'upload_part', slow_upload_part)
+
+    with pytest.raises(Exception, match='AccessDenied'):
+        transfer.multipart_upload(s3_client, 'bucket', 'data.bin', reader, part_size=PART_SIZE, max_concurrency=2)
+    assert s3_client.count('abort_multipart_upload') == 1 and s3_client.count('complete_multipart_upload') == 0
+    assert s3_client.uploads == {} and s3_client.objects == {}
+    # no new parts are read once a part has failed
+    assert reader.reads < 50
+
+def test_an_abort_failure_keeps_the_original_error(s3_client, capsys):
+    s3_client.fail['upload_part'] = lambda **kwargs: ValueError('part failed')
+    s3_client.fail['abort_multipart_upload'] = lambda **kwargs: RuntimeError('abort failed')
+    with pytest.raises(ValueError, match='part failed'):
+        transfer.multipart_upload(s3_client, 'bucket', 'data.bin', io.BytesIO(b'x' * PART_SIZE * 3), part_size=PART_SIZE,
+                                  max_concurrency=2)
+    assert 'abort failed' in capsys.readouterr().err
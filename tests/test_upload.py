@@ -0,0 +1,111 @@
+import io
+import os
+import hashlib
+
+from s3_filestore import functional as F
+from s3_filestore import hashindex
+from s3_filestore.hashindex import get_hash_index
+from s3_filestore.inventory import Inventory
+from s3_filestore.utils import HashingReader, get_object_name_with_hash_id
+
+from conftest import client_error
+
+def test_upload_file_streams_and_hashes_only_unindexed_files(s3_client, bucket, tmp_path, monkeypatch):
+    data = b'a,b\n1,2\n'
+    filename = tmp_path / 'results.csv'
+    filename.write_bytes(data)
+    get_hash_index().clear()
+    inventory = Inventory(str(tmp_path / 'inventory.sqlite'))
+    # the file is hashed as it is uploaded, never read a second time for its hash
+    def hash_buffer(buffer):
+        raise AssertionError('file read again to hash it')
+    monkeypatch.setattr(F, 'hash_buffer', hash_buffer)
+
+    F.upload_file(s3_client, bucket, str(filename), 'results.csv', acl='private', verbose=False, inventory=inventory)
+    assert s3_client.objects['results.csv']['body'] == data
+    assert get_hash_index().get(str(filename)) == hashlib.sha256(data).hexdigest()
+
+    # the second upload takes the hash from the index
+    F.upload_file(s3_client, bucket, str(filename), 'copy.csv', acl='private', verbose=False, inventory=inventory)
+    assert s3_client.objects['copy.csv']['body'] == data
+    assert inventory.get('bucket', 'copy.csv')['sha256'] == hashlib.sha256(data).hexdigest()
+
+def test_upload_file_rewinds_the_file_on_retries(s3_client, bucket, tmp_path, monkeypatch):
+    filename = tmp_path / 'results.csv'
+    filename.write_bytes(b'x' * 100)
+    get_hash_index().clear()
+    put_object = s3_client.put_object
+    attempts = []
+    def flaky_put_object(Body, **kwargs):
+        attempts.append(Body)
+        if len(attempts) == 1:
+            Body.read(10)
+            raise ConnectionError('connection reset')
+        return put_object(Body=Body, **kwargs)
+    monkeypatch.setattr(s3_client, 'put_object', flaky_put_object)
+
+    F.upload_file(s3_client, bucket, str(filename), 'results.csv', acl='private', verbose=False, check_existing=False)
+    assert len(attempts) == 2 and not isinstance(attempts[0], bytes)
+    assert s3_client.objects['results.csv']['body'] == b'x' * 100
+    assert get_hash_index().get(str(filename)) == hashlib.sha256(b'x' * 100).hexdigest()
+
+def test_hashing_reader_hashes_each_byte_once_across_seeks():
+    data = bytes(range(256)) * 4
+    reader = HashingReader(io.BytesIO(data))
+    reader.read(100)
+    reader.seek(0)
+    assert reader.read(50) == data[:50] and reader.bytes_hashed == 100
+    reader.seek(500)
+    reader.read(10)
+    assert reader.bytes_hashed == 100
+    reader.seek(80)
+    assert reader.read() == data[80:]
+    assert reader.tell() == len(data) and reader.bytes_hashed == len(data)
+    assert reader.hexdigest() == hashlib.sha256(data).hexdigest()
+
+def test_uploads_use_the_shared_client_not_the_bucket_resource(s3_client, bucket, tmp_path, monkeypatch):
+    def Object(key):
+        raise AssertionError('boto3 resources are not thread-safe')
+    monkeypatch.setattr(bucket, 'Object', Object)
+    filename = tmp_path / 'results.csv'
+    filename.write_bytes(b'a,b\n')
+    F.upload_file(s3_client, bucket, str(filename), 'results.csv', acl='private', verbose=False)
+    F.upload_buffer(s3_client, bucket, io.BytesIO(b'{}'), 'results.json', acl='private', verbose=False)
+    assert sorted(s3_client.objects) == ['results.csv', 'results.json']
+
+def test_unavailable_hash_index_is_reported_on_stderr(monkeypatch, capsys):
+    def HashIndex():
+        raise OSError('read-only file system')
+    monkeypatch.setattr(hashindex, '_HASH_INDEX', None)
+    monkeypatch.setattr(hashindex, 'HashIndex', HashIndex)
+    assert hashindex.get_hash_index() is None
+    out, err = capsys.readouterr()
+    assert out == '' and 'Hash index unavailable' in err
+
+def test_upload_files_statuses_and_one_listing_per_subfolder(store, s3_client, tmp_path):
+    s3 = store()
+    names = ['same.csv', 'new.csv', 'model.bin', 'missing.csv', 'rejected.csv']
+    filenames = [str(tmp_path / name) for name in names]
+    for filename in filenames[:3] + filenames[4:]:
+        with open(filename, 'wb') as f:
+            f.write(os.path.basename(filename).encode() * 10)
+    existing_key = 'data/' + get_object_name_with_hash_id(filenames[0], hash_length=s3.hash_length)
+    s3_client.put_object(Bucket='bucket', Key=existing_key, Body=open(filenames[0], 'rb').read())
+    rejected_key = 'data/' + get_object_name_with_hash_id(filenames[4], hash_length=s3.hash_length)
+    s3_client.fail['put_object'] = lambda Key, **kwargs: client_error('AccessDenied', 403) if Key == rejected_key else None
+    s3_client.calls.clear()
+
+    results = s3.upload_files(filenames, ['data', 'data', 'models', 'data', 'data'], verbose=False)
+
+    assert [r.filename for r in results] == filenames
+    assert [r.status for r in results] == ['skipped', 'uploaded', 'uploaded', 'failed', 'failed']
+    assert results[0].key == existing_key and results[0].url is not None and results[0].bytes == 0
+    assert results[1].key in s3_client.objects and results[1].bytes == 70
+    assert results[2].key.startswith('models/model-') and results[2].key in s3_client.objects
+    assert isinstance(results[3].error, FileNotFoundError) and results[3].key is None
+    assert 'AccessDenied' in str(results[4].error) and results[4].key == rejected_key and results[4].url is None
+    assert rejected_key not in s3_client.objects
+    listings = sorted(kwargs['Prefix'] for op, kwargs in s3_client.calls if op == 'list_objects_v2')
+    assert listings == ['data/', 'models/']
+    # the listing decides: uploads do not check for an existing object one by one
+    assert s3_client.count('head_object') == 0